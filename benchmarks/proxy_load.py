@@ -0,0 +1,407 @@
+"""Measure the overhead of the proxy in both directions and write the results as JSON.
+
+Three topologies are measured, each directly and through the typed and raw engines:
+
+- in-memory: the proxy servers of the parity tests, connected with memory streams.
+- sse-server: `mcp-proxy --sse-port` spawning the stand-in server over stdio, as
+  `run_sse_server` does, with clients connecting over SSE.
+- sse-client: `mcp-proxy URL` connecting to the stand-in server served over SSE, as
+  `run_sse_client` does, with a client talking to it over stdio.
+
+For each, the latency of every method (p50 and p99, and their difference with the direct
+connection), the throughput under concurrent clients, the memory of every SSE session and
+the latency of large results are recorded. Results are written as a list of records, one per
+measure, so that runs can be compared to track regressions. Run with:
+
+    uv run python benchmarks/proxy_load.py --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import typing as t
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from importlib import metadata
+from pathlib import Path
+
+import anyio
+import httpx
+from anyio.abc import Process, TaskGroup, TaskStatus
+from mcp.client.session import ClientSession
+from mcp.client.sse import sse_client
+from mcp.client.stdio import StdioServerParameters, stdio_client
+from mcp.shared.memory import create_connected_server_and_client_session
+from pydantic import AnyUrl
+from relay_throughput import raw_session, typed_session
+from stand_in_server import RESOURCE_URI, create_server
+
+STAND_IN_SERVER = str(Path(__file__).with_name("stand_in_server.py"))
+ENGINES = ("direct", "typed", "raw")
+TOPOLOGIES = ("in-memory", "sse-server", "sse-client")
+
+SessionFactory = Callable[[], AbstractAsyncContextManager[ClientSession]]
+
+METHODS: dict[str, Callable[[ClientSession], Awaitable[object]]] = {
+    "tools/list": lambda session: session.list_tools(),
+    "tools/call": lambda session: session.call_tool("echo", {"text": "hello"}),
+    "prompts/get": lambda session: session.get_prompt("greet"),
+    "resources/read": lambda session: session.read_resource(AnyUrl(RESOURCE_URI)),
+}
+
+
+@dataclass
+class Record:
+    """One measure of a topology and engine."""
+
+    topology: str
+    engine: str
+    metric: str
+    value: float
+    unit: str
+    labels: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Settings:
+    """Amount of work of every measure."""
+
+    # Calls of every method to measure latencies
+    requests: int
+    # Concurrent clients, or concurrent calls of one client over stdio
+    clients: int
+    # Sizes of the large results in bytes
+    payload_sizes: list[int]
+
+
+def _percentile(values: list[float], percentile: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def _rss_bytes(pid: int) -> int | None:
+    """Return the resident memory of a process, on systems with /proc."""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        return None
+    for line in status.splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) * 1024
+    return None
+
+
+@asynccontextmanager
+async def _open(transport: AbstractAsyncContextManager[t.Any]) -> AsyncIterator[ClientSession]:
+    async with transport as streams, ClientSession(*streams) as session:
+        await session.initialize()
+        yield session
+
+
+@asynccontextmanager
+async def _in_memory(
+    session_factory: Callable[..., AbstractAsyncContextManager[ClientSession]],
+) -> AsyncIterator[ClientSession]:
+    async with session_factory(create_server()) as session:
+        yield session
+
+
+@asynccontextmanager
+async def _spawn(*args: str) -> AsyncIterator[Process]:
+    """Run a command serving over SSE until it is ready."""
+    url = f"http://127.0.0.1:{args[args.index('--sse-port') + 1]}/ready"
+    process = await anyio.open_process(
+        [sys.executable, *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        async with httpx.AsyncClient() as client:
+            with anyio.fail_after(30):
+                while True:
+                    try:
+                        if (await client.get(url)).status_code == httpx.codes.OK:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    await anyio.sleep(0.1)
+        yield process
+    finally:
+        process.terminate()
+        # Open SSE connections can hold up the graceful shutdown of the server
+        with anyio.move_on_after(5):
+            await process.wait()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+def _stdio(*args: str) -> SessionFactory:
+    # The proxy is run from the same environment as the benchmark
+    params = StdioServerParameters(command=sys.executable, args=list(args), env=dict(os.environ))
+    return lambda: _open(stdio_client(params))
+
+
+def _sse(url: str) -> SessionFactory:
+    return lambda: _open(sse_client(url))
+
+
+async def _measure_latencies(
+    session_factory: SessionFactory,
+    settings: Settings,
+) -> dict[str, list[float]]:
+    latencies: dict[str, list[float]] = {}
+    async with session_factory() as session:
+        for method, call in METHODS.items():
+            await call(session)
+            latencies[method] = []
+            for _ in range(settings.requests):
+                start = time.perf_counter()
+                await call(session)
+                latencies[method].append(time.perf_counter() - start)
+        for size in settings.payload_sizes:
+            latencies[f"payload {size}"] = []
+            for _ in range(max(1, settings.requests // 10)):
+                start = time.perf_counter()
+                await session.call_tool("payload", {"size": size})
+                latencies[f"payload {size}"].append(time.perf_counter() - start)
+    return latencies
+
+
+async def _measure_throughput(
+    session_factory: SessionFactory,
+    settings: Settings,
+    *,
+    shared_session: bool,
+) -> float:
+    """Return the tool calls answered per second to concurrent clients."""
+    calls = settings.requests * settings.clients
+
+    async def _run(session: ClientSession, count: int) -> None:
+        for _ in range(count):
+            await session.call_tool("echo", {"text": "hello"})
+
+    if shared_session:
+        async with session_factory() as session:
+            start = time.perf_counter()
+            async with anyio.create_task_group() as tg:
+                for _ in range(settings.clients):
+                    tg.start_soon(_run, session, settings.requests)
+            return calls / (time.perf_counter() - start)
+
+    async with anyio.create_task_group() as tg:
+        sessions = [await _enter(tg, session_factory) for _ in range(settings.clients)]
+        start = time.perf_counter()
+        async with anyio.create_task_group() as calls_tg:
+            for session in sessions:
+                calls_tg.start_soon(_run, session, settings.requests)
+        rate = calls / (time.perf_counter() - start)
+        tg.cancel_scope.cancel()
+    return rate
+
+
+async def _enter(tg: TaskGroup, session_factory: SessionFactory) -> ClientSession:
+    """Open a session in a task of its own, so that many can be held open at once."""
+
+    async def _hold(*, task_status: TaskStatus[ClientSession]) -> None:
+        async with session_factory() as session:
+            task_status.started(session)
+            await anyio.sleep_forever()
+
+    return t.cast("ClientSession", await tg.start(_hold))
+
+
+async def _measure_session_memory(
+    session_factory: SessionFactory,
+    process: Process,
+    settings: Settings,
+) -> float | None:
+    """Return the memory added to the proxy process by every open SSE session."""
+    before = _rss_bytes(process.pid)
+    async with anyio.create_task_group() as tg:
+        for _ in range(settings.clients):
+            session = await _enter(tg, session_factory)
+            await session.list_tools()
+        after = _rss_bytes(process.pid)
+        tg.cancel_scope.cancel()
+    if before is None or after is None:
+        return None
+    return (after - before) / settings.clients
+
+
+async def _measure_engine(
+    topology: str,
+    engine: str,
+    session_factory: SessionFactory,
+    settings: Settings,
+    process: Process | None = None,
+) -> list[Record]:
+    print(f"Measuring {topology} {engine}", file=sys.stderr)  # noqa: T201
+    latencies = await _measure_latencies(session_factory, settings)
+    records = [
+        Record(
+            topology,
+            engine,
+            f"latency_p{percentile}",
+            _percentile(values, percentile),
+            "seconds",
+            {"method": method},
+        )
+        for method, values in latencies.items()
+        for percentile in (50, 99)
+    ]
+    rate = await _measure_throughput(
+        session_factory,
+        settings,
+        shared_session=topology == "sse-client" and engine != "direct",
+    )
+    clients = {"clients": str(settings.clients)}
+    records.append(Record(topology, engine, "throughput", rate, "requests/s", clients))
+    if process is not None:
+        memory = await _measure_session_memory(session_factory, process, settings)
+        if memory is not None:
+            records.append(Record(topology, engine, "memory_per_session", memory, "bytes"))
+    return records
+
+
+async def _measure_topology(topology: str, engines: list[str], settings: Settings) -> list[Record]:
+    records: list[Record] = []
+    for engine in engines:
+        raw_relay = ["--raw-relay"] if engine == "raw" else []
+        if topology == "in-memory":
+            factory = {
+                "direct": create_connected_server_and_client_session,
+                "typed": typed_session,
+                "raw": raw_session,
+            }[engine]
+            records += await _measure_engine(
+                topology,
+                engine,
+                lambda factory=factory: _in_memory(factory),
+                settings,
+            )
+        elif topology == "sse-server" and engine == "direct":
+            records += await _measure_engine(topology, engine, _stdio(STAND_IN_SERVER), settings)
+        elif topology == "sse-server":
+            port = str(_free_port())
+            async with _spawn(
+                "-m",
+                "mcp_proxy",
+                "--sse-port",
+                port,
+                *raw_relay,
+                sys.executable,
+                STAND_IN_SERVER,
+            ) as process:
+                records += await _measure_engine(
+                    topology,
+                    engine,
+                    _sse(f"http://127.0.0.1:{port}/sse"),
+                    settings,
+                    process,
+                )
+        else:
+            port = str(_free_port())
+            url = f"http://127.0.0.1:{port}/sse"
+            async with _spawn(STAND_IN_SERVER, "--sse-port", port):
+                session_factory = (
+                    _sse(url) if engine == "direct" else _stdio("-m", "mcp_proxy", *raw_relay, url)
+                )
+                records += await _measure_engine(topology, engine, session_factory, settings)
+    return _with_added_latency(records)
+
+
+def _with_added_latency(records: list[Record]) -> list[Record]:
+    """Add the latency of every engine over the direct connection of the same topology."""
+    direct = {
+        (record.topology, record.metric, record.labels["method"]): record.value
+        for record in records
+        if record.engine == "direct" and record.metric.startswith("latency_")
+    }
+    added = [
+        Record(
+            record.topology,
+            record.engine,
+            f"added_{record.metric}",
+            record.value - direct[(record.topology, record.metric, record.labels["method"])],
+            record.unit,
+            record.labels,
+        )
+        for record in records
+        if record.engine != "direct"
+        and record.metric.startswith("latency_")
+        and (record.topology, record.metric, record.labels["method"]) in direct
+    ]
+    return records + added
+
+
+async def _main(args: argparse.Namespace) -> None:
+    settings = Settings(args.requests, args.clients, args.payload_sizes)
+    records: list[Record] = []
+    for topology in args.topologies:
+        records += await _measure_topology(topology, args.engines, settings)
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mcp": metadata.version("mcp"),
+            "mcp_proxy": metadata.version("mcp-proxy"),
+            "time": time.time(),
+        },
+        "settings": asdict(settings),
+        "results": [asdict(record) for record in records],
+    }
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        print(output)  # noqa: T201
+    else:
+        args.output.write_text(output + "\n")
+
+
+def _names(choices: tuple[str, ...]) -> Callable[[str], list[str]]:
+    def _parse(value: str) -> list[str]:
+        names = value.split(",")
+        if unknown := set(names) - set(choices):
+            msg = f"unknown names {', '.join(sorted(unknown))}, choose from {', '.join(choices)}"
+            raise argparse.ArgumentTypeError(msg)
+        return names
+
+    return _parse
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--topologies",
+        type=_names(TOPOLOGIES),
+        default=list(TOPOLOGIES),
+        help="Comma-separated topologies to measure. Default is all",
+    )
+    parser.add_argument(
+        "--engines",
+        type=_names(ENGINES),
+        default=list(ENGINES),
+        help="Comma-separated engines to measure, direct being the baseline. Default is all",
+    )
+    parser.add_argument("--requests", type=int, default=200, help="Calls of every method")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients")
+    parser.add_argument(
+        "--payload-sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[1024, 1024 * 1024],
+        help="Comma-separated sizes of the large results in bytes. Default is 1 KiB and 1 MiB",
+    )
+    parser.add_argument("--output", type=Path, default=None, help="File to write results to")
+    anyio.run(_main, parser.parse_args())
@@ -0,0 +1,93 @@
+"""Compare the throughput of the typed proxy server and of the raw JSON-RPC relay.
+
+Clients call a tool of an in-memory server directly, through `create_proxy_server`, and
+through `create_raw_proxy_server`, and the number of messages relayed per second is printed
+for each. Run with:
+
+    uv run python benchmarks/relay_throughput.py --requests 2000 --concurrency 8
+"""
+
+import argparse
+import time
+from collections.abc import AsyncIterator, Callable
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+
+import anyio
+from mcp.client.session import ClientSession
+from mcp.server import Server
+from mcp.shared.memory import (
+    create_client_server_memory_streams,
+    create_connected_server_and_client_session,
+)
+from stand_in_server import create_server
+
+from mcp_proxy.proxy_server import create_proxy_server
+from mcp_proxy.raw_proxy import create_raw_proxy_server
+
+SessionFactory = Callable[[Server[object]], AbstractAsyncContextManager[ClientSession]]
+
+
+@asynccontextmanager
+async def typed_session(server: Server[object]) -> AsyncIterator[ClientSession]:
+    """Open a session to the server through the typed proxy server."""
+    async with create_connected_server_and_client_session(server) as remote:
+        proxy = await create_proxy_server(remote)
+        async with create_connected_server_and_client_session(proxy) as session:
+            yield session
+
+
+@asynccontextmanager
+async def raw_session(server: Server[object]) -> AsyncIterator[ClientSession]:
+    """Open a session to the server through the raw JSON-RPC relay."""
+    async with (
+        create_client_server_memory_streams() as (client_streams, server_streams),
+        anyio.create_task_group() as tg,
+    ):
+        tg.start_soon(lambda: server.run(*server_streams, server.create_initialization_options()))
+        proxy = await create_raw_proxy_server(*client_streams)
+        tg.start_soon(proxy.handle_remote_messages)
+        async with create_connected_server_and_client_session(proxy) as session:
+            yield session
+        tg.cancel_scope.cancel()
+
+
+async def _measure(
+    session_factory: SessionFactory,
+    payload_bytes: int,
+    requests: int,
+    concurrency: int,
+) -> float:
+    """Return the number of tool calls answered per second."""
+    async with session_factory(create_server()) as session:
+        remaining = iter(range(requests))
+
+        async def _worker() -> None:
+            for _ in remaining:
+                await session.call_tool("payload", {"size": payload_bytes})
+
+        start = time.perf_counter()
+        async with anyio.create_task_group() as tg:
+            for _ in range(concurrency):
+                tg.start_soon(_worker)
+        return requests / (time.perf_counter() - start)
+
+
+async def _main(args: argparse.Namespace) -> None:
+    engines: dict[str, SessionFactory] = {
+        "direct": create_connected_server_and_client_session,
+        "typed": typed_session,
+        "raw": raw_session,
+    }
+    print(f"{'engine':<8} {'requests/s':>12} {'messages/s':>12}")  # noqa: T201
+    for name, session_factory in engines.items():
+        rate = await _measure(session_factory, args.payload_bytes, args.requests, args.concurrency)
+        # Every call is a request and a response on each side of the proxy
+        print(f"{name:<8} {rate:>12.0f} {rate * 2:>12.0f}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000, help="Tool calls per engine")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent tool calls")
+    parser.add_argument("--payload-bytes", type=int, default=64, help="Size of the results")
+    anyio.run(_main, parser.parse_args())
@@ -0,0 +1,80 @@
+"""A stand-in MCP server for the benchmarks, served over stdio or, with --sse-port, over SSE.
+
+It answers every method the proxy forwards without doing any work, so that the time measured
+through the proxy is the time spent by the proxy and the transports.
+"""
+
+import argparse
+import typing as t
+
+import anyio
+import uvicorn
+from mcp import types
+from mcp.server import Server
+from mcp.server.stdio import stdio_server
+from pydantic import AnyUrl
+
+from mcp_proxy.sse_server import create_starlette_app
+
+RESOURCE_URI = "bench://data"
+
+
+def create_server() -> Server[object]:
+    """Return a server with an echo tool, a payload tool, a prompt and a resource."""
+    server: Server[object] = Server("stand-in")
+
+    @server.list_tools()  # type: ignore[no-untyped-call,misc]
+    async def _() -> list[types.Tool]:
+        return [
+            types.Tool(name="echo", inputSchema={"type": "object"}),
+            types.Tool(name="payload", inputSchema={"type": "object"}),
+        ]
+
+    @server.call_tool()  # type: ignore[no-untyped-call,misc]
+    async def _(name: str, arguments: dict[str, t.Any]) -> list[types.TextContent]:
+        if name == "payload":
+            return [types.TextContent(type="text", text="x" * arguments["size"])]
+        return [types.TextContent(type="text", text=str(arguments.get("text", "")))]
+
+    @server.list_prompts()  # type: ignore[no-untyped-call,misc]
+    async def _() -> list[types.Prompt]:
+        return [types.Prompt(name="greet")]
+
+    @server.get_prompt()  # type: ignore[no-untyped-call,misc]
+    async def _(name: str, _: dict[str, str] | None) -> types.GetPromptResult:
+        return types.GetPromptResult(
+            messages=[
+                types.PromptMessage(role="user", content=types.TextContent(type="text", text=name)),
+            ],
+        )
+
+    @server.list_resources()  # type: ignore[no-untyped-call,misc]
+    async def _() -> list[types.Resource]:
+        return [types.Resource(uri=AnyUrl(RESOURCE_URI), name="data")]
+
+    @server.read_resource()  # type: ignore[no-untyped-call,misc]
+    async def _(_: AnyUrl) -> str:
+        return "data"
+
+    return server
+
+
+async def _serve(sse_port: int | None) -> None:
+    server = create_server()
+    if sse_port is None:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(read_stream, write_stream, server.create_initialization_options())
+        return
+    config = uvicorn.Config(
+        create_starlette_app(server),
+        host="127.0.0.1",
+        port=sse_port,
+        log_level="warning",
+    )
+    await uvicorn.Server(config).serve()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sse-port", type=int, default=None, help="Serve over SSE on a port")
+    anyio.run(_serve, parser.parse_args().sse_port)
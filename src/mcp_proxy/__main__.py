@@ -12,14 +12,29 @@ import logging
 import os
 import sys
 import typing as t
+from collections.abc import Callable
+from pathlib import Path
 
 from mcp.client.stdio import StdioServerParameters
 
-from .sse_client import run_sse_client
-from .sse_server import SseServerSettings, run_sse_server
+from .admission import AdmissionController
+from .cache import ResourceCache, ToolResultCache, TTLCache
+from .catalog import ListCatalog
+from .deadlines import Deadlines
+from .filters import load_tool_filter
+from .metrics import ProxyMetrics
+from .session_buffers import OVERFLOW_POLICIES, SessionBufferSettings
+from .single_flight import SingleFlight
+
+if t.TYPE_CHECKING:
+    from .backend_pool import BackendPoolSettings
+    from .proxy_server import ProxyOptions
+    from .session_backends import SessionBackendSettings
+    from .sse_server import SseServerSettings
 
 log_level = os.getenv("LOG_LEVEL", "WARNING").upper()
 logging.basicConfig(level=getattr(logging, log_level, logging.WARNING))
+logger = logging.getLogger(__name__)
 
 SSE_URL: t.Final[str | None] = os.getenv(
     "SSE_URL",
@@ -27,8 +42,522 @@ SSE_URL: t.Final[str | None] = os.getenv(
 )
 
 
-def main() -> None:
-    """Start the client using asyncio."""
+def _tool_limit(value: str) -> tuple[str, int]:
+    tool, _, limit = value.rpartition("=")
+    if not tool or not limit.isdigit():
+        msg = f"Expected TOOL=LIMIT, got {value!r}"
+        raise argparse.ArgumentTypeError(msg)
+    return tool, int(limit)
+
+
+def _add_sse_client_arguments(parser: argparse.ArgumentParser) -> None:
+    sse_client_group = parser.add_argument_group("SSE client options")
+    sse_client_group.add_argument(
+        "-H",
+        "--headers",
+        nargs=2,
+        action="append",
+        metavar=("KEY", "VALUE"),
+        help="Headers to pass to the SSE server. Can be used multiple times.",
+        default=[],
+    )
+    sse_client_group.add_argument(
+        "--upstream-sessions",
+        type=int,
+        default=1,
+        help="Number of parallel sessions to balance requests over. Default is 1",
+    )
+    sse_client_group.add_argument(
+        "--reconnect-delay",
+        type=float,
+        default=1.0,
+        help=(
+            "Seconds before reconnecting a lost session, doubled after each failed attempt. "
+            "Default is 1"
+        ),
+    )
+    sse_client_group.add_argument(
+        "--max-reconnect-delay",
+        type=float,
+        default=30.0,
+        help="Maximum seconds between attempts to reconnect a lost session. Default is 30",
+    )
+
+
+def _add_sse_server_arguments(parser: argparse.ArgumentParser) -> None:
+    sse_server_group = parser.add_argument_group("SSE server options")
+    sse_server_group.add_argument(
+        "--sse-port",
+        type=int,
+        default=0,
+        help="Port to expose an SSE server on. Default is a random port",
+    )
+    sse_server_group.add_argument(
+        "--sse-host",
+        default="127.0.0.1",
+        help="Host to expose an SSE server on. Default is 127.0.0.1",
+    )
+    sse_server_group.add_argument(
+        "--allow-origin",
+        nargs="+",
+        default=[],
+        help="Allowed origins for the SSE server. Can be used multiple times. Default is no CORS allowed.",  # noqa: E501
+    )
+    sse_server_group.add_argument(
+        "--metrics",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Expose Prometheus metrics of the proxy at /metrics.",
+    )
+    sse_server_group.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes serving on the SSE port, each with its own stdio servers. "
+        "Default is 1",
+    )
+    sse_server_group.add_argument(
+        "--compress",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "Compress responses and event streams with zstd, gzip or deflate for clients "
+            "accepting it, and accept compressed request bodies."
+        ),
+    )
+    sse_server_group.add_argument(
+        "--compress-min-size",
+        type=int,
+        default=1024,
+        help="Size in bytes of the smallest response compressed. Default is 1024",
+    )
+    sse_server_group.add_argument(
+        "--sse-buffer-size",
+        type=int,
+        default=None,
+        help=(
+            "Bytes of messages held for an SSE session whose client reads them slower than "
+            "they are sent. Sessions are only buffered when one of the --sse-buffer-size, "
+            "--sse-overflow, --sse-heartbeat and --sse-idle-timeout options is set, with "
+            "4 MiB by default"
+        ),
+    )
+    sse_server_group.add_argument(
+        "--sse-overflow",
+        choices=OVERFLOW_POLICIES,
+        default=None,
+        help=(
+            "What happens to a message for an SSE session whose buffer is full: block waits "
+            "for room, drop drops notifications, disconnect closes the session. Default is block"
+        ),
+    )
+    sse_server_group.add_argument(
+        "--sse-heartbeat",
+        type=float,
+        default=None,
+        help="Seconds between pings of the clients of SSE sessions. Default is no pings",
+    )
+    sse_server_group.add_argument(
+        "--sse-idle-timeout",
+        type=float,
+        default=None,
+        help=(
+            "Seconds without messages from the client of an SSE session before it is closed. "
+            "Default is never"
+        ),
+    )
+
+
+def _named_seconds(metavar: str) -> Callable[[str], tuple[str, float]]:
+    def _parse(value: str) -> tuple[str, float]:
+        name, _, text = value.rpartition("=")
+        try:
+            seconds = float(text)
+        except ValueError:
+            seconds = None
+        if not name or seconds is None:
+            msg = f"Expected {metavar}=SECONDS, got {value!r}"
+            raise argparse.ArgumentTypeError(msg)
+        return name, seconds
+
+    return _parse
+
+
+def _add_proxy_arguments(parser: argparse.ArgumentParser) -> None:
+    proxy_group = parser.add_argument_group("proxy options")
+    proxy_group.add_argument(
+        "--list-cache-ttl",
+        type=float,
+        default=None,
+        help=(
+            "Seconds to cache the results of listing tools, prompts and resources. "
+            "Default is no caching"
+        ),
+    )
+    proxy_group.add_argument(
+        "--list-cache-size",
+        type=int,
+        default=128,
+        help="Maximum number of cached list results. Default is 128",
+    )
+    proxy_group.add_argument(
+        "--tool-filter",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help=(
+            "JSON file of rules allowing and denying tools by name, glob pattern or tag, for "
+            "every client or for the client named by a header. Hidden tools are left out of "
+            "lists and their calls are rejected."
+        ),
+    )
+    proxy_group.add_argument(
+        "--prefetch-lists",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "Fetch every page of the lists of tools, prompts and resources in the background, "
+            "and serve them without a round trip until they change."
+        ),
+    )
+    proxy_group.add_argument(
+        "--list-page-size",
+        type=int,
+        default=100,
+        help="Number of items in the pages of prefetched lists. Default is 100",
+    )
+    proxy_group.add_argument(
+        "--tool-cache",
+        action="append",
+        metavar="TOOL",
+        default=[],
+        help=(
+            "Name or glob pattern of a read-only tool whose results are cached. "
+            "Can be used multiple times."
+        ),
+    )
+    proxy_group.add_argument(
+        "--tool-cache-ttl",
+        type=float,
+        default=None,
+        help="Seconds to cache tool results. Default is until evicted",
+    )
+    proxy_group.add_argument(
+        "--tool-cache-max-bytes",
+        type=int,
+        default=16 * 1024 * 1024,
+        help="Memory budget for cached tool results in bytes. Default is 16 MiB",
+    )
+    proxy_group.add_argument(
+        "--tool-cache-dir",
+        type=Path,
+        default=None,
+        help="Directory to also store cached tool results in. Default is memory only",
+    )
+    proxy_group.add_argument(
+        "--tool-cache-dir-max-bytes",
+        type=int,
+        default=256 * 1024 * 1024,
+        help=(
+            "Disk budget for the cached tool results of --tool-cache-dir in bytes, beyond which "
+            "the least recently used are removed. Default is 256 MiB"
+        ),
+    )
+    proxy_group.add_argument(
+        "--resource-cache",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "Cache the contents of resources until the server reports them updated or their "
+            "TTL expires."
+        ),
+    )
+    proxy_group.add_argument(
+        "--resource-cache-ttl",
+        action="append",
+        type=_named_seconds("SCHEME"),
+        metavar="SCHEME=SECONDS",
+        default=[],
+        help=(
+            "Seconds to cache the contents of resources with a URI scheme, or * for any "
+            "scheme. Can be used multiple times. Default is until updated for the resources "
+            "clients subscribed to, and 60 seconds for the others"
+        ),
+    )
+    proxy_group.add_argument(
+        "--resource-cache-max-bytes",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="Memory budget for cached resource contents in bytes. Default is 64 MiB",
+    )
+    proxy_group.add_argument(
+        "--passthrough",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "Relay tool results and resource contents without validating them, which is "
+            "faster for large results. Cached tool results are still validated."
+        ),
+    )
+    proxy_group.add_argument(
+        "--raw-relay",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "Relay JSON-RPC messages to a single server without decoding them, rewriting only "
+            "request IDs. Only the caches, deadlines and metrics apply."
+        ),
+    )
+    proxy_group.add_argument(
+        "--coalesce-requests",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "Share one call to the server among identical concurrent requests to list, "
+            "get prompts and read resources."
+        ),
+    )
+    proxy_group.add_argument(
+        "--max-concurrent-requests",
+        type=int,
+        default=None,
+        help="Maximum number of requests sent to the server at once. Default is no limit",
+    )
+    proxy_group.add_argument(
+        "--tool-concurrency",
+        action="append",
+        type=_tool_limit,
+        metavar="TOOL=LIMIT",
+        default=[],
+        help=(
+            "Maximum number of concurrent calls of a tool, by name or glob pattern. "
+            "Can be used multiple times."
+        ),
+    )
+    proxy_group.add_argument(
+        "--max-queued-requests",
+        type=int,
+        default=100,
+        help="Number of requests waiting for a slot before new ones are rejected. Default is 100",
+    )
+    proxy_group.add_argument(
+        "--queue-timeout",
+        type=float,
+        default=30.0,
+        help="Seconds a request waits for a slot before it is rejected. Default is 30",
+    )
+    proxy_group.add_argument(
+        "--request-timeout",
+        type=float,
+        default=None,
+        help=(
+            "Seconds the server is given to answer a request before it is cancelled. "
+            "Default is no limit"
+        ),
+    )
+    proxy_group.add_argument(
+        "--method-timeout",
+        action="append",
+        type=_named_seconds("METHOD"),
+        metavar="METHOD=SECONDS",
+        default=[],
+        help=(
+            "Seconds given to the requests of a method, such as tools/call. Can be used "
+            "multiple times."
+        ),
+    )
+    proxy_group.add_argument(
+        "--tool-timeout",
+        action="append",
+        type=_named_seconds("TOOL"),
+        metavar="TOOL=SECONDS",
+        default=[],
+        help=(
+            "Seconds given to the calls of a tool, by name or glob pattern. Can be used "
+            "multiple times."
+        ),
+    )
+    proxy_group.add_argument(
+        "--cancel-upstream",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "Cancel the requests abandoned by their client on the server, such as when the "
+            "client disconnects. Requests past their timeout are always cancelled. Servers "
+            "built on mcp 1.5 end their session when a request is cancelled."
+        ),
+    )
+    proxy_group.add_argument(
+        "--record",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help=(
+            "Append every request, with its timing and result, to a file of JSON lines, to "
+            "replay them with mcp-proxy replay."
+        ),
+    )
+    proxy_group.add_argument(
+        "--record-redact",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "Replace the strings of recorded params and results with asterisks of the same "
+            "length, keeping the names of tools and prompts and the URIs of resources."
+        ),
+    )
+    proxy_group.add_argument(
+        "--record-max-result-bytes",
+        type=int,
+        default=1024 * 1024,
+        metavar="BYTES",
+        help=(
+            "Bytes of the largest result written in a record. Larger results are left out, "
+            "keeping their size. Default is 1 MiB"
+        ),
+    )
+
+
+def _create_proxy_options(args: argparse.Namespace) -> "ProxyOptions":  # noqa: C901
+    # The servers and their backends are only imported once the arguments are parsed
+    from .proxy_server import ProxyOptions  # noqa: PLC0415
+    from .recording import Recorder  # noqa: PLC0415
+
+    proxy_options = ProxyOptions(
+        passthrough=args.passthrough,
+        raw_relay=args.raw_relay,
+        cancel_upstream=args.cancel_upstream,
+    )
+    if args.list_cache_ttl is not None:
+        proxy_options.list_cache = TTLCache(args.list_cache_ttl, args.list_cache_size)
+    if args.tool_filter is not None:
+        proxy_options.tool_filter = load_tool_filter(args.tool_filter)
+    if args.prefetch_lists:
+        proxy_options.list_catalog = ListCatalog(args.list_page_size)
+    if args.metrics:
+        proxy_options.metrics = ProxyMetrics()
+    if args.coalesce_requests:
+        proxy_options.single_flight = SingleFlight()
+    if args.tool_cache:
+        proxy_options.tool_cache = ToolResultCache(
+            args.tool_cache,
+            ttl=args.tool_cache_ttl,
+            max_bytes=args.tool_cache_max_bytes,
+            directory=args.tool_cache_dir,
+            max_disk_bytes=args.tool_cache_dir_max_bytes,
+        )
+    if args.resource_cache:
+        proxy_options.resource_cache = ResourceCache(
+            args.resource_cache_max_bytes,
+            dict(args.resource_cache_ttl),
+        )
+    if args.max_concurrent_requests is not None or args.tool_concurrency:
+        proxy_options.admission = AdmissionController(
+            args.max_concurrent_requests,
+            dict(args.tool_concurrency),
+            max_queued=args.max_queued_requests,
+            queue_timeout=args.queue_timeout,
+        )
+    if args.request_timeout is not None or args.method_timeout or args.tool_timeout:
+        proxy_options.deadlines = Deadlines(
+            args.request_timeout,
+            dict(args.method_timeout),
+            dict(args.tool_timeout),
+        )
+    if args.record is not None:
+        proxy_options.recorder = Recorder(
+            args.record,
+            redact=args.record_redact,
+            max_result_bytes=args.record_max_result_bytes,
+        )
+    return proxy_options
+
+
+def _check_raw_relay(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    # Messages are relayed raw over a single connection, without the request handlers
+    unsupported = {
+        "--config": args.config is not None,
+        "--upstream-sessions": args.upstream_sessions > 1,
+        "--backend-pool-size, --standby-backends or --health-check-interval": (
+            _create_pool_settings(args) is not None
+        ),
+        "--session-mode per-connection": args.session_mode == "per-connection",
+        "--coalesce-requests": args.coalesce_requests,
+        "--prefetch-lists": args.prefetch_lists,
+        "--tool-filter": args.tool_filter is not None,
+        "--max-concurrent-requests": args.max_concurrent_requests is not None,
+        "--tool-concurrency": bool(args.tool_concurrency),
+        "--record": args.record is not None,
+    }
+    for option, used in unsupported.items():
+        if used:
+            parser.error(f"{option} cannot be used with --raw-relay")
+
+
+def _create_sse_settings(args: argparse.Namespace) -> "SseServerSettings":
+    # The HTTP server is only imported when serving over HTTP, to start the client faster
+    from .sse_server import SseServerSettings  # noqa: PLC0415
+
+    return SseServerSettings(
+        bind_host=args.sse_host,
+        port=args.sse_port,
+        allow_origins=args.allow_origin if len(args.allow_origin) > 0 else None,
+        workers=args.workers,
+        compress_min_size=args.compress_min_size if args.compress else None,
+        session_buffers=_create_session_buffer_settings(args),
+    )
+
+
+def _create_session_buffer_settings(args: argparse.Namespace) -> SessionBufferSettings | None:
+    options = (args.sse_buffer_size, args.sse_overflow, args.sse_heartbeat, args.sse_idle_timeout)
+    if all(option is None for option in options):
+        return None
+    settings = SessionBufferSettings(
+        heartbeat_interval=args.sse_heartbeat,
+        idle_timeout=args.sse_idle_timeout,
+    )
+    if args.sse_buffer_size is not None:
+        settings.max_bytes = args.sse_buffer_size
+    if args.sse_overflow is not None:
+        settings.overflow = args.sse_overflow
+    return settings
+
+
+def _create_pool_settings(args: argparse.Namespace) -> "BackendPoolSettings | None":
+    from .backend_pool import BackendPoolSettings  # noqa: PLC0415
+
+    pool_max_size = args.backend_pool_max_size or args.backend_pool_size
+    if pool_max_size <= 1 and not args.standby_backends and args.health_check_interval is None:
+        return None
+    return BackendPoolSettings(
+        min_size=args.backend_pool_size,
+        max_size=pool_max_size,
+        idle_timeout=args.backend_idle_timeout,
+        standby_size=args.standby_backends,
+        health_check_interval=args.health_check_interval,
+    )
+
+
+def _create_session_settings(args: argparse.Namespace) -> "SessionBackendSettings | None":
+    if args.session_mode != "per-connection":
+        return None
+    from .session_backends import SessionBackendSettings  # noqa: PLC0415
+
+    return SessionBackendSettings(
+        max_backends=args.max_backends,
+        idle_timeout=args.session_idle_timeout,
+        warm_size=args.warm_backends,
+    )
+
+
+def main() -> None:  # noqa: PLR0915
+    """Start the client using asyncio, or replay recorded requests with `mcp-proxy replay`."""
+    if sys.argv[1:2] == ["replay"]:
+        from .replay import main as replay  # noqa: PLC0415
+
+        replay(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
         description=(
             "Start the MCP proxy in one of two possible modes: as an SSE or stdio client."
@@ -40,6 +569,10 @@ def main() -> None:
             "  mcp-proxy --sse-port 8080 -- your-command --arg1 value1 --arg2 value2\n"
             "  mcp-proxy your-command --sse-port 8080 -e KEY VALUE -e ANOTHER_KEY ANOTHER_VALUE\n"
             "  mcp-proxy your-command --sse-port 8080 --allow-origin='*'\n"
+            "  mcp-proxy your-command --sse-port 8080 --backend-pool-size 4\n"
+            "  mcp-proxy your-command --sse-port 8080 --session-mode per-connection\n"
+            "  mcp-proxy --config servers.json --sse-port 8080\n"
+            "  mcp-proxy replay requests.jsonl --speed 2 -- your-command --arg1 value1\n"
         ),
         formatter_class=argparse.RawTextHelpFormatter,
     )
@@ -53,18 +586,19 @@ def main() -> None:
         nargs="?",  # Required below to allow for coming form env var
         default=SSE_URL,
     )
-
-    sse_client_group = parser.add_argument_group("SSE client options")
-    sse_client_group.add_argument(
-        "-H",
-        "--headers",
-        nargs=2,
-        action="append",
-        metavar=("KEY", "VALUE"),
-        help="Headers to pass to the SSE server. Can be used multiple times.",
-        default=[],
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=None,
+        help=(
+            "JSON file listing the stdio commands and SSE URLs of many servers under "
+            "mcpServers, to expose as a single SSE server. Their tools and prompts are "
+            "prefixed with the name of their server, as in fetch__fetch"
+        ),
     )
 
+    _add_sse_client_arguments(parser)
+
     stdio_client_options = parser.add_argument_group("stdio client options")
     stdio_client_options.add_argument(
         "args",
@@ -86,47 +620,131 @@ def main() -> None:
         help="Pass through all environment variables when spawning the server.",
         default=False,
     )
-
-    sse_server_group = parser.add_argument_group("SSE server options")
-    sse_server_group.add_argument(
-        "--sse-port",
+    stdio_client_options.add_argument(
+        "--backend-pool-size",
+        type=int,
+        default=1,
+        help="Number of copies of the server to spawn and balance requests over. Default is 1",
+    )
+    stdio_client_options.add_argument(
+        "--backend-pool-max-size",
+        type=int,
+        default=None,
+        help=(
+            "Maximum number of copies of the server to scale up to under load. "
+            "Default is the pool size"
+        ),
+    )
+    stdio_client_options.add_argument(
+        "--backend-idle-timeout",
+        type=float,
+        default=60.0,
+        help="Seconds before an idle copy above the pool size is stopped. Default is 60",
+    )
+    stdio_client_options.add_argument(
+        "--standby-backends",
         type=int,
         default=0,
-        help="Port to expose an SSE server on. Default is a random port",
+        help=(
+            "Number of initialized copies of the server kept ready to replace a copy that "
+            "crashes. Default is 0"
+        ),
     )
-    sse_server_group.add_argument(
-        "--sse-host",
-        default="127.0.0.1",
-        help="Host to expose an SSE server on. Default is 127.0.0.1",
+    stdio_client_options.add_argument(
+        "--health-check-interval",
+        type=float,
+        default=None,
+        help=(
+            "Seconds between pings of the server. Copies not answering within 5 seconds "
+            "are replaced. Default is no health checks"
+        ),
     )
-    sse_server_group.add_argument(
-        "--allow-origin",
-        nargs="+",
-        default=[],
-        help="Allowed origins for the SSE server. Can be used multiple times. Default is no CORS allowed.",  # noqa: E501
+    stdio_client_options.add_argument(
+        "--session-mode",
+        choices=["shared", "per-connection"],
+        default="shared",
+        help=(
+            "Whether all sessions share the server, or every session gets a dedicated copy "
+            "spawned when it connects. Default is shared"
+        ),
+    )
+    stdio_client_options.add_argument(
+        "--max-backends",
+        type=int,
+        default=16,
+        help="Maximum number of copies of the server in per-connection mode. Default is 16",
+    )
+    stdio_client_options.add_argument(
+        "--warm-backends",
+        type=int,
+        default=1,
+        help=(
+            "Number of copies of the server kept ready for new sessions in per-connection "
+            "mode. Default is 1"
+        ),
+    )
+    stdio_client_options.add_argument(
+        "--session-idle-timeout",
+        type=float,
+        default=600.0,
+        help=(
+            "Seconds without requests before a session is closed in per-connection mode. "
+            "Default is 600"
+        ),
     )
 
+    _add_sse_server_arguments(parser)
+    _add_proxy_arguments(parser)
+
     args = parser.parse_args()
 
-    if not args.command_or_url:
+    if not args.command_or_url and not args.config:
         parser.print_help()
         sys.exit(1)
 
+    if args.raw_relay:
+        _check_raw_relay(parser, args)
+    if args.config and args.record is not None:
+        parser.error("--record cannot be used with --config")
+    proxy_options = _create_proxy_options(args)
+
+    if args.config:
+        # Start clients connected to every configured server, and expose as one SSE server
+        logger.debug("Starting clients of %s and SSE server", args.config)
+        from .aggregate import load_backends_config  # noqa: PLC0415
+        from .sse_server import run_aggregate_sse_server  # noqa: PLC0415
+
+        backends = load_backends_config(args.config)
+        asyncio.run(run_aggregate_sse_server(backends, _create_sse_settings(args), proxy_options))
+        return
+
     if (
         SSE_URL
         or args.command_or_url.startswith("http://")
         or args.command_or_url.startswith("https://")
     ):
         # Start a client connected to the SSE server, and expose as a stdio server
-        logging.debug("Starting SSE client and stdio server")
+        logger.debug("Starting SSE client and stdio server")
+        from .backend_pool import BackendPoolSettings  # noqa: PLC0415
+        from .sse_client import run_sse_client  # noqa: PLC0415
+
         headers = dict(args.headers)
         if api_access_token := os.getenv("API_ACCESS_TOKEN", None):
             headers["Authorization"] = f"Bearer {api_access_token}"
-        asyncio.run(run_sse_client(args.command_or_url, headers=headers))
+        upstream_settings = BackendPoolSettings(
+            min_size=args.upstream_sessions,
+            max_size=args.upstream_sessions,
+            reconnect_delay=args.reconnect_delay,
+            max_reconnect_delay=args.max_reconnect_delay,
+        )
+        asyncio.run(
+            run_sse_client(args.command_or_url, headers, proxy_options, upstream_settings),
+        )
         return
 
     # Start a client connected to the given command, and expose as an SSE server
-    logging.debug("Starting stdio client and SSE server")
+    logger.debug("Starting stdio client and SSE server")
+    from .sse_server import run_sse_server  # noqa: PLC0415
 
     # The environment variables passed to the server process
     env: dict[str, str] = {}
@@ -141,12 +759,15 @@ def main() -> None:
         args=args.args,
         env=env,
     )
-    sse_settings = SseServerSettings(
-        bind_host=args.sse_host,
-        port=args.sse_port,
-        allow_origins=args.allow_origin if len(args.allow_origin) > 0 else None,
+    asyncio.run(
+        run_sse_server(
+            stdio_params,
+            _create_sse_settings(args),
+            _create_pool_settings(args),
+            proxy_options,
+            _create_session_settings(args),
+        ),
     )
-    asyncio.run(run_sse_server(stdio_params, sse_settings))
 
 
 if __name__ == "__main__":
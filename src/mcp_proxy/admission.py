@@ -0,0 +1,151 @@
+"""Limit the number of concurrent calls to the remote app.
+
+Calls beyond the limits wait in a bounded queue, where cheap requests such as listing or
+reading go ahead of tool calls, and are rejected when the queue is full or when they
+waited too long.
+"""
+
+import fnmatch
+import heapq
+import itertools
+import time
+from collections.abc import AsyncIterator, Mapping
+from contextlib import AsyncExitStack, asynccontextmanager
+
+import anyio
+
+# Priority of the requests of each method, lower first. Unlisted methods come first.
+METHOD_PRIORITIES: dict[str, int] = {"tools/call": 1}
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a call is rejected because the queue is full or its wait timed out."""
+
+
+class _PrioritySemaphore:
+    """A semaphore that hands released slots to the waiter with the lowest priority value."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.in_use = 0
+        self._waiters: list[tuple[int, int, anyio.Event]] = []
+        self._order = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def saturated(self) -> bool:
+        return self.in_use >= self.limit or bool(self._waiters)
+
+    async def acquire(self, priority: int) -> None:
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            return
+        entry = (priority, next(self._order), anyio.Event())
+        heapq.heappush(self._waiters, entry)
+        try:
+            await entry[2].wait()
+        except BaseException:
+            if entry[2].is_set():
+                # The slot was handed over just before the wait was cancelled
+                self.release()
+            else:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def release(self) -> None:
+        if self._waiters:
+            # The slot goes to the next waiter without being released
+            _, _, event = heapq.heappop(self._waiters)
+            event.set()
+        else:
+            self.in_use -= 1
+
+
+class AdmissionController:
+    """Admit calls to the remote app within global and per tool concurrency limits."""
+
+    def __init__(
+        self,
+        max_concurrent: int | None = None,
+        tool_limits: Mapping[str, int] | None = None,
+        max_queued: int = 100,
+        queue_timeout: float = 30.0,
+    ) -> None:
+        """Create a controller with no calls in flight.
+
+        Args:
+            max_concurrent: Number of calls in flight at once. Unlimited when None.
+            tool_limits: Number of calls in flight at once of each tool, by name or glob
+                pattern. The first matching pattern applies.
+            max_queued: Number of calls waiting for a slot before new calls are rejected.
+            queue_timeout: Seconds a call waits for a slot before it is rejected.
+
+        """
+        limits = [max_concurrent, *(tool_limits or {}).values()]
+        if any(limit is not None and limit < 1 for limit in limits):
+            raise ValueError("Concurrency limits must be at least 1")
+        self.tool_limits = dict(tool_limits or {})
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._global = _PrioritySemaphore(max_concurrent) if max_concurrent else None
+        self._tools: dict[str, _PrioritySemaphore] = {}
+
+    @property
+    def waiting(self) -> int:
+        """Return the number of calls waiting for a slot."""
+        semaphores = [self._global, *self._tools.values()]
+        return sum(semaphore.waiting for semaphore in semaphores if semaphore is not None)
+
+    def _tool_semaphore(self, tool: str) -> _PrioritySemaphore | None:
+        if tool in self._tools:
+            return self._tools[tool]
+        for pattern, limit in self.tool_limits.items():
+            if fnmatch.fnmatchcase(tool, pattern):
+                return self._tools.setdefault(tool, _PrioritySemaphore(limit))
+        return None
+
+    @asynccontextmanager
+    async def admit(self, method: str, tool: str = "") -> AsyncIterator[float]:
+        """Wait for a slot for a call, yielding the seconds waited.
+
+        Raises:
+            AdmissionRejectedError: The queue is full or the wait timed out.
+
+        """
+        semaphores = [self._tool_semaphore(tool) if tool else None, self._global]
+        priority = METHOD_PRIORITIES.get(method, 0)
+        start = time.perf_counter()
+        async with AsyncExitStack() as stack:
+            with anyio.move_on_after(self.queue_timeout) as scope:
+                # Take the tool slot first so that no global slot is held while waiting
+                for semaphore in semaphores:
+                    if semaphore is None:
+                        continue
+                    if semaphore.saturated and self.waiting >= self.max_queued:
+                        self.rejected += 1
+                        msg = f"Too many queued requests, rejecting {method} {tool}".rstrip()
+                        raise AdmissionRejectedError(msg)
+                    await semaphore.acquire(priority)
+                    stack.callback(semaphore.release)
+            if scope.cancelled_caught:
+                self.timed_out += 1
+                msg = f"Timed out after {self.queue_timeout}s waiting to run {method} {tool}"
+                raise AdmissionRejectedError(msg.rstrip())
+            self.admitted += 1
+            yield time.perf_counter() - start
+
+    def stats(self) -> dict[str, int]:
+        """Return the counters of the controller."""
+        return {
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
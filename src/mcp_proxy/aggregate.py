@@ -0,0 +1,347 @@
+"""Serve many MCP backends as a single MCP server.
+
+The tools and prompts of every backend are exposed under names prefixed with the name of
+the backend, and requests are routed to the backend owning the tool, prompt or resource.
+Backends are stdio commands or SSE URLs, read from a configuration file in the format used
+by MCP clients:
+
+    {
+        "mcpServers": {
+            "fetch": {"command": "uvx", "args": ["mcp-server-fetch"]},
+            "remote": {"url": "http://localhost:8080/sse", "headers": {"Authorization": "..."}}
+        }
+    }
+"""
+
+import dataclasses
+import json
+import logging
+import typing as t
+from collections.abc import AsyncIterator, Awaitable, Callable, Mapping
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+
+import anyio
+from anyio.abc import TaskStatus
+from mcp import types
+from mcp.client.session import ClientSession
+from mcp.client.sse import sse_client
+from mcp.client.stdio import StdioServerParameters, stdio_client
+from mcp.server import Server
+from mcp.shared.exceptions import McpError
+
+from .catalog import LISTS
+from .metrics import ProxyMetrics, sum_stats
+from .proxy_server import (
+    PER_BACKEND_COMPONENTS,
+    ProxyOptions,
+    ProxyServer,
+    create_proxy_server,
+)
+from .relay import CURSOR_BESIDE_PARAMS, RelayServer
+
+logger = logging.getLogger(__name__)
+
+T = t.TypeVar("T")
+
+DEFAULT_SEPARATOR = "__"
+
+
+@dataclass
+class SseServerParameters:
+    """Parameters to connect to a backend over SSE."""
+
+    url: str
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+BackendParameters = StdioServerParameters | SseServerParameters
+
+
+def load_backends_config(path: Path) -> dict[str, BackendParameters]:
+    """Read the backends from a configuration file, by name."""
+    config = json.loads(path.read_text())
+    backends: dict[str, BackendParameters] = {}
+    for name, entry in config["mcpServers"].items():
+        if "url" in entry:
+            backends[name] = SseServerParameters(entry["url"], entry.get("headers", {}))
+        else:
+            backends[name] = StdioServerParameters.model_validate(entry)
+    return backends
+
+
+@asynccontextmanager
+async def _open_session(params: BackendParameters) -> AsyncIterator[ClientSession]:
+    transport = (
+        sse_client(params.url, params.headers)
+        if isinstance(params, SseServerParameters)
+        else stdio_client(params)
+    )
+    async with transport as streams, ClientSession(*streams) as session:
+        yield session
+
+
+def _page_request(request: t.Any, cursor: str) -> t.Any:  # noqa: ANN401
+    """Return a list request for the page of a backend starting at its cursor."""
+    page = {"cursor": cursor} if CURSOR_BESIDE_PARAMS else {"params": {"cursor": cursor}}
+    return type(request).model_validate({"method": request.method, **page})
+
+
+def _backend_options(options: ProxyOptions, name: str) -> ProxyOptions:
+    """Return options whose caches are not shared with the other backends."""
+    tool_cache_dir = options.tool_cache.directory if options.tool_cache is not None else None
+    return dataclasses.replace(
+        options.with_own_caches(tool_cache_dir / name if tool_cache_dir else None),
+        # The lists of every backend are gathered in a single page
+        list_catalog=None,
+        # Records would name tools without the prefix of their backend, and not replay
+        recorder=None,
+    )
+
+
+async def _run_backend(
+    name: str,
+    params: BackendParameters,
+    options: ProxyOptions,
+    *,
+    task_status: TaskStatus[ProxyServer],
+) -> None:
+    async with _open_session(params) as session:
+        app = await create_proxy_server(session, options)
+        logger.info("Backend %s connected", name)
+        task_status.started(app)
+        await app.handle_remote_messages()
+        logger.warning("Backend %s connection lost", name)
+
+
+def _register_collectors(metrics: ProxyMetrics, backend_options: list[ProxyOptions]) -> None:
+    """Export the counters of the caches of every backend summed, in place of the last one's."""
+
+    def _collect(name: str) -> dict[str, float]:
+        components = (getattr(options, name) for options in backend_options)
+        return sum_stats(component.stats() for component in components if component is not None)
+
+    for name in PER_BACKEND_COMPONENTS:
+        if any(getattr(options, name) is not None for options in backend_options):
+            metrics.register_collector(name, partial(_collect, name))
+
+
+@asynccontextmanager
+async def connect_backends(
+    backends: Mapping[str, BackendParameters],
+    proxy_options: ProxyOptions | None = None,
+) -> AsyncIterator[dict[str, ProxyServer]]:
+    """Connect to every backend concurrently, yielding their proxy servers by name.
+
+    Backends failing to connect are logged and left out.
+    """
+    options = proxy_options or ProxyOptions()
+    backend_options = {name: _backend_options(options, name) for name in backends}
+    servers: dict[str, ProxyServer] = {}
+    async with anyio.create_task_group() as tg:
+
+        async def _connect(name: str, params: BackendParameters) -> None:
+            try:
+                servers[name] = await tg.start(
+                    _run_backend,
+                    name,
+                    params,
+                    backend_options[name],
+                )
+            except Exception:
+                logger.exception("Failed to connect to backend %s", name)
+
+        async with anyio.create_task_group() as connecting:
+            for name, params in backends.items():
+                connecting.start_soon(_connect, name, params)
+        if options.metrics is not None:
+            _register_collectors(options.metrics, [backend_options[name] for name in servers])
+        yield {name: servers[name] for name in backends if name in servers}
+        tg.cancel_scope.cancel()
+
+
+class AggregateServer(RelayServer):
+    """A server exposing the tools, prompts and resources of many backends."""
+
+    def __init__(
+        self,
+        backends: Mapping[str, Server[object]],
+        name: str = "mcp-proxy",
+        separator: str = DEFAULT_SEPARATOR,
+    ) -> None:
+        """Create a server routing requests to the given backends, by name."""
+        super().__init__(name)
+        self.backends = dict(backends)
+        for backend in self.backends.values():
+            if isinstance(backend, RelayServer):
+                # The backends relay the messages of their remote apps to the clients
+                backend.client_sessions = self.client_sessions
+        self.separator = separator
+        self._resource_owners: dict[str, str] = {}
+
+        handlers: dict[type, Callable[[t.Any], Awaitable[types.ServerResult]]] = {
+            types.ListToolsRequest: self._list_tools,
+            types.CallToolRequest: self._call_tool,
+            types.ListPromptsRequest: self._list_prompts,
+            types.GetPromptRequest: self._get_prompt,
+            types.ListResourcesRequest: self._list_resources,
+            types.ReadResourceRequest: self._route_by_uri,
+            types.SubscribeRequest: self._route_by_uri,
+            types.UnsubscribeRequest: self._route_by_uri,
+            types.SetLevelRequest: self._set_logging_level,
+            types.CompleteRequest: self._complete,
+        }
+        for request_type, handler in handlers.items():
+            if any(request_type in backend.request_handlers for backend in self.backends.values()):
+                self.request_handlers[request_type] = handler
+        self.notification_handlers[types.ProgressNotification] = self._broadcast_notification
+        self.notification_handlers[types.RootsListChangedNotification] = (
+            self._broadcast_notification
+        )
+
+    def _split(self, name: str) -> tuple[Server[object], str]:
+        backend_name, separator, local_name = name.partition(self.separator)
+        backend = self.backends.get(backend_name)
+        if not separator or backend is None:
+            raise McpError(
+                types.ErrorData(code=types.INVALID_PARAMS, message=f"Unknown name: {name}"),
+            )
+        return backend, local_name
+
+    @staticmethod
+    async def _request_all_pages(backend: Server[object], request: t.Any) -> t.Any:  # noqa: ANN401
+        """Send a request to a backend, merging all the pages of the lists it answers with."""
+        handler = backend.request_handlers[type(request)]
+        if type(request) not in LISTS:
+            return (await handler(request)).root
+        # The merged lists are answered in a single page, so clients never send a cursor
+        result: t.Any = (await handler(type(request)(method=request.method))).root
+        field = LISTS[type(request)][2]
+        items = list(getattr(result, field))
+        cursors: set[str] = set()
+        while (cursor := result.nextCursor) is not None and cursor not in cursors:
+            cursors.add(cursor)
+            result = (await handler(_page_request(request, cursor))).root
+            items.extend(getattr(result, field))
+        return result.model_copy(update={field: items, "nextCursor": None})
+
+    async def _gather(
+        self,
+        request: t.Any,  # noqa: ANN401
+        result_type: type[T],
+    ) -> dict[str, T]:
+        """Send a request to every backend handling it, skipping the ones that fail.
+
+        Lists are gathered with all their pages.
+        """
+        results: dict[str, T] = {}
+
+        async def _request(name: str, backend: Server[object]) -> None:
+            try:
+                result = await self._request_all_pages(backend, request)
+            except Exception:
+                logger.exception("Backend %s failed to answer %s", name, request.method)
+                return
+            if isinstance(result, result_type):
+                results[name] = result
+
+        async with anyio.create_task_group() as tg:
+            for name, backend in self.backends.items():
+                if type(request) in backend.request_handlers:
+                    tg.start_soon(_request, name, backend)
+        return {name: results[name] for name in self.backends if name in results}
+
+    async def _list_tools(self, req: types.ListToolsRequest) -> types.ServerResult:
+        results = await self._gather(req, types.ListToolsResult)
+        tools = [
+            tool.model_copy(update={"name": f"{name}{self.separator}{tool.name}"})
+            for name, result in results.items()
+            for tool in result.tools
+        ]
+        return types.ServerResult(types.ListToolsResult(tools=tools))
+
+    async def _call_tool(self, req: types.CallToolRequest) -> types.ServerResult:
+        try:
+            backend, name = self._split(req.params.name)
+        except McpError as e:
+            return types.ServerResult(
+                types.CallToolResult(
+                    content=[types.TextContent(type="text", text=e.error.message)],
+                    isError=True,
+                ),
+            )
+        params = req.params.model_copy(update={"name": name})
+        return await backend.request_handlers[types.CallToolRequest](
+            req.model_copy(update={"params": params}),
+        )
+
+    async def _list_prompts(self, req: types.ListPromptsRequest) -> types.ServerResult:
+        results = await self._gather(req, types.ListPromptsResult)
+        prompts = [
+            prompt.model_copy(update={"name": f"{name}{self.separator}{prompt.name}"})
+            for name, result in results.items()
+            for prompt in result.prompts
+        ]
+        return types.ServerResult(types.ListPromptsResult(prompts=prompts))
+
+    async def _get_prompt(self, req: types.GetPromptRequest) -> types.ServerResult:
+        backend, name = self._split(req.params.name)
+        params = req.params.model_copy(update={"name": name})
+        return await backend.request_handlers[types.GetPromptRequest](
+            req.model_copy(update={"params": params}),
+        )
+
+    async def _list_resources(self, req: types.ListResourcesRequest) -> types.ServerResult:
+        results = await self._gather(req, types.ListResourcesResult)
+        resources: list[types.Resource] = []
+        for name, result in results.items():
+            for resource in result.resources:
+                # URIs are kept as they are, so that they still identify the resource
+                self._resource_owners[str(resource.uri)] = name
+                resources.append(
+                    resource.model_copy(
+                        update={"name": f"{name}{self.separator}{resource.name}"},
+                    ),
+                )
+        return types.ServerResult(types.ListResourcesResult(resources=resources))
+
+    async def _resource_owner(self, uri: str) -> Server[object]:
+        if uri not in self._resource_owners:
+            await self._list_resources(types.ListResourcesRequest(method="resources/list"))
+        name = self._resource_owners.get(uri)
+        if name is None:
+            raise McpError(
+                types.ErrorData(code=types.INVALID_PARAMS, message=f"Unknown resource: {uri}"),
+            )
+        return self.backends[name]
+
+    async def _route_by_uri(
+        self,
+        req: types.ReadResourceRequest | types.SubscribeRequest | types.UnsubscribeRequest,
+    ) -> types.ServerResult:
+        backend = await self._resource_owner(str(req.params.uri))
+        return await backend.request_handlers[type(req)](req)
+
+    async def _set_logging_level(self, req: types.SetLevelRequest) -> types.ServerResult:
+        await self._gather(req, types.EmptyResult)
+        return types.ServerResult(types.EmptyResult())
+
+    async def _complete(self, req: types.CompleteRequest) -> types.ServerResult:
+        ref = req.params.ref
+        if isinstance(ref, types.PromptReference):
+            backend, name = self._split(ref.name)
+            ref = ref.model_copy(update={"name": name})
+        else:
+            backend = await self._resource_owner(ref.uri)
+        params = req.params.model_copy(update={"ref": ref})
+        return await backend.request_handlers[types.CompleteRequest](
+            req.model_copy(update={"params": params}),
+        )
+
+    async def _broadcast_notification(self, notification: t.Any) -> None:  # noqa: ANN401
+        for backend in self.backends.values():
+            handler = backend.notification_handlers.get(type(notification))
+            if handler is not None:
+                await handler(notification)
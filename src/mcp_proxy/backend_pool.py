@@ -0,0 +1,463 @@
+"""Spread requests over a pool of identical MCP backends.
+
+Every backend is wrapped by `create_proxy_server`, and the pool exposes all of them as a
+single MCP server. Requests go to the backend with the fewest outstanding requests, and
+the pool grows or shrinks between its minimum and maximum size based on queue depth.
+Backends whose connection is lost or that fail their health check are replaced by an
+initialized standby backend when one is kept, and reconnected with exponential backoff.
+The logging level set through the pool is replayed on them. Resources are subscribed to on a
+single backend, so that their updates are only sent once, and moved to another backend when
+theirs is stopped.
+"""
+
+import contextlib
+import logging
+import time
+import typing as t
+from collections.abc import Callable
+from contextlib import AbstractAsyncContextManager
+from dataclasses import dataclass, field
+
+import anyio
+from anyio.abc import TaskGroup, TaskStatus
+from mcp import types
+from mcp.client.session import ClientSession
+from mcp.server import Server
+from mcp.shared.exceptions import McpError
+from pydantic import AnyUrl
+
+from .proxy_server import ProxyOptions, ProxyServer, create_proxy_server
+from .relay import ClientSessions, RelayServer
+
+logger = logging.getLogger(__name__)
+
+SessionFactory = Callable[[], AbstractAsyncContextManager[ClientSession]]
+
+# Requests that change state held by the remote app, so every backend has to see them.
+BROADCAST_REQUESTS = (types.SetLevelRequest,)
+# Requests without side effects, retried on another backend when theirs is lost.
+RETRYABLE_REQUESTS = (
+    types.ListPromptsRequest,
+    types.GetPromptRequest,
+    types.ListResourcesRequest,
+    types.ReadResourceRequest,
+    types.ListToolsRequest,
+    types.CompleteRequest,
+)
+
+
+class BackendLostError(McpError):
+    """Raised for a request in flight on a backend whose connection was lost."""
+
+    def __init__(self) -> None:
+        """Create the error."""
+        super().__init__(
+            types.ErrorData(
+                code=types.INTERNAL_ERROR,
+                message="Connection to the backend was lost",
+            ),
+        )
+
+
+@dataclass
+class BackendPoolSettings:
+    """Settings for the backend pool."""
+
+    min_size: int = 1
+    max_size: int = 1
+    # Average number of outstanding requests per backend that triggers a new backend
+    scale_up_queue_depth: int = 4
+    # Seconds an idle backend above min_size is kept before it is stopped
+    idle_timeout: float = 60.0
+    # Seconds before reconnecting a lost backend, doubled after each failed attempt.
+    # Lost backends are not reconnected when None
+    reconnect_delay: float | None = 1.0
+    max_reconnect_delay: float = 30.0
+    # Seconds a request waits for a backend to connect while none is available
+    connect_timeout: float = 30.0
+    # Number of initialized backends kept out of rotation to replace a lost one instantly
+    standby_size: int = 0
+    # Seconds between pings of every backend. Backends are not pinged when None
+    health_check_interval: float | None = None
+    # Seconds a backend has to answer a ping before it is replaced
+    health_check_timeout: float = 5.0
+
+
+@dataclass(eq=False)
+class _Backend:
+    app: ProxyServer
+    outstanding: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+    stopped: anyio.Event = field(default_factory=anyio.Event)
+    # Set when the connection to the backend is lost rather than stopped by the pool
+    lost: bool = False
+    in_flight: set[anyio.CancelScope] = field(default_factory=set)
+
+
+class BackendPool:
+    """A pool of proxied backends that dispatches each request to the least busy one."""
+
+    def __init__(
+        self,
+        session_factory: SessionFactory,
+        settings: BackendPoolSettings,
+        proxy_options: ProxyOptions | None = None,
+    ) -> None:
+        """Create a pool that opens sessions with the given factory.
+
+        Args:
+            session_factory: Returns a context manager yielding a connected session.
+            settings: Sizing and scaling settings of the pool.
+            proxy_options: Options shared by the proxy servers wrapping every backend.
+
+        """
+        if settings.min_size < 1 or settings.max_size < settings.min_size:
+            raise ValueError("Pool size must satisfy 1 <= min_size <= max_size")
+        if settings.standby_size < 0:
+            raise ValueError("Standby size must not be negative")
+        self._session_factory = session_factory
+        self._settings = settings
+        self._proxy_options = proxy_options
+        self._backends: list[_Backend] = []
+        self._standby: list[_Backend] = []
+        self._backend_added = anyio.Event()
+        # Number of backends in rotation the pool is scaled to
+        self._target_size = settings.min_size
+        self._starting = 0
+        self._standby_starting = 0
+        self.failovers = 0
+        self._task_group: TaskGroup | None = None
+        # State of the remote app set through the pool, replayed on every new backend
+        self._logging_level: types.LoggingLevel | None = None
+        # Backend subscribed to each resource, None until one is again after it was stopped
+        self._subscriptions: dict[str, _Backend | None] = {}
+        # Sessions of the clients of the pool, to which the backends relay their messages
+        self.client_sessions = ClientSessions()
+
+    @property
+    def size(self) -> int:
+        """Return the number of running backends."""
+        return len(self._backends)
+
+    @property
+    def standby(self) -> int:
+        """Return the number of initialized backends kept out of rotation."""
+        return len(self._standby)
+
+    @property
+    def queue_depth(self) -> int:
+        """Return the number of requests currently waiting on any backend."""
+        return sum(backend.outstanding for backend in self._backends)
+
+    async def run(self, *, task_status: TaskStatus[None] = anyio.TASK_STATUS_IGNORED) -> None:
+        """Start the minimum number of backends and keep the pool scaled until cancelled."""
+        async with anyio.create_task_group() as tg:
+            self._task_group = tg
+            async with anyio.create_task_group() as startup:
+                for _ in range(self._settings.min_size):
+                    startup.start_soon(tg.start, self._run_backend)
+            self._refill_standby()
+            task_status.started()
+
+            while True:
+                await anyio.sleep(self._settings.idle_timeout / 2)
+                self._scale_down()
+
+    async def _run_backend(self, *, task_status: TaskStatus[None]) -> None:
+        connected = False
+        delay = self._settings.reconnect_delay
+        while True:
+            try:
+                lost = await self._connect_backend(task_status if not connected else None)
+            except Exception:
+                if not connected:
+                    raise
+                logger.exception("Failed to reconnect a backend")
+            else:
+                connected = True
+                if not lost:
+                    return
+                delay = self._settings.reconnect_delay
+
+            if delay is None:
+                return
+            logger.warning("Backend connection lost, reconnecting in %.1f seconds", delay)
+            await anyio.sleep(delay)
+            delay = min(delay * 2, self._settings.max_reconnect_delay)
+
+    async def _connect_backend(self, task_status: TaskStatus[None] | None) -> bool:
+        """Run a backend until it is stopped, and return whether its connection was lost."""
+        async with self._session_factory() as session, anyio.create_task_group() as tg:
+            app = await create_proxy_server(session, self._proxy_options)
+            app.client_sessions = self.client_sessions
+            backend = _Backend(app=app)
+            if self.size < self._target_size:
+                tg.start_soon(self._watch_backend, backend)
+                await self._replay_state(backend)
+                self._activate(backend)
+                logger.info("Backend started, pool size is %d", self.size)
+            elif len(self._standby) < self._settings.standby_size:
+                tg.start_soon(self._watch_backend, backend)
+                self._standby.append(backend)
+                logger.info("Standby backend started")
+            else:
+                # The backend was replaced while it was connecting
+                backend.stopped.set()
+            if task_status is not None:
+                task_status.started()
+            try:
+                await backend.stopped.wait()
+            finally:
+                if backend in self._backends:
+                    self._backends.remove(backend)
+                    self._release_subscriptions(backend)
+                if backend in self._standby:
+                    self._standby.remove(backend)
+                logger.info("Backend stopped, pool size is %d", self.size)
+                tg.cancel_scope.cancel()
+            return backend.lost
+
+    def _activate(self, backend: _Backend) -> None:
+        self._backends.append(backend)
+        self._backend_added.set()
+        self._backend_added = anyio.Event()
+
+    async def _watch_backend(self, backend: _Backend) -> None:
+        async with anyio.create_task_group() as tg:
+            if self._settings.health_check_interval is not None:
+                tg.start_soon(self._check_health, backend, tg.cancel_scope)
+            await backend.app.handle_remote_messages()
+            # The stream of the remote app only ends when its connection is closed
+            tg.cancel_scope.cancel()
+        self._lose(backend)
+
+    async def _check_health(self, backend: _Backend, scope: anyio.CancelScope) -> None:
+        if self._settings.health_check_interval is None:
+            return
+        while True:
+            await anyio.sleep(self._settings.health_check_interval)
+            try:
+                with anyio.fail_after(self._settings.health_check_timeout):
+                    await backend.app.remote_app.send_ping()
+            except Exception:  # noqa: BLE001
+                logger.warning("Backend failed its health check")
+                scope.cancel()
+                return
+
+    def _lose(self, backend: _Backend) -> None:
+        backend.lost = True
+        if backend in self._backends:
+            self._backends.remove(backend)
+            self._release_subscriptions(backend)
+            if self._standby:
+                self._promote()
+        elif backend in self._standby:
+            self._standby.remove(backend)
+        self._refill_standby()
+        for scope in backend.in_flight:
+            scope.cancel()
+        backend.stopped.set()
+
+    def _promote(self) -> None:
+        backend = self._standby.pop(0)
+        self._activate(backend)
+        self.failovers += 1
+        logger.info("Standby backend promoted, pool size is %d", self.size)
+        if self._task_group is not None:
+            self._task_group.start_soon(self._replay_promoted_state, backend)
+
+    async def _replay_promoted_state(self, backend: _Backend) -> None:
+        try:
+            await self._replay_state(backend)
+        except Exception:
+            logger.exception("Failed to restore the state of a promoted backend")
+
+    async def _replay_state(self, backend: _Backend) -> None:
+        if self._logging_level is not None:
+            await backend.app.remote_app.set_logging_level(self._logging_level)
+        await self._resubscribe(backend)
+
+    async def _resubscribe(self, backend: _Backend) -> None:
+        """Subscribe a backend to the resources whose backend was stopped."""
+        for uri in list(self._subscriptions):
+            # Resources may be unsubscribed from or claimed by another backend meanwhile
+            if uri not in self._subscriptions or self._subscriptions[uri] is not None:
+                continue
+            # Claimed before subscribing, so that no other backend subscribes to it meanwhile
+            self._subscriptions[uri] = backend
+            try:
+                await backend.app.remote_app.subscribe_resource(AnyUrl(uri))
+            except BaseException:
+                if self._subscriptions.get(uri) is backend:
+                    self._subscriptions[uri] = None
+                raise
+
+    def _release_subscriptions(self, backend: _Backend) -> None:
+        released = False
+        for uri, holder in self._subscriptions.items():
+            if holder is backend:
+                self._subscriptions[uri] = None
+                released = True
+        # Without running backends, the next one to start is subscribed to them
+        if released and self._backends and self._task_group is not None:
+            self._task_group.start_soon(self._move_subscriptions)
+
+    async def _move_subscriptions(self) -> None:
+        if not self._backends:
+            return
+        try:
+            await self._resubscribe(min(self._backends, key=lambda backend: backend.outstanding))
+        except Exception:
+            logger.exception("Failed to move subscriptions to another backend")
+
+    async def _spawn_standby(self) -> None:
+        if self._task_group is None:
+            raise RuntimeError("Backend pool is not running")
+        try:
+            await self._task_group.start(self._run_backend)
+        except Exception:
+            logger.exception("Failed to start a standby backend")
+        finally:
+            self._standby_starting -= 1
+
+    def _refill_standby(self) -> None:
+        if self._task_group is None:
+            return
+        while len(self._standby) + self._standby_starting < self._settings.standby_size:
+            self._standby_starting += 1
+            self._task_group.start_soon(self._spawn_standby)
+
+    async def _spawn_backend(self) -> None:
+        if self._task_group is None:
+            raise RuntimeError("Backend pool is not running")
+        try:
+            await self._task_group.start(self._run_backend)
+        except Exception:
+            logger.exception("Failed to start an additional backend")
+        finally:
+            self._starting -= 1
+
+    def _scale_up(self) -> None:
+        if self._task_group is None or self._starting:
+            return
+        if self._target_size >= self._settings.max_size:
+            return
+        if self.queue_depth < self._settings.scale_up_queue_depth * self.size:
+            return
+        self._target_size += 1
+        if self._standby:
+            self._promote()
+            self._refill_standby()
+            return
+        self._starting += 1
+        self._task_group.start_soon(self._spawn_backend)
+
+    def _scale_down(self) -> None:
+        deadline = time.monotonic() - self._settings.idle_timeout
+        for backend in sorted(self._backends, key=lambda backend: backend.last_used):
+            if self.size <= self._settings.min_size:
+                break
+            if backend.outstanding == 0 and backend.last_used <= deadline:
+                self._backends.remove(backend)
+                self._release_subscriptions(backend)
+                self._target_size = max(self._target_size - 1, self._settings.min_size)
+                backend.stopped.set()
+
+    async def _forward(self, backend: _Backend, req: t.Any) -> types.ServerResult:  # noqa: ANN401
+        backend.outstanding += 1
+        self._scale_up()
+        try:
+            with anyio.CancelScope() as scope:
+                backend.in_flight.add(scope)
+                return await backend.app.request_handlers[type(req)](req)
+        finally:
+            backend.in_flight.discard(scope)
+            backend.outstanding -= 1
+            backend.last_used = time.monotonic()
+        raise BackendLostError
+
+    def _record_state(self, req: t.Any) -> None:  # noqa: ANN401
+        if isinstance(req, types.SetLevelRequest):
+            self._logging_level = req.params.level
+
+    async def _subscribe(
+        self,
+        backend: _Backend,
+        req: types.SubscribeRequest,
+    ) -> types.ServerResult:
+        uri = str(req.params.uri)
+        if uri in self._subscriptions:
+            return types.ServerResult(types.EmptyResult())
+        self._subscriptions[uri] = backend
+        try:
+            return await self._forward(backend, req)
+        except BaseException:
+            # Released meanwhile when the backend was lost
+            if self._subscriptions.get(uri, backend) in (backend, None):
+                self._subscriptions.pop(uri, None)
+            raise
+
+    async def _unsubscribe(self, req: types.UnsubscribeRequest) -> types.ServerResult:
+        backend = self._subscriptions.pop(str(req.params.uri), None)
+        # Backends that were stopped are not subscribed to anything anymore
+        if backend is None or backend not in self._backends:
+            return types.ServerResult(types.EmptyResult())
+        with contextlib.suppress(BackendLostError):
+            return await self._forward(backend, req)
+        return types.ServerResult(types.EmptyResult())
+
+    async def _select_backend(self) -> _Backend:
+        with anyio.move_on_after(self._settings.connect_timeout):
+            while not self._backends:
+                await self._backend_added.wait()
+        if not self._backends:
+            raise RuntimeError("No backend is available")
+        return min(self._backends, key=lambda backend: backend.outstanding)
+
+    async def dispatch(self, req: t.Any) -> types.ServerResult:  # noqa: ANN401
+        """Forward a request to the least busy backend, or to all for stateful requests.
+
+        While no backend is connected, the request waits for one up to the connect timeout.
+        Requests without side effects are retried once when their backend is lost.
+        Unsubscribe requests go to the backend subscribed to the resource.
+        """
+        if isinstance(req, types.UnsubscribeRequest):
+            return await self._unsubscribe(req)
+        backend = await self._select_backend()
+        if isinstance(req, types.SubscribeRequest):
+            return await self._subscribe(backend, req)
+        if isinstance(req, BROADCAST_REQUESTS):
+            self._record_state(req)
+            results: list[types.ServerResult] = []
+            for backend in list(self._backends):
+                # Lost backends get the state replayed when they are replaced
+                with contextlib.suppress(BackendLostError):
+                    results.append(await self._forward(backend, req))
+            if not results:
+                raise BackendLostError
+            return results[0]
+        try:
+            return await self._forward(backend, req)
+        except BackendLostError:
+            if not isinstance(req, RETRYABLE_REQUESTS):
+                raise
+            logger.info("Retrying %s on another backend", req.method)
+        return await self._forward(await self._select_backend(), req)
+
+    async def broadcast_notification(self, notification: t.Any) -> None:  # noqa: ANN401
+        """Forward a notification to every backend."""
+        for backend in list(self._backends):
+            await backend.app.notification_handlers[type(notification)](notification)
+
+    def create_server(self) -> Server[object]:
+        """Create a server that exposes the running pool as a single MCP server."""
+        if not self._backends:
+            raise RuntimeError("Backend pool is not running")
+        template = self._backends[0].app
+        app = RelayServer(template.name, self.client_sessions)
+        for request_type in template.request_handlers:
+            if request_type is not types.PingRequest:
+                app.request_handlers[request_type] = self.dispatch
+        for notification_type in template.notification_handlers:
+            app.notification_handlers[notification_type] = self.broadcast_notification
+        return app
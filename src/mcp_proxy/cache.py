@@ -0,0 +1,416 @@
+"""Caches that let the proxy server answer requests without a round trip to the remote app."""
+
+import fnmatch
+import hashlib
+import json
+import logging
+import time
+import typing as t
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterable, Mapping
+from pathlib import Path
+
+import anyio
+from mcp import types
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+K = t.TypeVar("K", bound=Hashable)
+V = t.TypeVar("V")
+
+
+class TTLCache(t.Generic[K, V]):
+    """A cache whose entries expire after a TTL and are evicted least recently used first."""
+
+    def __init__(
+        self,
+        ttl: float | None = None,
+        max_entries: int | None = 128,
+        *,
+        max_bytes: int | None = None,
+        size_of: Callable[[V], int] | None = None,
+    ) -> None:
+        """Create an empty cache.
+
+        Args:
+            ttl: Seconds an entry stays valid. Entries never expire when None.
+            max_entries: Number of entries kept before the least recently used is evicted.
+            max_bytes: Total size of the entries kept before the least recently used is evicted.
+            size_of: Returns the size of a value in bytes. Required when max_bytes is set.
+
+        """
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if max_bytes is not None and size_of is None:
+            raise ValueError("size_of is required to limit the cache by size")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Incremented by every invalidation, to drop values fetched before one
+        self.generation = 0
+        self._size_of = size_of
+        self._size = 0
+        self._entries: OrderedDict[K, tuple[float, int, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of entries, including expired ones not yet purged."""
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Return the total size of the entries in bytes, when sizes are tracked."""
+        return self._size
+
+    @staticmethod
+    def _expired(expires_at: float) -> bool:
+        return time.monotonic() >= expires_at
+
+    def _pop(self, key: K) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+    def get(self, key: K) -> V | None:
+        """Return the cached value for the key, or None on a miss."""
+        entry = self._entries.get(key)
+        if entry is None or self._expired(entry[0]):
+            if entry is not None:
+                self._pop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def set(
+        self,
+        key: K,
+        value: V,
+        ttl: float | None = None,
+        generation: int | None = None,
+    ) -> None:
+        """Store a value, evicting the least recently used entries over the limits.
+
+        Args:
+            key: Key of the entry.
+            value: Value of the entry.
+            ttl: Seconds the entry stays valid, instead of the TTL of the cache.
+            generation: Generation of the cache when the value was fetched. The value is not
+                stored when the cache was invalidated since.
+
+        """
+        if generation is not None and generation != self.generation:
+            return
+        size = self._size_of(value) if self._size_of is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._pop(key)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = float("inf") if ttl is None else time.monotonic() + ttl
+        self._entries[key] = (expires_at, size, value)
+        self._size += size
+        while (self.max_entries is not None and len(self._entries) > self.max_entries) or (
+            self.max_bytes is not None and self._size > self.max_bytes
+        ):
+            self._pop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, predicate: Callable[[K], bool] | None = None) -> None:
+        """Drop the entries matching the predicate, or every entry when None."""
+        self.generation += 1
+        keys = [key for key in self._entries if predicate is None or predicate(key)]
+        for key in keys:
+            self._pop(key)
+        self.invalidations += len(keys)
+
+    def stats(self) -> dict[str, int]:
+        """Return the counters of the cache."""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+def _result_size(result: types.CallToolResult) -> int:
+    return len(result.model_dump_json(by_alias=True, exclude_none=True))
+
+
+# Total size of the files of the on-disk tier of the tool result cache by default
+DEFAULT_MAX_DISK_BYTES = 256 * 1024 * 1024
+
+
+def _list_entries(directory: Path) -> OrderedDict[str, int]:
+    """Return the sizes of the entries of a directory, least recently used first."""
+    stats = []
+    for path in directory.glob("*.json"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        stats.append((stat.st_mtime, path.name, stat.st_size))
+    return OrderedDict((name, size) for _, name, size in sorted(stats))
+
+
+class ToolResultCache:
+    """Cache for the results of read-only tools, keyed by tool name and arguments.
+
+    Results are kept in memory within a byte budget and, when a directory is given, also
+    written to disk so that entries evicted from memory or left by a previous run can be
+    served without calling the tool again. The files of the directory are kept within their
+    own byte budget, and the least recently used are removed beyond it.
+    """
+
+    def __init__(
+        self,
+        tools: Iterable[str],
+        ttl: float | None = None,
+        max_bytes: int = 16 * 1024 * 1024,
+        directory: Path | None = None,
+        max_disk_bytes: int | None = DEFAULT_MAX_DISK_BYTES,
+    ) -> None:
+        """Create an empty cache.
+
+        Args:
+            tools: Names or glob patterns of the tools whose results can be cached.
+            ttl: Seconds a result stays valid. Results never expire when None.
+            max_bytes: Total size of the serialized results kept in memory.
+            directory: Directory of the on-disk tier. Results are kept in memory only when None.
+            max_disk_bytes: Total size of the files of the on-disk tier, or None for no limit.
+
+        """
+        self.tools = list(tools)
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_hits = 0
+        self.disk_evictions = 0
+        # Sizes of the files of the directory, least recently used first, listed on first use
+        self._disk_entries: OrderedDict[str, int] | None = None
+        self._disk_size = 0
+        self.memory = TTLCache[str, types.CallToolResult](
+            ttl,
+            max_entries=None,
+            max_bytes=max_bytes,
+            size_of=_result_size,
+        )
+
+    def cacheable(self, name: str) -> bool:
+        """Return whether the results of the tool can be cached."""
+        return any(fnmatch.fnmatchcase(name, pattern) for pattern in self.tools)
+
+    @staticmethod
+    def key(name: str, arguments: dict[str, t.Any]) -> str:
+        """Return the canonical key of a tool call, independent of the order of arguments."""
+        return json.dumps(
+            [name, arguments],
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+            default=str,
+        )
+
+    def _path(self, key: str) -> anyio.Path:
+        if self.directory is None:
+            raise RuntimeError("Tool result cache has no directory")
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return anyio.Path(self.directory) / f"{digest}.json"
+
+    async def get(self, name: str, arguments: dict[str, t.Any]) -> types.CallToolResult | None:
+        """Return the cached result of a tool call, or None on a miss."""
+        key = self.key(name, arguments)
+        result = self.memory.get(key)
+        if result is not None or self.directory is None:
+            return result
+
+        path = self._path(key)
+        try:
+            stat = await path.stat()
+            if self.memory.ttl is not None and time.time() - stat.st_mtime >= self.memory.ttl:
+                await path.unlink(missing_ok=True)
+                self._disk_size -= (await self._disk_index()).pop(path.name, 0)
+                return None
+            result = types.CallToolResult.model_validate_json(await path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValidationError) as e:
+            logger.warning("Ignoring unreadable tool result cache entry %s: %s", path, e)
+            return None
+
+        self.disk_hits += 1
+        # Files are listed by the time they were written, which their TTL also starts from, so
+        # the order of use is only tracked in memory
+        entries = await self._disk_index()
+        self._disk_size += stat.st_size - entries.pop(path.name, 0)
+        entries[path.name] = stat.st_size
+        self.memory.set(key, result)
+        return result
+
+    async def set(
+        self,
+        name: str,
+        arguments: dict[str, t.Any],
+        result: types.CallToolResult,
+    ) -> None:
+        """Store the result of a tool call. Error results are never cached."""
+        if result.isError:
+            return
+        key = self.key(name, arguments)
+        self.memory.set(key, result)
+        if self.directory is None:
+            return
+
+        path = self._path(key)
+        data = result.model_dump_json(by_alias=True, exclude_none=True).encode()
+        if self.max_disk_bytes is not None and len(data) > self.max_disk_bytes:
+            return
+        temporary_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        try:
+            await path.parent.mkdir(parents=True, exist_ok=True)
+            await temporary_path.write_bytes(data)
+            await temporary_path.replace(path)
+        except OSError as e:
+            logger.warning("Failed to write tool result cache entry %s: %s", path, e)
+            return
+        entries = await self._disk_index()
+        self._disk_size += len(data) - entries.pop(path.name, 0)
+        entries[path.name] = len(data)
+        while self.max_disk_bytes is not None and self._disk_size > self.max_disk_bytes:
+            name, size = entries.popitem(last=False)
+            self._disk_size -= size
+            self.disk_evictions += 1
+            try:
+                await (path.parent / name).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning("Failed to remove tool result cache entry %s: %s", name, e)
+
+    async def _disk_index(self) -> OrderedDict[str, int]:
+        if self._disk_entries is None:
+            directory = self.directory
+            if directory is None:
+                raise RuntimeError("Tool result cache has no directory")
+            entries = await anyio.to_thread.run_sync(_list_entries, directory)
+            # Another call may have listed the directory meanwhile
+            if self._disk_entries is None:
+                self._disk_entries = entries
+                self._disk_size = sum(entries.values())
+        return self._disk_entries
+
+    def stats(self) -> dict[str, int]:
+        """Return the counters of the cache."""
+        return {
+            **self.memory.stats(),
+            "disk_hits": self.disk_hits,
+            "disk_bytes": self._disk_size,
+            "disk_evictions": self.disk_evictions,
+        }
+
+
+# Seconds the contents of a resource the remote app does not send updates of stay valid, when no
+# TTL is set for its URI scheme
+DEFAULT_RESOURCE_TTL = 60.0
+
+
+def _resource_size(result: dict[str, t.Any]) -> int:
+    return sum(
+        len(contents.get("text") or contents.get("blob") or "")
+        for contents in result.get("contents", ())
+    )
+
+
+class ResourceCache:
+    """Cache for the contents of resources, keyed by URI.
+
+    Entries are dropped when the remote app reports that their resource was updated, which it
+    only does for the resources it is subscribed to. Other entries expire after a default TTL,
+    unless a TTL is set for their URI scheme. Contents are serialized once, as read from the
+    remote app, and shared by every client reading them.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttls: Mapping[str, float] | None = None,
+        default_ttl: float | None = DEFAULT_RESOURCE_TTL,
+    ) -> None:
+        """Create an empty cache.
+
+        Args:
+            max_bytes: Total size of the cached text and blob contents.
+            ttls: Seconds the contents of a resource stay valid, by URI scheme, with `*`
+                for the other schemes.
+            default_ttl: Seconds the contents of a resource without a TTL for its scheme stay
+                valid when the remote app is not subscribed to it. They stay valid until
+                updated when the remote app is subscribed to it, or when None.
+
+        """
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.bytes_saved = 0
+        # Incremented by every invalidation, to drop reads that started before one
+        self.generation = 0
+        # Resources the remote app is subscribed to, and reports the updates of
+        self.subscribed: set[str] = set()
+        self.memory = TTLCache[str, dict[str, t.Any]](
+            max_entries=None,
+            max_bytes=max_bytes,
+            size_of=_resource_size,
+        )
+
+    def ttl(self, uri: str) -> float | None:
+        """Return the TTL of the contents of a resource."""
+        scheme, _, _ = uri.partition(":")
+        ttl = self.ttls.get(scheme, self.ttls.get("*"))
+        if ttl is None and uri not in self.subscribed:
+            return self.default_ttl
+        return ttl
+
+    def get(self, uri: str) -> dict[str, t.Any] | None:
+        """Return the cached contents of a resource, serialized as JSON, or None on a miss."""
+        result = self.memory.get(uri)
+        if result is not None:
+            self.bytes_saved += _resource_size(result)
+        return result
+
+    def set(self, uri: str, result: types.Result, generation: int) -> None:
+        """Store the contents of a resource read when the cache was at the given generation."""
+        if generation == self.generation:
+            self.memory.set(
+                uri,
+                result.model_dump(by_alias=True, mode="json", exclude_none=True),
+                self.ttl(uri),
+            )
+
+    def subscribe(self, uri: str) -> None:
+        """Record that the remote app was subscribed to a resource."""
+        self.subscribed.add(uri)
+
+    def unsubscribe(self, uri: str) -> None:
+        """Record that the remote app was unsubscribed from a resource.
+
+        Its contents are dropped, as they would no longer be invalidated by updates.
+        """
+        self.subscribed.discard(uri)
+        self.invalidate(uri)
+
+    def invalidate(self, uri: str) -> None:
+        """Drop the contents of an updated resource."""
+        self.generation += 1
+        self.memory.invalidate(lambda key: key == uri)
+
+    def stats(self) -> dict[str, float]:
+        """Return the counters of the cache."""
+        lookups = self.memory.hits + self.memory.misses
+        return {
+            **self.memory.stats(),
+            "bytes_saved": self.bytes_saved,
+            "hit_ratio": self.memory.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,183 @@
+"""Answer list requests from the lists of the remote app, prefetched in the background.
+
+Every page of the lists of tools, prompts and resources is fetched by following their cursors,
+and the pages of a list are merged. List requests are then answered with pages of the merged
+list, whose cursors index it directly, without a round trip to the remote app. A list is fetched
+again when the remote app reports that it changed.
+"""
+
+import logging
+import typing as t
+from collections.abc import Awaitable, Callable, Iterable
+
+import anyio
+from mcp import types
+from mcp.shared.exceptions import McpError
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+ListResult = types.ListPromptsResult | types.ListResourcesResult | types.ListToolsResult
+FetchPage = Callable[[type, str | None], Awaitable[ListResult]]
+
+# Method, result type and field of the items of the lists, by request type
+LISTS: dict[type, tuple[str, type[ListResult], str]] = {
+    types.ListPromptsRequest: ("prompts/list", types.ListPromptsResult, "prompts"),
+    types.ListResourcesRequest: ("resources/list", types.ListResourcesResult, "resources"),
+    types.ListToolsRequest: ("tools/list", types.ListToolsResult, "tools"),
+}
+
+# Prefix of the cursors of the catalog, telling them from the ones of the remote app
+CURSOR_PREFIX = "mcp-proxy:"
+# Seconds before fetching a list that failed to be fetched again
+RETRY_DELAY = 5.0
+
+
+def request_cursor(req: t.Any) -> str | None:  # noqa: ANN401
+    """Return the cursor of a list request, None for its first page."""
+    # Older SDKs read the cursor next to the params of the request instead of in them
+    return getattr(req.params, "cursor", None) or getattr(req, "cursor", None)
+
+
+class _PageRequest(BaseModel):
+    method: str
+    params: dict[str, t.Any]
+
+
+def list_request(request_type: type, cursor: str | None) -> types.ClientRequest:
+    """Return a request for the page of a list starting at a cursor of the remote app."""
+    request = _PageRequest(
+        method=LISTS[request_type][0],
+        params={"cursor": cursor} if cursor is not None else {},
+    )
+    # The typed list requests of older SDKs cannot carry a cursor in their params, while the
+    # session only needs the request to serialize to JSON-RPC
+    return t.cast("types.ClientRequest", request)
+
+
+class ListCatalog:
+    """The lists of the remote app, merged from all their pages and served in pages."""
+
+    def __init__(self, page_size: int = 100) -> None:
+        """Create an empty catalog.
+
+        Args:
+            page_size: Number of items in the pages served to clients.
+
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        self.page_size = page_size
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._lists: dict[type, tuple[int, list[t.Any]]] = {}
+        self._generation = 0
+        self._stale: set[type] = set()
+        # Created by the first server running the catalog, as they need its event loop
+        self._changed: anyio.Event | None = None
+        self._fetching: anyio.Lock | None = None
+
+    def page(self, request_type: type, cursor: str | None) -> types.ServerResult | None:
+        """Return the page of a list starting at a cursor.
+
+        None is returned when the list is not in the catalog yet, or for cursors of the remote
+        app handed out before it was.
+
+        Raises:
+            McpError: The cursor is one of the catalog, for a list that changed since.
+
+        """
+        entry = self._lists.get(request_type)
+        offset = 0
+        if cursor is not None and cursor.startswith(CURSOR_PREFIX):
+            listed, _, start = cursor.removeprefix(CURSOR_PREFIX).partition(":")
+            if entry is None or listed != str(entry[0]) or not start.isdigit():
+                raise McpError(
+                    types.ErrorData(
+                        code=types.INVALID_PARAMS,
+                        message="The list changed since the cursor was handed out",
+                    ),
+                )
+            offset = int(start)
+        elif cursor is not None or entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        generation, items = entry
+        end = offset + self.page_size
+        _, result_type, field = LISTS[request_type]
+        next_cursor = f"{CURSOR_PREFIX}{generation}:{end}" if end < len(items) else None
+        result = result_type.model_validate({field: items[offset:end], "nextCursor": next_cursor})
+        return types.ServerResult(result)
+
+    def invalidate(self, request_type: type) -> None:
+        """Drop a list that changed, and fetch it again."""
+        self._lists.pop(request_type, None)
+        self._stale.add(request_type)
+        if self._changed is not None:
+            self._changed.set()
+
+    async def _fetch(self, fetch_page: FetchPage, request_type: type) -> list[t.Any]:
+        field = LISTS[request_type][2]
+        items: list[t.Any] = []
+        cursors: set[str] = set()
+        cursor = None
+        while True:
+            result = await fetch_page(request_type, cursor)
+            items.extend(getattr(result, field))
+            cursor = result.nextCursor
+            # A cursor seen before would fetch the same pages forever
+            if cursor is None or cursor in cursors:
+                return items
+            cursors.add(cursor)
+
+    async def run(self, fetch_page: FetchPage, request_types: Iterable[type]) -> None:
+        """Fetch the lists of the remote app, and again when they change, until cancelled.
+
+        Args:
+            fetch_page: Returns the page of a list starting at a cursor of the remote app.
+            request_types: Types of the list requests the remote app answers.
+
+        """
+        if self._fetching is None:
+            self._fetching = anyio.Lock()
+        # Servers sharing the catalog, such as the ones of a backend pool, take turns fetching
+        async with self._fetching:
+            self._stale.update(set(request_types) - self._lists.keys())
+            while True:
+                while self._stale:
+                    request_type = self._stale.pop()
+                    try:
+                        items = await self._fetch(fetch_page, request_type)
+                    except Exception:
+                        logger.warning(
+                            "Failed to fetch %s, retrying in %ss",
+                            LISTS[request_type][0],
+                            RETRY_DELAY,
+                            exc_info=True,
+                        )
+                        self._stale.add(request_type)
+                        await anyio.sleep(RETRY_DELAY)
+                        continue
+                    except BaseException:
+                        # Another server sharing the catalog fetches it instead
+                        self._stale.add(request_type)
+                        raise
+                    # A list that changed while it was fetched is fetched again
+                    if request_type not in self._stale:
+                        self._generation += 1
+                        self._lists[request_type] = (self._generation, items)
+                        self.refreshes += 1
+                self._changed = anyio.Event()
+                await self._changed.wait()
+
+    def stats(self) -> dict[str, int]:
+        """Return the counters of the catalog."""
+        return {
+            "lists": len(self._lists),
+            "items": sum(len(items) for _, items in self._lists.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+        }
@@ -0,0 +1,226 @@
+"""Compress the HTTP responses of the server, and decompress the bodies of its requests.
+
+Responses are compressed with the best encoding the client accepts among zstd, when Python
+provides it, gzip and deflate. Event streams are compressed as they are sent, and every event
+is flushed so that the client can decode it right away. Other responses are left uncompressed
+when their body is smaller than a threshold. Request bodies sent with one of these encodings
+are decompressed before they reach the application.
+"""
+
+import importlib
+import typing as t
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    # Part of the standard library from Python 3.14
+    zstd: t.Any = importlib.import_module("compression.zstd")
+except ImportError:
+    zstd = None
+
+ENCODINGS = ("zstd", "gzip", "deflate") if zstd is not None else ("gzip", "deflate")
+# Compression level of gzip and deflate, favoring speed as responses are compressed inline
+ZLIB_LEVEL = 6
+# Size of the decompressed body of a request above which it is rejected
+MAX_REQUEST_BYTES = 32 * 1024 * 1024
+
+
+class _Encoder(t.Protocol):
+    def compress(self, data: bytes, *, final: bool) -> bytes: ...
+
+
+class _ZlibEncoder:
+    def __init__(self, wbits: int) -> None:
+        self._compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, wbits)
+
+    def compress(self, data: bytes, *, final: bool) -> bytes:
+        mode = zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        return self._compressor.compress(data) + self._compressor.flush(mode)
+
+
+class _ZstdEncoder:
+    def __init__(self) -> None:
+        self._compressor = zstd.ZstdCompressor()
+
+    def compress(self, data: bytes, *, final: bool) -> bytes:
+        mode = zstd.ZstdCompressor.FLUSH_FRAME if final else zstd.ZstdCompressor.FLUSH_BLOCK
+        return t.cast("bytes", self._compressor.compress(data, mode))
+
+
+def _encoder(encoding: str) -> _Encoder:
+    if encoding == "zstd":
+        return _ZstdEncoder()
+    # gzip has a gzip header and trailer, while HTTP deflate is zlib-wrapped
+    return _ZlibEncoder(16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS)
+
+
+def _decompress(encoding: str, body: bytes) -> bytes:
+    if encoding == "zstd":
+        decompressor = zstd.ZstdDecompressor()
+        return t.cast("bytes", decompressor.decompress(body, MAX_REQUEST_BYTES + 1))
+    wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+    return zlib.decompressobj(wbits).decompress(body, MAX_REQUEST_BYTES + 1)
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """Return the preferred encoding among the ones a client accepts, None for none."""
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        key, _, value = params.strip().partition("=")
+        if key.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    return next((name for name in ENCODINGS if accepted.get(name, wildcard) > 0), None)
+
+
+class Compression:
+    """Settings and counters of the compression of HTTP bodies."""
+
+    def __init__(self, minimum_size: int = 1024) -> None:
+        """Create the settings.
+
+        Args:
+            minimum_size: Size in bytes of the smallest body of a response that is compressed.
+                Event streams are compressed whatever the size of their events.
+
+        """
+        self.minimum_size = minimum_size
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compressed_responses = 0
+        self.skipped_responses = 0
+        self.decompressed_requests = 0
+
+    def stats(self) -> dict[str, float]:
+        """Return the counters of the compression."""
+        return {
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": self.bytes_out / self.bytes_in if self.bytes_in else 1.0,
+            "compressed_responses": self.compressed_responses,
+            "skipped_responses": self.skipped_responses,
+            "decompressed_requests": self.decompressed_requests,
+        }
+
+
+class _CompressedResponse:
+    """Sends a response compressed as the application sends it."""
+
+    def __init__(self, send: Send, encoding: str, compression: Compression) -> None:
+        self._send = send
+        self._encoding = encoding
+        self._compression = compression
+        self._start: Message | None = None
+        self._encoder: _Encoder | None = None
+
+    async def _start_compressing(self, start: Message) -> _Encoder:
+        headers = MutableHeaders(raw=list(start["headers"]))
+        headers["content-encoding"] = self._encoding
+        headers.add_vary_header("accept-encoding")
+        del headers["content-length"]
+        self._compression.compressed_responses += 1
+        await self._send({**start, "headers": headers.raw})
+        return _encoder(self._encoding)
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if "content-encoding" in headers or message["status"] in {204, 304}:
+                await self._send(message)
+                return
+            # The start of the response is held until its body tells whether to compress it
+            self._start = message
+            if headers.get("content-type", "").startswith("text/event-stream"):
+                self._encoder = await self._start_compressing(message)
+            return
+        if message["type"] != "http.response.body" or self._start is None:
+            await self._send(message)
+            return
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if self._encoder is None:
+            if not more_body and len(body) < self._compression.minimum_size:
+                self._compression.skipped_responses += 1
+                await self._send(self._start)
+                self._start = None
+                await self._send(message)
+                return
+            self._encoder = await self._start_compressing(self._start)
+        # Every message is flushed, so that the events of a stream are not held back
+        compressed = self._encoder.compress(body, final=not more_body)
+        self._compression.bytes_in += len(body)
+        self._compression.bytes_out += len(compressed)
+        await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses and decompressing requests."""
+
+    def __init__(self, app: ASGIApp, compression: Compression) -> None:
+        """Wrap an application."""
+        self.app = app
+        self.compression = compression
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Serve a request, decompressing its body and compressing the response."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        content_encoding = headers.get("content-encoding", "identity").lower()
+        if content_encoding != "identity":
+            decompressed = await self._decompressed_request(scope, receive, content_encoding)
+            if isinstance(decompressed, PlainTextResponse):
+                await decompressed(scope, receive, send)
+                return
+            scope, receive = decompressed
+        encoding = negotiate(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressedResponse(send, encoding, self.compression))
+
+    async def _decompressed_request(
+        self,
+        scope: Scope,
+        receive: Receive,
+        encoding: str,
+    ) -> tuple[Scope, Receive] | PlainTextResponse:
+        if encoding not in ENCODINGS:
+            return PlainTextResponse(f"Unsupported content encoding: {encoding}", 415)
+        chunks: list[bytes] = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        try:
+            body = _decompress(encoding, b"".join(chunks))
+        except (zlib.error, ValueError) as e:
+            return PlainTextResponse(f"Invalid {encoding} body: {e}", 400)
+        if len(body) > MAX_REQUEST_BYTES:
+            return PlainTextResponse("Request body too large", 413)
+        self.compression.decompressed_requests += 1
+
+        headers = MutableHeaders(scope={**scope, "headers": list(scope["headers"])})
+        del headers["content-encoding"]
+        headers["content-length"] = str(len(body))
+        sent = False
+
+        async def _receive() -> Message:
+            nonlocal sent
+            if sent:
+                # Later messages only tell of the disconnection of the client
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return {**scope, "headers": headers.raw}, _receive
@@ -0,0 +1,57 @@
+"""Limit the time the remote app is given to answer requests.
+
+Requests that are not answered before their deadline fail, and the remote app is told to
+stop working on them with a cancellation notification.
+"""
+
+import fnmatch
+from collections.abc import Mapping
+
+from mcp import types
+from mcp.shared.exceptions import McpError
+
+# Error code of requests that timed out, as used by the client sessions of the SDK
+REQUEST_TIMEOUT = 408
+
+
+class DeadlineExceededError(McpError):
+    """Raised for a request the remote app did not answer before its deadline."""
+
+    def __init__(self, method: str, tool: str, seconds: float) -> None:
+        """Create the error of a request of a method, and of a tool for tool calls."""
+        message = f"Timed out after {seconds}s waiting for {method} {tool}".rstrip()
+        super().__init__(types.ErrorData(code=REQUEST_TIMEOUT, message=message))
+
+
+class Deadlines:
+    """Seconds the remote app is given to answer requests, by method and by tool."""
+
+    def __init__(
+        self,
+        default: float | None = None,
+        methods: Mapping[str, float] | None = None,
+        tools: Mapping[str, float] | None = None,
+    ) -> None:
+        """Create deadlines for the requests to the remote app.
+
+        Args:
+            default: Deadline of the requests of methods without one. None for no deadline.
+            methods: Deadlines by method, such as tools/call.
+            tools: Deadlines of tool calls by tool name or glob pattern, over the one of
+                tools/call. The first matching pattern applies.
+
+        """
+        seconds = [default, *(methods or {}).values(), *(tools or {}).values()]
+        if any(value is not None and value <= 0 for value in seconds):
+            raise ValueError("Deadlines must be positive")
+        self.default = default
+        self.methods = dict(methods or {})
+        self.tools = dict(tools or {})
+
+    def timeout(self, method: str, tool: str = "") -> float | None:
+        """Return the seconds given to a request, None for no deadline."""
+        if tool:
+            for pattern, seconds in self.tools.items():
+                if fnmatch.fnmatchcase(tool, pattern):
+                    return seconds
+        return self.methods.get(method, self.default)
@@ -0,0 +1,33 @@
+"""Hold a value created in the background, such as a server whose backend is starting."""
+
+import typing as t
+
+import anyio
+
+T = t.TypeVar("T")
+
+
+class Deferred(t.Generic[T]):
+    """A value set once, which its users wait for until then."""
+
+    def __init__(self) -> None:
+        """Create a value that is not set yet."""
+        self._value: T | None = None
+        self._set = anyio.Event()
+
+    @property
+    def ready(self) -> bool:
+        """Return whether the value is set."""
+        return self._set.is_set()
+
+    def set(self, value: T) -> None:
+        """Set the value, waking up the users waiting for it."""
+        if self._set.is_set():
+            raise RuntimeError("The value is already set")
+        self._value = value
+        self._set.set()
+
+    async def get(self) -> T:
+        """Return the value, waiting until it is set."""
+        await self._set.wait()
+        return t.cast("T", self._value)
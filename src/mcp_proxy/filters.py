@@ -0,0 +1,165 @@
+"""Hide tools from clients, by name, by tag and by client.
+
+Rules allow tools by name or glob pattern and deny some of the allowed ones. Patterns of the
+form `tag:NAME` stand for the patterns of a tag. Clients name themselves with a header of their
+HTTP requests, and get the rules given for them or the default ones. Rules are read from a
+configuration file:
+
+    {
+        "allow": ["search_*", "tag:read"],
+        "deny": ["*_admin"],
+        "tags": {"read": ["get_*", "list_*"]},
+        "clientHeader": "X-MCP-Client",
+        "clients": {"reporting": {"allow": ["tag:read"]}}
+    }
+"""
+
+import fnmatch
+import json
+import re
+from collections import OrderedDict
+from collections.abc import Iterable, Mapping, Sequence
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+
+from mcp import types
+
+# Name of the client of the session being served, from the header of its HTTP requests
+current_client: ContextVar[str | None] = ContextVar("current_client", default=None)
+
+DEFAULT_CLIENT_HEADER = "X-MCP-Client"
+TAG_PREFIX = "tag:"
+# Number of tool names whose visibility is remembered by every rule set
+MAX_NAMES = 4096
+# Number of filtered list results kept by every rule set
+MAX_LISTS = 16
+
+
+@dataclass(frozen=True)
+class ToolRules:
+    """Tools shown to a client: the allowed ones that are not denied."""
+
+    # Names or glob patterns of the allowed tools
+    allow: tuple[str, ...] = ("*",)
+    # Names or glob patterns of the denied tools, over the allowed ones
+    deny: tuple[str, ...] = ()
+
+
+def _compile(patterns: Iterable[str], tags: Mapping[str, Sequence[str]]) -> re.Pattern[str]:
+    globs: list[str] = []
+    for pattern in patterns:
+        if not pattern.startswith(TAG_PREFIX):
+            globs.append(pattern)
+            continue
+        tag = pattern.removeprefix(TAG_PREFIX)
+        if tag not in tags:
+            msg = f"Unknown tag: {tag}"
+            raise ValueError(msg)
+        globs.extend(tags[tag])
+    # A single expression matches a name against every pattern in one pass
+    return re.compile("|".join(fnmatch.translate(glob) for glob in globs) or "(?!)")
+
+
+class _RuleIndex:
+    """Compiled rules, with the visibility of the tools they were asked about."""
+
+    def __init__(self, rules: ToolRules, tags: Mapping[str, Sequence[str]]) -> None:
+        self._allow = _compile(rules.allow, tags)
+        self._deny = _compile(rules.deny, tags)
+        self._visible: dict[str, bool] = {}
+        self._lists: OrderedDict[int, tuple[types.ServerResult, types.ServerResult]] = OrderedDict()
+
+    def visible(self, name: str) -> bool:
+        visible = self._visible.get(name)
+        if visible is None:
+            visible = self._allow.match(name) is not None and self._deny.match(name) is None
+            # Clients may call tools under any name, which are not all remembered
+            if len(self._visible) < MAX_NAMES:
+                self._visible[name] = visible
+        return visible
+
+    def filter(self, result: types.ServerResult) -> types.ServerResult | None:
+        # Results are the same object for as long as the list cache or catalog keeps them
+        entry = self._lists.get(id(result))
+        if entry is not None and entry[0] is result:
+            self._lists.move_to_end(id(result))
+            return entry[1]
+        if not isinstance(result.root, types.ListToolsResult):
+            return None
+        tools = [tool for tool in result.root.tools if self.visible(tool.name)]
+        filtered = types.ServerResult(result.root.model_copy(update={"tools": tools}))
+        self._lists[id(result)] = (result, filtered)
+        if len(self._lists) > MAX_LISTS:
+            self._lists.popitem(last=False)
+        return filtered
+
+
+class ToolFilter:
+    """Rules hiding tools, by client."""
+
+    def __init__(
+        self,
+        rules: ToolRules | None = None,
+        clients: Mapping[str, ToolRules] | None = None,
+        tags: Mapping[str, Sequence[str]] | None = None,
+        client_header: str = DEFAULT_CLIENT_HEADER,
+    ) -> None:
+        """Compile the rules of every client.
+
+        Args:
+            rules: Rules of the clients without rules of their own. Every tool is shown when
+                None.
+            clients: Rules by client name, replacing the default ones.
+            tags: Patterns of the tags used by the rules, by tag name.
+            client_header: HTTP header with the name of the client.
+
+        Raises:
+            ValueError: A rule uses a tag that is not defined.
+
+        """
+        tags = tags or {}
+        self.client_header = client_header
+        self.hidden_calls = 0
+        self.filtered_lists = 0
+        self._default = _RuleIndex(rules or ToolRules(), tags)
+        self._clients = {name: _RuleIndex(rules, tags) for name, rules in (clients or {}).items()}
+
+    def _index(self) -> _RuleIndex:
+        client = current_client.get()
+        return self._clients.get(client, self._default) if client is not None else self._default
+
+    def allows_call(self, name: str) -> bool:
+        """Return whether the current client may call a tool, counting calls of hidden ones."""
+        visible = self._index().visible(name)
+        if not visible:
+            self.hidden_calls += 1
+        return visible
+
+    def filter(self, result: types.ServerResult) -> types.ServerResult:
+        """Return a list_tools result without the tools hidden from the current client."""
+        self.filtered_lists += 1
+        return self._index().filter(result) or result
+
+    def stats(self) -> dict[str, int]:
+        """Return the counters of the filter."""
+        return {
+            "rule_sets": 1 + len(self._clients),
+            "filtered_lists": self.filtered_lists,
+            "hidden_calls": self.hidden_calls,
+        }
+
+
+def _rules(entry: Mapping[str, Sequence[str]]) -> ToolRules:
+    return ToolRules(tuple(entry.get("allow", ("*",))), tuple(entry.get("deny", ())))
+
+
+def load_tool_filter(path: Path) -> ToolFilter:
+    """Read the rules hiding tools from a configuration file."""
+    config = json.loads(path.read_text())
+    return ToolFilter(
+        _rules(config),
+        {name: _rules(entry) for name, entry in config.get("clients", {}).items()},
+        config.get("tags", {}),
+        config.get("clientHeader", DEFAULT_CLIENT_HEADER),
+    )
@@ -0,0 +1,227 @@
+"""Collect proxy metrics and render them in the Prometheus text exposition format."""
+
+import bisect
+import time
+import typing as t
+from collections import defaultdict
+from collections.abc import Awaitable, Callable, Iterable, Iterator, Mapping
+from contextlib import contextmanager
+
+from mcp import types
+
+Labels = tuple[tuple[str, str], ...]
+RequestHandler = Callable[[t.Any], Awaitable[types.ServerResult]]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def sum_stats(stats: Iterable[Mapping[str, float]]) -> dict[str, float]:
+    """Sum the counters of components of the same kind, such as the caches of many backends.
+
+    Hit ratios are computed again from the summed hits and misses.
+    """
+    total: dict[str, float] = {}
+    for counters in stats:
+        for key, value in counters.items():
+            total[key] = total.get(key, 0) + value
+    if "hit_ratio" in total:
+        lookups = total["hits"] + total["misses"]
+        total["hit_ratio"] = total["hits"] / lookups if lookups else 0.0
+    return total
+
+
+class Histogram:
+    """Cumulative histogram of observed values per label set."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """Create a histogram with the given upper bounds."""
+        self.buckets = buckets
+        self._counts: dict[Labels, list[int]] = {}
+        self._sums: dict[Labels, float] = defaultdict(float)
+
+    def observe(self, labels: Labels, value: float) -> None:
+        """Record a value."""
+        counts = self._counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def render(self, name: str) -> Iterator[str]:
+        """Yield the exposition lines of the histogram."""
+        for labels, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts, strict=True):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{name}_bucket{_format_labels(labels, (('le', le),))} {cumulative}"
+            yield f"{name}_sum{_format_labels(labels)} {self._sums[labels]}"
+            yield f"{name}_count{_format_labels(labels)} {cumulative}"
+
+
+class ProxyMetrics:
+    """Metrics of the requests handled by the proxy and of its SSE connections."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """Create a registry with no recorded values."""
+        self.requests: dict[Labels, int] = defaultdict(int)
+        self.errors: dict[Labels, int] = defaultdict(int)
+        self.in_flight: dict[Labels, int] = defaultdict(int)
+        self.timed_out: dict[Labels, int] = defaultdict(int)
+        self.cancelled: dict[Labels, int] = defaultdict(int)
+        self.request_duration = Histogram(buckets)
+        self.upstream_duration = Histogram(buckets)
+        self.queue_wait_duration = Histogram(buckets)
+        self.sse_connections = 0
+        self.sse_connections_total = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self._collectors: dict[str, Callable[[], Mapping[str, float]]] = {}
+        self._gauges: dict[str, tuple[str, Callable[[], Mapping[Labels, float]]]] = {}
+
+    @staticmethod
+    def labels(method: str, tool: str = "") -> Labels:
+        """Return the labels of a request."""
+        return (("method", method), ("tool", tool))
+
+    def register_collector(self, name: str, collect: Callable[[], Mapping[str, float]]) -> None:
+        """Export the counters returned by a callable, such as the stats of a cache."""
+        self._collectors[name] = collect
+
+    def register_gauge(
+        self,
+        name: str,
+        help_text: str,
+        collect: Callable[[], Mapping[Labels, float]],
+    ) -> None:
+        """Export the values by label set returned by a callable, such as per-session sizes."""
+        self._gauges[name] = (help_text, collect)
+
+    def instrument(self, handler: RequestHandler) -> RequestHandler:
+        """Wrap a request handler to count requests and errors and time them."""
+
+        async def _instrumented(req: t.Any) -> types.ServerResult:  # noqa: ANN401
+            tool = req.params.name if isinstance(req, types.CallToolRequest) else ""
+            labels = self.labels(req.method, tool)
+            self.requests[labels] += 1
+            self.in_flight[labels] += 1
+            start = time.perf_counter()
+            try:
+                result = await handler(req)
+            except Exception:
+                self.errors[labels] += 1
+                raise
+            finally:
+                self.in_flight[labels] -= 1
+                self.request_duration.observe(labels, time.perf_counter() - start)
+            if isinstance(result.root, types.CallToolResult) and result.root.isError:
+                self.errors[labels] += 1
+            return result
+
+        return _instrumented
+
+    @contextmanager
+    def time_upstream(self, method: str, tool: str = "") -> Iterator[None]:
+        """Time a call to the remote app."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.upstream_duration.observe(self.labels(method, tool), time.perf_counter() - start)
+
+    def render(self) -> str:
+        """Return the metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+
+        def _family(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def _per_label(name: str, kind: str, help_text: str, values: dict[Labels, int]) -> None:
+            _family(name, kind, help_text)
+            lines.extend(
+                f"{name}{_format_labels(labels)} {value}" for labels, value in values.items()
+            )
+
+        _per_label(
+            "mcp_proxy_requests_total",
+            "counter",
+            "Requests handled by the proxy.",
+            self.requests,
+        )
+        _per_label(
+            "mcp_proxy_request_errors_total",
+            "counter",
+            "Requests that failed or returned a tool error.",
+            self.errors,
+        )
+        _per_label(
+            "mcp_proxy_requests_in_flight",
+            "gauge",
+            "Requests currently being handled.",
+            self.in_flight,
+        )
+        _per_label(
+            "mcp_proxy_requests_timed_out_total",
+            "counter",
+            "Requests to the remote app cancelled when their deadline passed.",
+            self.timed_out,
+        )
+        _per_label(
+            "mcp_proxy_requests_cancelled_total",
+            "counter",
+            "Requests to the remote app cancelled by their client or its disconnection.",
+            self.cancelled,
+        )
+        _family(
+            "mcp_proxy_request_duration_seconds",
+            "histogram",
+            "Total time spent by the proxy on a request.",
+        )
+        lines.extend(self.request_duration.render("mcp_proxy_request_duration_seconds"))
+        _family(
+            "mcp_proxy_upstream_duration_seconds",
+            "histogram",
+            "Time spent waiting on the remote app.",
+        )
+        lines.extend(self.upstream_duration.render("mcp_proxy_upstream_duration_seconds"))
+        _family(
+            "mcp_proxy_queue_wait_seconds",
+            "histogram",
+            "Time spent waiting for a concurrency slot before calling the remote app.",
+        )
+        lines.extend(self.queue_wait_duration.render("mcp_proxy_queue_wait_seconds"))
+
+        _family("mcp_proxy_sse_connections", "gauge", "Open SSE connections.")
+        lines.append(f"mcp_proxy_sse_connections {self.sse_connections}")
+        _family("mcp_proxy_sse_connections_total", "counter", "SSE connections accepted.")
+        lines.append(f"mcp_proxy_sse_connections_total {self.sse_connections_total}")
+        _family("mcp_proxy_received_bytes_total", "counter", "Bytes received from clients.")
+        lines.append(f"mcp_proxy_received_bytes_total {self.bytes_received}")
+        _family("mcp_proxy_sent_bytes_total", "counter", "Bytes sent to clients.")
+        lines.append(f"mcp_proxy_sent_bytes_total {self.bytes_sent}")
+
+        for name, (help_text, collect_labeled) in self._gauges.items():
+            metric = f"mcp_proxy_{name}"
+            _family(metric, "gauge", help_text)
+            lines.extend(
+                f"{metric}{_format_labels(labels)} {value}"
+                for labels, value in collect_labeled().items()
+            )
+
+        for name, collect in self._collectors.items():
+            for stat, value in collect().items():
+                metric = f"mcp_proxy_{name}_{stat}"
+                _family(metric, "gauge", f"{stat.capitalize()} of the {name.replace('_', ' ')}.")
+                lines.append(f"{metric} {value}")
+
+        return "\n".join(lines) + "\n"
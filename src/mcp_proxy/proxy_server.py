@@ -3,40 +3,344 @@
 This server is created independent of any transport mechanism.
 """
 
+import contextlib
+import logging
 import typing as t
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass, replace
+from pathlib import Path
 
-from mcp import server, types
+import anyio
+from mcp import types
 from mcp.client.session import ClientSession
+from mcp.shared.context import RequestContext
+
+from .admission import AdmissionController
+from .cache import ResourceCache, ToolResultCache, TTLCache
+from .catalog import LISTS, ListCatalog, list_request, request_cursor
+from .deadlines import DeadlineExceededError, Deadlines
+from .filters import ToolFilter
+from .metrics import ProxyMetrics
+from .recording import Recorder
+from .relay import RELAY_TIMEOUT, RelayServer, current_session
+from .single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+T = t.TypeVar("T")
+
+RemoteNotificationHandler = Callable[[t.Any], Awaitable[None]]
+ListResult = types.ListPromptsResult | types.ListResourcesResult | types.ListToolsResult
+
+# Results relayed as they are received: EmptyResult keeps their fields without validating them,
+# so their contents are not converted to typed models and back.
+RawResult = types.EmptyResult
+
+# List requests whose cached results become stale with each notification.
+LIST_CHANGED_NOTIFICATIONS: dict[type, type] = {
+    types.PromptListChangedNotification: types.ListPromptsRequest,
+    types.ResourceListChangedNotification: types.ListResourcesRequest,
+    types.ToolListChangedNotification: types.ListToolsRequest,
+}
+
+
+# Components of the options that every server of a remote app gets its own copy of, with
+# with_own_caches, and whose counters are summed across the servers
+PER_BACKEND_COMPONENTS = (
+    "list_cache",
+    "list_catalog",
+    "tool_cache",
+    "resource_cache",
+    "single_flight",
+)
+
+
+@dataclass
+class ProxyOptions:
+    """Optional features of the proxy server."""
+
+    # Cache for the first pages of list_prompts, list_resources and list_tools results, keyed
+    # by request type
+    list_cache: TTLCache[type, types.ServerResult] | None = None
+    # Serves every page of the lists from a catalog prefetched in the background
+    list_catalog: ListCatalog | None = None
+    # Cache for call_tool results of the read-only tools it allows
+    tool_cache: ToolResultCache | None = None
+    # Cache for read_resource results, invalidated by resources/updated notifications
+    resource_cache: ResourceCache | None = None
+    # Shares one remote call among concurrent identical list, get_prompt and read_resource calls
+    single_flight: SingleFlight | None = None
+    # Records request counts and latencies of the handlers and of the remote app
+    metrics: ProxyMetrics | None = None
+    # Limits the number of concurrent calls to the remote app
+    admission: AdmissionController | None = None
+    # Cancels the calls to the remote app that are not answered in time
+    deadlines: Deadlines | None = None
+    # Hides tools from clients, in list_tools results and tool calls
+    tool_filter: ToolFilter | None = None
+    # Appends every request, with its timing and result, to a file to replay them later
+    recorder: Recorder | None = None
+    # Relays the results of tool calls and resource reads without validating their contents,
+    # except for the ones the caches store
+    passthrough: bool = False
+    # Relays JSON-RPC messages to the remote app without dispatching them, see raw_proxy.
+    # Only the caches, deadlines and metrics apply then
+    raw_relay: bool = False
+    # Tells the remote app to stop working on the requests abandoned by their client, such as
+    # when it disconnects, and not only on the ones past their deadline. Servers built on
+    # mcp 1.5 end their session when they receive such a cancellation
+    cancel_upstream: bool = False
+
+    def with_own_caches(self, tool_cache_dir: Path | None = None) -> "ProxyOptions":
+        """Return a copy of the options with empty caches of the same settings.
+
+        Servers of different remote apps must neither share cached results nor coalesce
+        their calls, so each of them gets its own caches, list catalog and single flight.
+
+        Args:
+            tool_cache_dir: Directory of the on-disk tier of the tool result cache. Results
+                are kept in memory only when None.
+
+        """
+        list_cache = self.list_cache
+        list_catalog = self.list_catalog
+        tool_cache = self.tool_cache
+        resource_cache = self.resource_cache
+        # Empty caches are falsy, as they have a length, so they are compared with None
+        return replace(
+            self,
+            list_cache=TTLCache(list_cache.ttl, list_cache.max_entries)
+            if list_cache is not None
+            else None,
+            list_catalog=ListCatalog(list_catalog.page_size) if list_catalog is not None else None,
+            tool_cache=ToolResultCache(
+                tool_cache.tools,
+                ttl=tool_cache.memory.ttl,
+                max_bytes=tool_cache.memory.max_bytes or 0,
+                directory=tool_cache_dir,
+                max_disk_bytes=tool_cache.max_disk_bytes,
+            )
+            if tool_cache is not None
+            else None,
+            resource_cache=ResourceCache(
+                resource_cache.memory.max_bytes or 0,
+                resource_cache.ttls,
+                resource_cache.default_ttl,
+            )
+            if resource_cache is not None
+            else None,
+            single_flight=SingleFlight() if self.single_flight is not None else None,
+        )
 
 
-async def create_proxy_server(remote_app: ClientSession) -> server.Server[object]:  # noqa: C901
+class ProxyServer(RelayServer):
+    """A server that forwards requests to a remote app and relays its notifications."""
+
+    def __init__(self, name: str, remote_app: ClientSession) -> None:
+        """Create a server named after the remote app."""
+        super().__init__(name)
+        self.remote_app = remote_app
+        self.remote_notification_handlers: dict[type, RemoteNotificationHandler] = {}
+        # Tasks running alongside the handling of remote messages, such as prefetching
+        self.background_tasks: list[Callable[[], Awaitable[None]]] = []
+
+    async def handle_remote_messages(self) -> None:
+        """Dispatch and relay notifications sent by the remote app until its stream is closed.
+
+        The remote session blocks while its incoming messages are not consumed, so this
+        has to run for as long as the server is in use. The background tasks run meanwhile.
+        """
+        async with anyio.create_task_group() as tg:
+            for task in self.background_tasks:
+                tg.start_soon(task)
+            async for message in self.remote_app.incoming_messages:
+                if isinstance(message, Exception):
+                    logger.warning("Error received from the remote app: %s", message)
+                    continue
+                if not isinstance(message, types.ServerNotification):
+                    continue
+                notification = message.root
+                handler = self.remote_notification_handlers.get(type(notification))
+                try:
+                    if handler is not None:
+                        await handler(notification)
+                    await self.client_sessions.relay(notification)
+                except Exception:
+                    logger.exception("Uncaught exception in remote notification handler")
+            tg.cancel_scope.cancel()
+
+
+async def create_proxy_server(  # noqa: C901, PLR0912, PLR0915
+    remote_app: ClientSession,
+    options: ProxyOptions | None = None,
+) -> ProxyServer:
     """Create a server instance from a remote app."""
+    options = options or ProxyOptions()
     response = await remote_app.initialize()
     capabilities = response.capabilities
 
-    app: server.Server[object] = server.Server(name=response.serverInfo.name)
+    app = ProxyServer(response.serverInfo.name, remote_app)
+
+    async def _create_message(
+        context: RequestContext[ClientSession, t.Any],
+        params: types.CreateMessageRequestParams,
+    ) -> types.CreateMessageResult | types.ErrorData:
+        return await app.client_sessions.create_message(context, params)
+
+    async def _list_roots(
+        context: RequestContext[ClientSession, t.Any],
+    ) -> types.ListRootsResult | types.ErrorData:
+        return await app.client_sessions.list_roots(context)
+
+    # The remote session is opened before the server exists, so the callbacks answering the
+    # requests of the remote app are only set now
+    remote_app._sampling_callback = _create_message  # noqa: SLF001
+    remote_app._list_roots_callback = _list_roots  # noqa: SLF001
+    list_cache = options.list_cache
+    list_catalog = options.list_catalog
+    single_flight = options.single_flight
+    metrics = options.metrics
+
+    admission = options.admission
+    deadlines = options.deadlines
+    tool_filter = options.tool_filter
+
+    async def _cancellable(
+        call_remote: Callable[[], Awaitable[T]],
+        notify: Callable[[], bool],
+    ) -> T:
+        # The request sent by the call takes the next ID of the remote session
+        request_id = remote_app._request_id  # noqa: SLF001
+        try:
+            return await call_remote()
+        except anyio.get_cancelled_exc_class():
+            if not notify():
+                raise
+            # The remote app is told to stop working on a request nobody waits for anymore
+            with (
+                anyio.move_on_after(RELAY_TIMEOUT, shield=True),
+                contextlib.suppress(anyio.BrokenResourceError, anyio.ClosedResourceError),
+            ):
+                if remote_app._request_id > request_id:  # noqa: SLF001
+                    await remote_app.send_notification(
+                        types.ClientNotification(
+                            types.CancelledNotification(
+                                method="notifications/cancelled",
+                                params=types.CancelledNotificationParams(requestId=request_id),
+                            ),
+                        ),
+                    )
+            raise
+
+    async def _timed(method: str, call_remote: Callable[[], Awaitable[T]], tool: str) -> T:
+        if metrics is None:
+            return await call_remote()
+        with metrics.time_upstream(method, tool):
+            return await call_remote()
+
+    async def _admitted(method: str, call_remote: Callable[[], Awaitable[T]], tool: str) -> T:
+        if admission is None:
+            return await _timed(method, call_remote, tool)
+        async with admission.admit(method, tool) as waited:
+            if metrics is not None:
+                metrics.queue_wait_duration.observe(metrics.labels(method, tool), waited)
+            return await _timed(method, call_remote, tool)
+
+    async def _upstream(method: str, call_remote: Callable[[], Awaitable[T]], tool: str = "") -> T:
+        timeout = deadlines.timeout(method, tool) if deadlines is not None else None
+        with anyio.move_on_after(timeout) as deadline:
+            try:
+                return await _admitted(
+                    method,
+                    # A shared remote session may not survive the cancellation of a request, so
+                    # only the ones past their deadline are cancelled unless told otherwise
+                    lambda: _cancellable(
+                        call_remote,
+                        lambda: options.cancel_upstream or deadline.cancel_called,
+                    ),
+                    tool,
+                )
+            except anyio.get_cancelled_exc_class():
+                if metrics is not None and not deadline.cancel_called:
+                    metrics.cancelled[metrics.labels(method, tool)] += 1
+                raise
+        if metrics is not None:
+            metrics.timed_out[metrics.labels(method, tool)] += 1
+        raise DeadlineExceededError(method, tool, t.cast("float", timeout))
+
+    async def _shared(method: str, key: Hashable, call_remote: Callable[[], Awaitable[T]]) -> T:
+        if single_flight is None:
+            return await _upstream(method, call_remote)
+        return await single_flight.do(key, lambda: _upstream(method, call_remote))
+
+    async def _cached_list(
+        request_type: type,
+        method: str,
+        list_remote: Callable[[], Awaitable[ListResult]],
+    ) -> types.ServerResult:
+        cached = list_cache.get(request_type) if list_cache is not None else None
+        if cached is not None:
+            return cached
+
+        async def _fetch() -> ListResult:
+            # Lists fetched while they were invalidated are returned, but not kept
+            generation = list_cache.generation if list_cache is not None else 0
+            result = await list_remote()
+            if list_cache is not None:
+                list_cache.set(request_type, types.ServerResult(result), generation=generation)
+            return result
+
+        return types.ServerResult(await _shared(method, request_type, _fetch))
+
+    def _list_remote(request_type: type, cursor: str | None) -> Callable[[], Awaitable[ListResult]]:
+        request = list_request(request_type, cursor)
+        return lambda: remote_app.send_request(request, LISTS[request_type][1])
+
+    async def _list_page(request_type: type, method: str, cursor: str | None) -> types.ServerResult:
+        if list_catalog is not None:
+            page = list_catalog.page(request_type, cursor)
+            if page is not None:
+                return page
+        if cursor is None:
+            return await _cached_list(request_type, method, _list_remote(request_type, None))
+        # Only first pages are cached, the cursors of the other ones may expire
+        result = await _shared(method, (request_type, cursor), _list_remote(request_type, cursor))
+        return types.ServerResult(result)
+
+    async def _list(req: t.Any) -> types.ServerResult:  # noqa: ANN401
+        result = await _list_page(type(req), req.method, request_cursor(req))
+        if tool_filter is not None and isinstance(req, types.ListToolsRequest):
+            return tool_filter.filter(result)
+        return result
 
-    if capabilities.prompts:
+    if list_cache is not None or list_catalog is not None:
 
-        async def _list_prompts(_: t.Any) -> types.ServerResult:  # noqa: ANN401
-            result = await remote_app.list_prompts()
-            return types.ServerResult(result)
+        async def _invalidate_list(notification: t.Any) -> None:  # noqa: ANN401
+            request_type = LIST_CHANGED_NOTIFICATIONS[type(notification)]
+            if list_cache is not None:
+                list_cache.invalidate(lambda key: key is request_type)
+            if list_catalog is not None:
+                list_catalog.invalidate(request_type)
 
-        app.request_handlers[types.ListPromptsRequest] = _list_prompts
+        for notification_type in LIST_CHANGED_NOTIFICATIONS:
+            app.remote_notification_handlers[notification_type] = _invalidate_list
+
+    if capabilities.prompts:
+        app.request_handlers[types.ListPromptsRequest] = _list
 
         async def _get_prompt(req: types.GetPromptRequest) -> types.ServerResult:
-            result = await remote_app.get_prompt(req.params.name, req.params.arguments)
+            name, arguments = req.params.name, req.params.arguments
+            result = await _shared(
+                req.method,
+                (types.GetPromptRequest, name, tuple(sorted((arguments or {}).items()))),
+                lambda: remote_app.get_prompt(name, arguments),
+            )
             return types.ServerResult(result)
 
         app.request_handlers[types.GetPromptRequest] = _get_prompt
 
     if capabilities.resources:
-
-        async def _list_resources(_: t.Any) -> types.ServerResult:  # noqa: ANN401
-            result = await remote_app.list_resources()
-            return types.ServerResult(result)
-
-        app.request_handlers[types.ListResourcesRequest] = _list_resources
+        app.request_handlers[types.ListResourcesRequest] = _list
 
         # list_resource_templates() is not implemented in the client
         # async def _list_resource_templates(_: t.Any) -> types.ServerResult:
@@ -45,16 +349,54 @@ async def create_proxy_server(remote_app: ClientSession) -> server.Server[object
 
         # app.request_handlers[types.ListResourceTemplatesRequest] = _list_resource_templates
 
+        resource_cache = options.resource_cache
+
         async def _read_resource(req: types.ReadResourceRequest) -> types.ServerResult:
-            result = await remote_app.read_resource(req.params.uri)
-            return types.ServerResult(result)
+            uri = req.params.uri
+            if resource_cache is None and options.passthrough:
+                request = types.ReadResourceRequest(method=req.method, params=req.params)
+                raw = await _shared(
+                    req.method,
+                    (types.ReadResourceRequest, str(uri)),
+                    lambda: remote_app.send_request(types.ClientRequest(request), RawResult),
+                )
+                return types.ServerResult(raw)
+            if resource_cache is None:
+                result = await _shared(
+                    req.method,
+                    (types.ReadResourceRequest, str(uri)),
+                    lambda: remote_app.read_resource(uri),
+                )
+                return types.ServerResult(result)
+            cached = resource_cache.get(str(uri))
+            if cached is not None:
+                # Contents are served as they were serialized when stored
+                return types.ServerResult(RawResult.model_validate(cached))
+            generation = resource_cache.generation
+            request = types.ReadResourceRequest(method=req.method, params=req.params)
+            raw = await _shared(
+                req.method,
+                (types.ReadResourceRequest, str(uri)),
+                lambda: remote_app.send_request(types.ClientRequest(request), RawResult),
+            )
+            resource_cache.set(str(uri), raw, generation)
+            return types.ServerResult(raw)
 
         app.request_handlers[types.ReadResourceRequest] = _read_resource
 
+        if resource_cache is not None:
+
+            async def _invalidate_resource(notification: types.ResourceUpdatedNotification) -> None:
+                resource_cache.invalidate(str(notification.params.uri))
+
+            app.remote_notification_handlers[types.ResourceUpdatedNotification] = (
+                _invalidate_resource
+            )
+
     if capabilities.logging:
 
         async def _set_logging_level(req: types.SetLevelRequest) -> types.ServerResult:
-            await remote_app.set_logging_level(req.params.level)
+            await _upstream(req.method, lambda: remote_app.set_logging_level(req.params.level))
             return types.ServerResult(types.EmptyResult())
 
         app.request_handlers[types.SetLevelRequest] = _set_logging_level
@@ -62,31 +404,75 @@ async def create_proxy_server(remote_app: ClientSession) -> server.Server[object
     if capabilities.resources:
 
         async def _subscribe_resource(req: types.SubscribeRequest) -> types.ServerResult:
-            await remote_app.subscribe_resource(req.params.uri)
+            await _upstream(req.method, lambda: remote_app.subscribe_resource(req.params.uri))
+            if resource_cache is not None:
+                resource_cache.subscribe(str(req.params.uri))
             return types.ServerResult(types.EmptyResult())
 
         app.request_handlers[types.SubscribeRequest] = _subscribe_resource
 
         async def _unsubscribe_resource(req: types.UnsubscribeRequest) -> types.ServerResult:
-            await remote_app.unsubscribe_resource(req.params.uri)
+            if resource_cache is not None:
+                resource_cache.unsubscribe(str(req.params.uri))
+            await _upstream(req.method, lambda: remote_app.unsubscribe_resource(req.params.uri))
             return types.ServerResult(types.EmptyResult())
 
         app.request_handlers[types.UnsubscribeRequest] = _unsubscribe_resource
 
     if capabilities.tools:
-
-        async def _list_tools(_: t.Any) -> types.ServerResult:  # noqa: ANN401
-            tools = await remote_app.list_tools()
-            return types.ServerResult(tools)
-
-        app.request_handlers[types.ListToolsRequest] = _list_tools
+        app.request_handlers[types.ListToolsRequest] = _list
+
+        tool_cache = options.tool_cache
+
+        async def _call_remote_tool(
+            name: str,
+            arguments: dict[str, t.Any],
+            progress_token: str | None = None,
+        ) -> types.CallToolResult | RawResult:
+            meta = {} if progress_token is None else {"_meta": {"progressToken": progress_token}}
+            params = types.CallToolRequestParams.model_validate(
+                {"name": name, "arguments": arguments, **meta},
+            )
+            request = types.ClientRequest(types.CallToolRequest(method="tools/call", params=params))
+
+            def _call() -> Awaitable[types.CallToolResult]:
+                return remote_app.send_request(request, types.CallToolResult)
+
+            def _relay() -> Awaitable[RawResult]:
+                return remote_app.send_request(request, RawResult)
+
+            if tool_cache is None or not tool_cache.cacheable(name):
+                return await _upstream("tools/call", _relay if options.passthrough else _call, name)
+            result = await tool_cache.get(name, arguments)
+            if result is None:
+                result = await _upstream("tools/call", _call, name)
+                await tool_cache.set(name, arguments, result)
+            return result
 
         async def _call_tool(req: types.CallToolRequest) -> types.ServerResult:
-            try:
-                result = await remote_app.call_tool(
-                    req.params.name,
-                    (req.params.arguments or {}),
+            # Hidden tools are rejected as if the remote app did not have them
+            if tool_filter is not None and not tool_filter.allows_call(req.params.name):
+                return types.ServerResult(
+                    types.CallToolResult(
+                        content=[
+                            types.TextContent(type="text", text=f"Unknown tool: {req.params.name}"),
+                        ],
+                        isError=True,
+                    ),
                 )
+            meta = req.params.meta
+            session = current_session()
+            try:
+                if meta is None or meta.progressToken is None or session is None:
+                    result = await _call_remote_tool(req.params.name, req.params.arguments or {})
+                    return types.ServerResult(result)
+                # Progress notifications of the remote app are relayed to the session
+                with app.client_sessions.progress(session, meta.progressToken) as token:
+                    result = await _call_remote_tool(
+                        req.params.name,
+                        req.params.arguments or {},
+                        token,
+                    )
                 return types.ServerResult(result)
             except Exception as e:  # noqa: BLE001
                 return types.ServerResult(
@@ -107,13 +493,48 @@ async def create_proxy_server(remote_app: ClientSession) -> server.Server[object
 
     app.notification_handlers[types.ProgressNotification] = _send_progress_notification
 
+    async def _send_roots_list_changed(_: t.Any) -> None:  # noqa: ANN401
+        await remote_app.send_roots_list_changed()
+
+    app.notification_handlers[types.RootsListChangedNotification] = _send_roots_list_changed
+
     async def _complete(req: types.CompleteRequest) -> types.ServerResult:
-        result = await remote_app.complete(
-            req.params.ref,
-            req.params.argument.model_dump(),
+        result = await _upstream(
+            req.method,
+            lambda: remote_app.complete(req.params.ref, req.params.argument.model_dump()),
         )
         return types.ServerResult(result)
 
     app.request_handlers[types.CompleteRequest] = _complete
 
+    if list_catalog is not None:
+
+        async def _fetch_page(request_type: type, cursor: str | None) -> ListResult:
+            return await _upstream(LISTS[request_type][0], _list_remote(request_type, cursor))
+
+        request_types = [
+            request_type for request_type in LISTS if request_type in app.request_handlers
+        ]
+        app.background_tasks.append(lambda: list_catalog.run(_fetch_page, request_types))
+
+    if options.recorder is not None:
+        for request_type, handler in app.request_handlers.items():
+            app.request_handlers[request_type] = options.recorder.instrument(handler)
+
+    if metrics is not None:
+        for request_type, handler in app.request_handlers.items():
+            app.request_handlers[request_type] = metrics.instrument(handler)
+        for name, component in (
+            ("list_cache", list_cache),
+            ("list_catalog", list_catalog),
+            ("tool_cache", options.tool_cache),
+            ("resource_cache", options.resource_cache),
+            ("single_flight", single_flight),
+            ("admission", admission),
+            ("tool_filter", tool_filter),
+            ("recorder", options.recorder),
+        ):
+            if component is not None:
+                metrics.register_collector(name, component.stats)
+
     return app
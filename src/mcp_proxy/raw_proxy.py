@@ -0,0 +1,665 @@
+"""Relay JSON-RPC messages between the clients of the proxy and a remote app as they are.
+
+The server created by `create_proxy_server` decodes every message into a typed request,
+dispatches it to a handler, and sends it again through a client session, whose response is
+decoded and encoded once more. The raw proxy forwards the messages between the streams of
+the transports instead. It only rewrites request IDs, so that many sessions can share the
+remote app, and keeps a table of the requests waiting for a response. Methods the proxy has
+to understand, such as the ones answered from the caches, are handled by typed hooks, and
+everything else is forwarded without being validated.
+"""
+
+import contextlib
+import heapq
+import itertools
+import logging
+import math
+import time
+import typing as t
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+import anyio
+from anyio.abc import TaskGroup
+from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
+from mcp import types
+from mcp.server import Server
+from mcp.server.models import InitializationOptions
+from mcp.shared.exceptions import McpError
+from mcp.shared.version import SUPPORTED_PROTOCOL_VERSIONS
+
+from .deadlines import REQUEST_TIMEOUT, DeadlineExceededError
+from .metrics import Labels, ProxyMetrics
+from .proxy_server import ListResult, ProxyOptions
+from .relay import RELAY_TIMEOUT, Subscriptions
+
+logger = logging.getLogger(__name__)
+
+ReadStream = MemoryObjectReceiveStream[types.JSONRPCMessage | Exception]
+WriteStream = MemoryObjectSendStream[types.JSONRPCMessage]
+ResultHook = Callable[[dict[str, t.Any]], Awaitable[None]]
+
+# Request and result types of the list methods, the request types keying the list cache
+LIST_METHODS: dict[str, tuple[type, type[ListResult]]] = {
+    "prompts/list": (types.ListPromptsRequest, types.ListPromptsResult),
+    "resources/list": (types.ListResourcesRequest, types.ListResourcesResult),
+    "tools/list": (types.ListToolsRequest, types.ListToolsResult),
+}
+
+# List requests whose cached results become stale with each notification
+LIST_CHANGED_METHODS: dict[str, type] = {
+    "notifications/prompts/list_changed": types.ListPromptsRequest,
+    "notifications/resources/list_changed": types.ListResourcesRequest,
+    "notifications/tools/list_changed": types.ListToolsRequest,
+}
+
+
+@dataclass(eq=False)
+class _Session:
+    """A session of a client of the proxy."""
+
+    write_stream: WriteStream
+    # IDs of its requests forwarded to the remote app, by their ID in the session
+    requests: dict[types.RequestId, int] = field(default_factory=dict)
+    # Cancelled to close the session
+    scope: anyio.CancelScope = field(default_factory=anyio.CancelScope)
+
+
+@dataclass(eq=False)
+class _Pending:
+    """A request forwarded to the remote app, waiting for its response."""
+
+    # Session that sent the request, None for requests of the proxy or of closed sessions
+    session: _Session | None
+    request_id: types.RequestId
+    labels: Labels
+    # Progress token of the request in its session, replaced by its ID upstream
+    progress_token: types.ProgressToken | None = None
+    # Called with the result of the request, to cache it
+    on_result: ResultHook | None = None
+    # Called when the request fails
+    on_error: Callable[[], object] | None = None
+    start: float = field(default_factory=time.perf_counter)
+
+
+RequestHook = Callable[[_Session, types.JSONRPCRequest], Awaitable[bool]]
+
+
+def _with_id(message: types.JSONRPCMessage, request_id: types.RequestId) -> types.JSONRPCMessage:
+    return types.JSONRPCMessage(message.root.model_copy(update={"id": request_id}))
+
+
+def _error(request_id: types.RequestId, code: int, message: str) -> types.JSONRPCMessage:
+    return types.JSONRPCMessage(
+        types.JSONRPCError(
+            jsonrpc="2.0",
+            id=request_id,
+            error=types.ErrorData(code=code, message=message),
+        ),
+    )
+
+
+def _dump(result: types.Result | types.ServerResult) -> dict[str, t.Any]:
+    return result.model_dump(by_alias=True, mode="json", exclude_none=True)
+
+
+class RawProxyServer(Server[object]):
+    """A server relaying the JSON-RPC messages of its sessions to a remote app.
+
+    It is served like any other server, with `run`, while `handle_remote_messages` relays
+    the messages of the remote app.
+    """
+
+    def __init__(
+        self,
+        read_stream: ReadStream,
+        write_stream: WriteStream,
+        initialize_result: dict[str, t.Any],
+        options: ProxyOptions | None = None,
+    ) -> None:
+        """Create a server for a remote app already initialized over the given streams."""
+        super().__init__(types.InitializeResult.model_validate(initialize_result).serverInfo.name)
+        self.initialize_result = initialize_result
+        self.options = options or ProxyOptions()
+        self._read_stream = read_stream
+        self._write_stream = write_stream
+        self._ids = itertools.count(1)
+        self._pending: dict[types.RequestId, _Pending] = {}
+        # Requests of the remote app relayed to a session: their ID upstream and the session,
+        # by their ID in the session
+        self._remote_requests: dict[types.RequestId, tuple[types.RequestId, _Session]] = {}
+        # Sessions by order of activity, the most recently active last
+        self._sessions: dict[_Session, None] = {}
+        self.subscriptions = Subscriptions[_Session]()
+        # Deadlines of the pending requests and their IDs upstream, the earliest first
+        self._expiries: list[tuple[float, int]] = []
+        self._expiry_added = anyio.Event()
+
+        self.request_hooks: dict[str, RequestHook] = {
+            "initialize": self._initialize,
+            "ping": self._ping,
+            "resources/subscribe": self._subscribe,
+            "resources/unsubscribe": self._unsubscribe,
+        }
+        if self.options.list_cache is not None:
+            for method in LIST_METHODS:
+                self.request_hooks[method] = self._cached_list
+        if self.options.resource_cache is not None:
+            self.request_hooks["resources/read"] = self._cached_read
+        if self.options.tool_cache is not None:
+            self.request_hooks["tools/call"] = self._cached_call
+
+    @property
+    def _metrics(self) -> ProxyMetrics | None:
+        return self.options.metrics
+
+    async def _send(self, session: _Session, message: types.JSONRPCMessage) -> None:
+        if session.scope.cancel_called:
+            return
+        # A client not reading its messages must not hold up the remote app
+        with anyio.move_on_after(RELAY_TIMEOUT) as scope:
+            try:
+                await session.write_stream.send(message)
+            except (anyio.BrokenResourceError, anyio.ClosedResourceError):
+                logger.debug("Session closed before a message could be relayed")
+        if not scope.cancelled_caught:
+            return
+        if isinstance(message.root, types.JSONRPCNotification):
+            logger.warning("Dropped a %s notification for a slow session", message.root.method)
+            return
+        # Dropping a response or a request would leave one of the peers waiting for it forever
+        logger.warning("Closing a session that did not read its messages for %ss", RELAY_TIMEOUT)
+        session.scope.cancel()
+
+    async def _respond(
+        self,
+        session: _Session,
+        request: types.JSONRPCRequest,
+        result: dict[str, t.Any],
+    ) -> bool:
+        await self._send(
+            session,
+            types.JSONRPCMessage(
+                types.JSONRPCResponse(jsonrpc="2.0", id=request.id, result=result),
+            ),
+        )
+        return False
+
+    async def _forward(
+        self,
+        session: _Session | None,
+        request: types.JSONRPCRequest,
+        on_result: ResultHook | None = None,
+        on_error: Callable[[], object] | None = None,
+    ) -> bool:
+        """Send a request to the remote app under a new ID, returning True."""
+        upstream_id = next(self._ids)
+        params = request.params
+        meta = params.get("_meta") if params is not None else None
+        progress_token = meta.get("progressToken") if isinstance(meta, dict) else None
+        if params is not None and meta is not None and progress_token is not None:
+            # Tokens of different sessions may be equal, so the ID upstream is used instead
+            params = {**params, "_meta": {**meta, "progressToken": upstream_id}}
+        pending = _Pending(
+            session,
+            request.id,
+            self._labels(request),
+            progress_token,
+            on_result,
+            on_error,
+        )
+        self._pending[upstream_id] = pending
+        if session is not None:
+            session.requests[request.id] = upstream_id
+        if self._metrics is not None:
+            self._metrics.in_flight[pending.labels] += 1
+        deadlines = self.options.deadlines
+        timeout = deadlines.timeout(*dict(pending.labels).values()) if deadlines else None
+        if timeout is not None:
+            heapq.heappush(self._expiries, (anyio.current_time() + timeout, upstream_id))
+            if self._expiries[0][1] == upstream_id:
+                self._expiry_added.set()
+        try:
+            await self._write_stream.send(
+                types.JSONRPCMessage(
+                    request.model_copy(update={"id": upstream_id, "params": params}),
+                ),
+            )
+        except (anyio.BrokenResourceError, anyio.ClosedResourceError):
+            await self._fail(upstream_id, "Connection to the server closed")
+        return True
+
+    @staticmethod
+    def _labels(request: types.JSONRPCRequest) -> Labels:
+        tool = ""
+        if request.method == "tools/call" and request.params is not None:
+            tool = str(request.params.get("name", ""))
+        return ProxyMetrics.labels(request.method, tool)
+
+    def _observe(self, labels: Labels, start: float, *, error: bool) -> None:
+        if self._metrics is None:
+            return
+        self._metrics.request_duration.observe(labels, time.perf_counter() - start)
+        if error:
+            self._metrics.errors[labels] += 1
+
+    def _complete(self, upstream_id: types.RequestId, *, error: bool) -> _Pending | None:
+        pending = self._pending.pop(upstream_id, None)
+        if pending is None:
+            return None
+        if pending.session is not None:
+            pending.session.requests.pop(pending.request_id, None)
+        if self._metrics is not None:
+            self._metrics.in_flight[pending.labels] -= 1
+            self._metrics.upstream_duration.observe(
+                pending.labels,
+                time.perf_counter() - pending.start,
+            )
+        self._observe(pending.labels, pending.start, error=error)
+        if error and pending.on_error is not None:
+            pending.on_error()
+        return pending
+
+    async def _fail(self, upstream_id: types.RequestId, message: str) -> None:
+        pending = self._complete(upstream_id, error=True)
+        if pending is not None and pending.session is not None:
+            await self._send(
+                pending.session,
+                _error(pending.request_id, types.INTERNAL_ERROR, message),
+            )
+
+    async def _cancel(
+        self,
+        upstream_id: types.RequestId,
+        reason: str,
+        *,
+        notify: bool = True,
+    ) -> _Pending | None:
+        """Stop waiting for a request and tell the remote app to stop working on it if notify."""
+        pending = self._complete(upstream_id, error=False)
+        if pending is None or not notify:
+            return pending
+        with contextlib.suppress(anyio.BrokenResourceError, anyio.ClosedResourceError):
+            await self._write_stream.send(
+                types.JSONRPCMessage(
+                    types.JSONRPCNotification(
+                        jsonrpc="2.0",
+                        method="notifications/cancelled",
+                        params={"requestId": upstream_id, "reason": reason},
+                    ),
+                ),
+            )
+        return pending
+
+    async def _expire_requests(self) -> None:
+        """Cancel the requests the remote app did not answer before their deadline."""
+        while True:
+            self._expiry_added = anyio.Event()
+            delay = self._expiries[0][0] - anyio.current_time() if self._expiries else math.inf
+            with anyio.move_on_after(delay):
+                await self._expiry_added.wait()
+            while self._expiries and self._expiries[0][0] <= anyio.current_time():
+                _, upstream_id = heapq.heappop(self._expiries)
+                pending = await self._cancel(upstream_id, "Request timed out")
+                if pending is None:
+                    continue
+                if self._metrics is not None:
+                    self._metrics.timed_out[pending.labels] += 1
+                    self._metrics.errors[pending.labels] += 1
+                if pending.on_error is not None:
+                    pending.on_error()
+                if pending.session is not None:
+                    method, tool = dict(pending.labels).values()
+                    seconds = self.options.deadlines.timeout(method, tool)  # type: ignore[union-attr]
+                    error = DeadlineExceededError(method, tool, t.cast("float", seconds))
+                    await self._send(
+                        pending.session,
+                        _error(pending.request_id, REQUEST_TIMEOUT, error.error.message),
+                    )
+
+    async def _initialize(self, session: _Session, request: types.JSONRPCRequest) -> bool:
+        # The remote app was initialized once, when the proxy connected to it
+        return await self._respond(session, request, self.initialize_result)
+
+    async def _ping(self, session: _Session, request: types.JSONRPCRequest) -> bool:
+        return await self._respond(session, request, {})
+
+    async def _subscribe(self, session: _Session, request: types.JSONRPCRequest) -> bool:
+        uri = str((request.params or {}).get("uri"))
+        if not self.subscriptions.add(session, uri):
+            return await self._respond(session, request, {})
+
+        async def _subscribed(_: dict[str, t.Any]) -> None:
+            if self.options.resource_cache is not None:
+                self.options.resource_cache.subscribe(uri)
+
+        return await self._forward(
+            session,
+            request,
+            _subscribed,
+            on_error=lambda: self.subscriptions.remove(session, uri),
+        )
+
+    def _unsubscribed(self, uri: str) -> None:
+        if self.options.resource_cache is not None:
+            self.options.resource_cache.unsubscribe(uri)
+
+    async def _unsubscribe(self, session: _Session, request: types.JSONRPCRequest) -> bool:
+        uri = str((request.params or {}).get("uri"))
+        if not self.subscriptions.remove(session, uri):
+            return await self._respond(session, request, {})
+        self._unsubscribed(uri)
+        return await self._forward(session, request)
+
+    async def _cached_list(self, session: _Session, request: types.JSONRPCRequest) -> bool:
+        list_cache = self.options.list_cache
+        request_type, result_type = LIST_METHODS[request.method]
+        if list_cache is None or (request.params or {}).get("cursor") is not None:
+            return await self._forward(session, request)
+        cached = list_cache.get(request_type)
+        if cached is not None:
+            return await self._respond(session, request, _dump(cached))
+
+        generation = list_cache.generation
+
+        async def _store(result: dict[str, t.Any]) -> None:
+            list_cache.set(
+                request_type,
+                types.ServerResult(result_type.model_validate(result)),
+                generation=generation,
+            )
+
+        return await self._forward(session, request, _store)
+
+    async def _cached_read(self, session: _Session, request: types.JSONRPCRequest) -> bool:
+        resource_cache = self.options.resource_cache
+        uri = str((request.params or {}).get("uri"))
+        if resource_cache is None:
+            return await self._forward(session, request)
+        cached = resource_cache.get(uri)
+        if cached is not None:
+            return await self._respond(session, request, cached)
+        generation = resource_cache.generation
+
+        async def _store(result: dict[str, t.Any]) -> None:
+            resource_cache.set(uri, types.EmptyResult.model_validate(result), generation)
+
+        return await self._forward(session, request, _store)
+
+    async def _cached_call(self, session: _Session, request: types.JSONRPCRequest) -> bool:
+        tool_cache = self.options.tool_cache
+        params = request.params or {}
+        name, arguments = str(params.get("name")), params.get("arguments") or {}
+        if tool_cache is None or not tool_cache.cacheable(name):
+            return await self._forward(session, request)
+        cached = await tool_cache.get(name, arguments)
+        if cached is not None:
+            return await self._respond(session, request, _dump(cached))
+
+        async def _store(result: dict[str, t.Any]) -> None:
+            await tool_cache.set(name, arguments, types.CallToolResult.model_validate(result))
+
+        return await self._forward(session, request, _store)
+
+    async def _handle_client_message(
+        self,
+        session: _Session,
+        message: types.JSONRPCMessage,
+    ) -> None:
+        root = message.root
+        if isinstance(root, types.JSONRPCRequest):
+            labels = self._labels(root)
+            if self._metrics is not None:
+                self._metrics.requests[labels] += 1
+            start = time.perf_counter()
+            hook = self.request_hooks.get(root.method, self._forward)
+            if not await hook(session, root):
+                # Answered by the proxy itself
+                self._observe(labels, start, error=False)
+        elif isinstance(root, types.JSONRPCNotification):
+            params = root.params or {}
+            if root.method == "notifications/initialized":
+                return
+            if root.method == "notifications/cancelled":
+                upstream_id = session.requests.get(params.get("requestId", ""))
+                if upstream_id is None:
+                    return
+                # The remote app does not answer cancelled requests, so they are done with
+                pending = await self._cancel(
+                    upstream_id,
+                    str(params.get("reason", "")),
+                    notify=self.options.cancel_upstream,
+                )
+                if pending is not None and self._metrics is not None:
+                    self._metrics.cancelled[pending.labels] += 1
+                return
+            await self._write_stream.send(message)
+        else:
+            # The answer of the session to a request of the remote app
+            found = self._remote_requests.pop(root.id, None)
+            if found is not None:
+                await self._write_stream.send(_with_id(message, found[0]))
+
+    async def _disconnect(self, session: _Session) -> None:
+        self._sessions.pop(session, None)
+        for pending_id in session.requests.values():
+            # Responses to the requests of a closed session are dropped
+            if pending_id in self._pending:
+                self._pending[pending_id].session = None
+        # The session is usually closed by cancellation, which must not stop the cleanup
+        with anyio.move_on_after(RELAY_TIMEOUT, shield=True):
+            for pending_id in list(session.requests.values()):
+                pending = await self._cancel(
+                    pending_id,
+                    "Client disconnected",
+                    notify=self.options.cancel_upstream,
+                )
+                if pending is not None and self._metrics is not None:
+                    self._metrics.cancelled[pending.labels] += 1
+            for local_id, (upstream_id, requested) in list(self._remote_requests.items()):
+                if requested is session:
+                    del self._remote_requests[local_id]
+                    await self._write_stream.send(
+                        _error(upstream_id, types.INTERNAL_ERROR, "Client disconnected"),
+                    )
+            for uri in self.subscriptions.remove_session(session):
+                self._unsubscribed(uri)
+                request = types.JSONRPCRequest(
+                    jsonrpc="2.0",
+                    id=0,
+                    method="resources/unsubscribe",
+                    params={"uri": uri},
+                )
+                await self._forward(None, request)
+
+    async def run(
+        self,
+        read_stream: ReadStream,
+        write_stream: WriteStream,
+        initialization_options: InitializationOptions,  # noqa: ARG002
+        raise_exceptions: bool = False,  # noqa: FBT001, FBT002, ARG002
+    ) -> None:
+        """Relay the messages of a session until its stream is closed."""
+        session = _Session(write_stream)
+        self._sessions[session] = None
+        try:
+            with session.scope:
+                async for message in read_stream:
+                    if isinstance(message, Exception):
+                        logger.warning("Error received from a client: %s", message)
+                        continue
+                    self._sessions[session] = self._sessions.pop(session)
+                    await self._handle_client_message(session, message)
+        finally:
+            await self._disconnect(session)
+            # Closing the stream ends the transport of the session, as the server sessions do
+            await write_stream.aclose()
+
+    async def _relay_request(self, message: types.JSONRPCMessage) -> None:
+        root = t.cast("types.JSONRPCRequest", message.root)
+        if root.method == "ping":
+            await self._write_stream.send(
+                types.JSONRPCMessage(types.JSONRPCResponse(jsonrpc="2.0", id=root.id, result={})),
+            )
+            return
+        # Sampling and roots requests go to the most recently active session
+        session = next(reversed(self._sessions), None)
+        if session is None:
+            await self._write_stream.send(
+                _error(root.id, types.INVALID_REQUEST, "No client connected"),
+            )
+            return
+        local_id = next(self._ids)
+        self._remote_requests[local_id] = (root.id, session)
+        await self._send(session, _with_id(message, local_id))
+
+    async def _relay_progress(self, notification: types.JSONRPCNotification) -> None:
+        params = notification.params or {}
+        pending = self._pending.get(params.get("progressToken", ""))
+        if pending is None or pending.session is None or pending.progress_token is None:
+            return
+        progress = {**params, "progressToken": pending.progress_token}
+        await self._send(
+            pending.session,
+            types.JSONRPCMessage(notification.model_copy(update={"params": progress})),
+        )
+
+    async def _relay_cancelled(self, notification: types.JSONRPCNotification) -> None:
+        # The remote app cancels one of its requests relayed to a session
+        params = notification.params or {}
+        for local_id, (upstream_id, session) in list(self._remote_requests.items()):
+            if upstream_id == params.get("requestId"):
+                del self._remote_requests[local_id]
+                cancelled = {**params, "requestId": local_id}
+                await self._send(
+                    session,
+                    types.JSONRPCMessage(notification.model_copy(update={"params": cancelled})),
+                )
+
+    async def _relay_notification(self, message: types.JSONRPCMessage) -> None:
+        root = t.cast("types.JSONRPCNotification", message.root)
+        params = root.params or {}
+        if root.method == "notifications/progress":
+            await self._relay_progress(root)
+            return
+        if root.method == "notifications/resources/updated":
+            uri = str(params.get("uri"))
+            if self.options.resource_cache is not None:
+                self.options.resource_cache.invalidate(uri)
+            for session in self.subscriptions.subscribers(uri):
+                await self._send(session, message)
+            return
+        if root.method == "notifications/cancelled":
+            await self._relay_cancelled(root)
+            return
+        list_cache = self.options.list_cache
+        if root.method in LIST_CHANGED_METHODS and list_cache is not None:
+            request_type = LIST_CHANGED_METHODS[root.method]
+            list_cache.invalidate(lambda key: key is request_type)
+        for session in list(self._sessions):
+            await self._send(session, message)
+
+    async def _relay_response(self, message: types.JSONRPCMessage, tg: TaskGroup) -> None:
+        root = t.cast("types.JSONRPCResponse | types.JSONRPCError", message.root)
+        error = isinstance(root, types.JSONRPCError) or bool(root.result.get("isError"))
+        pending = self._complete(root.id, error=error)
+        if pending is None:
+            return
+        if pending.session is not None:
+            await self._send(pending.session, _with_id(message, pending.request_id))
+        if isinstance(root, types.JSONRPCResponse) and pending.on_result is not None:
+            tg.start_soon(self._run_hook, pending.on_result, root.result)
+
+    @staticmethod
+    async def _run_hook(hook: ResultHook, result: dict[str, t.Any]) -> None:
+        try:
+            await hook(result)
+        except Exception:
+            logger.exception("Failed to handle a result of the remote app")
+
+    async def handle_remote_messages(self) -> None:
+        """Relay the messages of the remote app until its stream is closed.
+
+        Requests still waiting for a response then fail.
+        """
+        async with anyio.create_task_group() as expiry:
+            if self.options.deadlines is not None:
+                expiry.start_soon(self._expire_requests)
+            async with anyio.create_task_group() as tg:
+                async for message in self._read_stream:
+                    if isinstance(message, Exception):
+                        logger.warning("Error received from the remote app: %s", message)
+                        continue
+                    try:
+                        if isinstance(message.root, types.JSONRPCRequest):
+                            await self._relay_request(message)
+                        elif isinstance(message.root, types.JSONRPCNotification):
+                            await self._relay_notification(message)
+                        else:
+                            await self._relay_response(message, tg)
+                    except Exception:
+                        logger.exception("Failed to relay a message of the remote app")
+            expiry.cancel_scope.cancel()
+        for upstream_id in list(self._pending):
+            await self._fail(upstream_id, "Connection to the server closed")
+
+
+async def create_raw_proxy_server(
+    read_stream: ReadStream,
+    write_stream: WriteStream,
+    options: ProxyOptions | None = None,
+) -> RawProxyServer:
+    """Initialize a remote app over its streams and create a server relaying messages to it.
+
+    Only the caches, deadlines and metrics of the options apply to the raw proxy.
+    """
+    params = types.InitializeRequestParams(
+        protocolVersion=types.LATEST_PROTOCOL_VERSION,
+        capabilities=types.ClientCapabilities(
+            sampling=types.SamplingCapability(),
+            roots=types.RootsCapability(listChanged=True),
+        ),
+        clientInfo=types.Implementation(name="mcp", version="0.1.0"),
+    )
+    await write_stream.send(
+        types.JSONRPCMessage(
+            types.JSONRPCRequest(
+                jsonrpc="2.0",
+                id=0,
+                method="initialize",
+                params=params.model_dump(by_alias=True, mode="json", exclude_none=True),
+            ),
+        ),
+    )
+    async for message in read_stream:
+        if isinstance(message, Exception):
+            raise message
+        if isinstance(message.root, types.JSONRPCError) and message.root.id == 0:
+            raise McpError(message.root.error)
+        if isinstance(message.root, types.JSONRPCResponse) and message.root.id == 0:
+            result = message.root.result
+            break
+        logger.debug("Ignoring a message received before initialization: %s", message)
+    else:
+        msg = "Connection to the server closed during initialization"
+        raise RuntimeError(msg)
+    if result.get("protocolVersion") not in SUPPORTED_PROTOCOL_VERSIONS:
+        msg = f"Unsupported protocol version from the server: {result.get('protocolVersion')}"
+        raise RuntimeError(msg)
+    await write_stream.send(
+        types.JSONRPCMessage(
+            types.JSONRPCNotification(jsonrpc="2.0", method="notifications/initialized"),
+        ),
+    )
+
+    app = RawProxyServer(read_stream, write_stream, result, options)
+    metrics = app.options.metrics
+    if metrics is not None:
+        for name, component in (
+            ("list_cache", app.options.list_cache),
+            ("tool_cache", app.options.tool_cache),
+            ("resource_cache", app.options.resource_cache),
+        ):
+            if component is not None:
+                metrics.register_collector(name, component.stats)
+    return app
@@ -0,0 +1,206 @@
+"""Record the requests served by the proxy, to replay them later with `mcp-proxy replay`.
+
+Every request is appended to a file as a line of compact JSON, with the time it was received,
+its method and params, how long it took, and its result or error:
+
+    {"t":1718000000.123456,"method":"tools/call","params":{"name":"fetch","arguments":{...}},
+     "duration":0.2101,"bytes":5120,"result":{...}}
+
+Payloads may be redacted: strings are then replaced by asterisks of the same length, so that
+records keep the size of the payloads they replace, while the names of tools and prompts, the
+URIs of resources, and content types are kept for requests to be replayed.
+
+Records are queued and written by a thread, so that the event loop never waits on the file.
+Results larger than a number of bytes are left out of their record, which keeps their size,
+and records are dropped while too many bytes wait to be written.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+import typing as t
+from pathlib import Path
+
+from mcp import types
+from mcp.shared.exceptions import McpError
+
+from .metrics import RequestHandler
+
+logger = logging.getLogger(__name__)
+
+# Fields whose strings are kept by redaction, as replaying requests or reading records needs them
+KEPT_FIELDS = frozenset({"name", "uri", "level", "type", "mimeType", "role"})
+
+# Bytes of the largest result written in a record by default
+DEFAULT_MAX_RESULT_BYTES = 1024 * 1024
+# Bytes of records waiting to be written, beyond which new records are dropped
+MAX_QUEUED_BYTES = 64 * 1024 * 1024
+
+
+def _redact(value: t.Any) -> t.Any:  # noqa: ANN401
+    if isinstance(value, str):
+        return "*" * len(value)
+    if isinstance(value, dict):
+        return {
+            key: item if key in KEPT_FIELDS and isinstance(item, str) else _redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+    return value
+
+
+def _params(req: t.Any) -> dict[str, t.Any]:  # noqa: ANN401
+    if req.params is None:
+        return {}
+    params = req.params.model_dump(by_alias=True, mode="json", exclude_none=True)
+    # Progress tokens are only meaningful to the session that sent them
+    params.pop("_meta", None)
+    return t.cast("dict[str, t.Any]", params)
+
+
+def _error(error: BaseException) -> str:
+    if isinstance(error, McpError):
+        return error.error.message
+    return str(error) or type(error).__name__
+
+
+class Recorder:
+    """Appends the requests served by the proxy to a file of JSON lines.
+
+    The file is opened and its writer thread started when the first request is recorded, so
+    that recorders can be created before the worker processes serving the requests, which then
+    append to the same file.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        redact: bool = False,
+        max_result_bytes: int | None = DEFAULT_MAX_RESULT_BYTES,
+    ) -> None:
+        """Create a recorder appending to a file.
+
+        Args:
+            path: File the records are appended to.
+            redact: Replace the strings of params and results with asterisks.
+            max_result_bytes: Serialized size of the largest result written in a record, or
+                None for no limit. Larger results are left out.
+
+        """
+        self.path = path
+        self.redact = redact
+        self.max_result_bytes = max_result_bytes
+        self.records = 0
+        self.bytes_written = 0
+        self.failed_writes = 0
+        self.dropped_records = 0
+        self.omitted_results = 0
+        self._file: t.BinaryIO | None = None
+        # Created with the writer thread, as recorders are pickled to the worker processes
+        self._queue: queue.Queue[bytes] | None = None
+        self._lock: threading.Lock | None = None
+        self._queued_bytes = 0
+
+    def _enqueue(self, record: dict[str, t.Any], result: str | None = None) -> None:
+        line = json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+        if result is not None:
+            # Results are serialized once, and appended to the record as they are
+            line = f'{line[:-1]},"result":{result}}}'
+        data = (line + "\n").encode()
+        if self._queue is None or self._lock is None:
+            self._queue = queue.Queue()
+            self._lock = threading.Lock()
+            threading.Thread(
+                target=self._write_queued,
+                name="mcp-proxy-recorder",
+                daemon=True,
+            ).start()
+            atexit.register(self.flush)
+        with self._lock:
+            if self._queued_bytes + len(data) > MAX_QUEUED_BYTES:
+                self.dropped_records += 1
+                logger.warning("Dropped a record, %d bytes wait to be written", self._queued_bytes)
+                return
+            self._queued_bytes += len(data)
+        self._queue.put(data)
+
+    def _write_queued(self) -> None:
+        if self._queue is None or self._lock is None:
+            return
+        while True:
+            batch = [self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self._write(b"".join(batch), len(batch))
+            with self._lock:
+                self._queued_bytes -= sum(len(data) for data in batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, data: bytes, records: int) -> None:
+        try:
+            if self._file is None:
+                # Unbuffered, so that records are appended by a single write, whole even when
+                # many processes record to the same file
+                self._file = self.path.open("ab", buffering=0)
+            self._file.write(data)
+        except OSError:
+            self.failed_writes += records
+            logger.warning("Failed to record requests to %s", self.path, exc_info=True)
+            return
+        self.records += records
+        self.bytes_written += len(data)
+
+    def flush(self) -> None:
+        """Block until every queued record is written."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def instrument(self, handler: RequestHandler) -> RequestHandler:
+        """Wrap a request handler to record its requests."""
+
+        async def _recorded(req: t.Any) -> types.ServerResult:  # noqa: ANN401
+            params = _params(req)
+            record: dict[str, t.Any] = {
+                "t": round(time.time(), 6),
+                "method": req.method,
+                "params": _redact(params) if self.redact else params,
+            }
+            start = time.perf_counter()
+            try:
+                result = await handler(req)
+            except BaseException as e:
+                record["duration"] = round(time.perf_counter() - start, 6)
+                record["error"] = _error(e)
+                self._enqueue(record)
+                raise
+            record["duration"] = round(time.perf_counter() - start, 6)
+            dumped = result.root.model_dump_json(by_alias=True, exclude_none=True)
+            record["bytes"] = len(dumped)
+            if self.max_result_bytes is not None and len(dumped) > self.max_result_bytes:
+                self.omitted_results += 1
+                record["result_omitted"] = True
+                self._enqueue(record)
+                return result
+            if self.redact:
+                dumped = json.dumps(_redact(json.loads(dumped)), separators=(",", ":"))
+            self._enqueue(record, dumped)
+            return result
+
+        return _recorded
+
+    def stats(self) -> dict[str, int]:
+        """Return the counters of the recorder."""
+        return {
+            "records": self.records,
+            "bytes_written": self.bytes_written,
+            "failed_writes": self.failed_writes,
+            "dropped_records": self.dropped_records,
+            "omitted_results": self.omitted_results,
+            "queued_bytes": self._queued_bytes,
+        }
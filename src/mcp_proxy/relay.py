@@ -0,0 +1,310 @@
+"""Relay the notifications and requests of remote apps to the clients of the proxy.
+
+Remote apps only know the proxy, so the proxy keeps track of the sessions of its clients:
+resource updates go to the sessions subscribed to the resource, progress notifications to
+the session of the request they report on, and sampling or roots requests to the session
+that was active last.
+"""
+
+import logging
+import typing as t
+import uuid
+from collections.abc import Hashable, Iterator
+from contextlib import AsyncExitStack, contextmanager
+
+import anyio
+from anyio.abc import ObjectReceiveStream
+from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
+from mcp import types
+from mcp.client.session import ClientSession
+from mcp.server import Server
+from mcp.server.lowlevel.server import request_ctx
+from mcp.server.models import InitializationOptions
+from mcp.server.session import ServerSession
+from mcp.shared.context import RequestContext
+from pydantic import AnyUrl
+
+logger = logging.getLogger(__name__)
+
+S = t.TypeVar("S", bound=Hashable)
+
+# Seconds to wait for a session to accept a notification before dropping it
+RELAY_TIMEOUT = 5.0
+
+# Notifications sent to every session rather than to the ones they concern
+BROADCAST_NOTIFICATIONS = (
+    types.LoggingMessageNotification,
+    types.PromptListChangedNotification,
+    types.ResourceListChangedNotification,
+    types.ToolListChangedNotification,
+)
+
+# Older SDKs read the cursor of list requests next to their params, where clients do not put it
+CURSOR_BESIDE_PARAMS = "cursor" in types.PaginatedRequest.model_fields
+
+
+def current_session() -> ServerSession | None:
+    """Return the session of the request being handled, if any."""
+    try:
+        return request_ctx.get().session
+    except LookupError:
+        return None
+
+
+class Subscriptions(t.Generic[S]):
+    """The sessions subscribed to each resource, counted to keep one remote subscription."""
+
+    def __init__(self) -> None:
+        """Create a registry without subscriptions."""
+        self._subscribers: dict[str, set[S]] = {}
+
+    def __len__(self) -> int:
+        """Return the number of resources with subscribers."""
+        return len(self._subscribers)
+
+    def add(self, session: S, uri: str) -> bool:
+        """Subscribe a session to a resource, returning whether it is the first subscriber."""
+        subscribers = self._subscribers.setdefault(uri, set())
+        first = not subscribers
+        subscribers.add(session)
+        return first
+
+    def remove(self, session: S, uri: str) -> bool:
+        """Unsubscribe a session from a resource, returning whether no subscriber is left."""
+        subscribers = self._subscribers.get(uri)
+        if subscribers is None:
+            return True
+        subscribers.discard(session)
+        if subscribers:
+            return False
+        del self._subscribers[uri]
+        return True
+
+    def remove_session(self, session: S) -> list[str]:
+        """Unsubscribe a session from everything, returning the resources left unsubscribed."""
+        uris = [uri for uri, subscribers in self._subscribers.items() if session in subscribers]
+        return [uri for uri in uris if self.remove(session, uri)]
+
+    def subscribers(self, uri: str) -> list[S]:
+        """Return the sessions subscribed to a resource."""
+        return list(self._subscribers.get(uri, ()))
+
+
+class ClientSessions:
+    """The sessions of the clients of a server, and the resources each subscribed to."""
+
+    def __init__(self) -> None:
+        """Create an empty set of sessions."""
+        # Sessions by order of activity, the most recently active last
+        self._sessions: dict[ServerSession, None] = {}
+        # Session and token of the requests reporting progress, by token sent upstream
+        self._progress: dict[str, tuple[ServerSession, types.ProgressToken]] = {}
+        self.subscriptions = Subscriptions[ServerSession]()
+
+    @property
+    def sessions(self) -> list[ServerSession]:
+        """Return the connected sessions, the most recently active last."""
+        return list(self._sessions)
+
+    def connect(self, session: ServerSession) -> None:
+        """Keep track of a session."""
+        self._sessions[session] = None
+
+    def disconnect(self, session: ServerSession) -> list[str]:
+        """Forget a session, returning the resources no other session is subscribed to."""
+        self._sessions.pop(session, None)
+        return self.subscriptions.remove_session(session)
+
+    def touch(self, session: ServerSession) -> None:
+        """Mark a session as the most recently active."""
+        if session in self._sessions:
+            self._sessions[session] = self._sessions.pop(session)
+
+    @contextmanager
+    def progress(self, session: ServerSession, token: types.ProgressToken) -> Iterator[str]:
+        """Relay the progress of a request, yielding the token to send upstream instead.
+
+        Tokens are replaced because those of different sessions may be equal.
+        """
+        upstream_token = uuid.uuid4().hex
+        self._progress[upstream_token] = (session, token)
+        try:
+            yield upstream_token
+        finally:
+            del self._progress[upstream_token]
+
+    async def _send(self, session: ServerSession, notification: types.ServerNotification) -> None:
+        # A client not reading its messages must not hold up the remote app
+        with anyio.move_on_after(RELAY_TIMEOUT) as scope:
+            try:
+                await session.send_notification(notification)
+            except (anyio.BrokenResourceError, anyio.ClosedResourceError):
+                logger.debug("Session closed before a notification could be relayed")
+        if scope.cancelled_caught:
+            logger.warning("Dropped a %s notification for a slow session", notification.root.method)
+
+    async def relay(self, notification: t.Any) -> None:  # noqa: ANN401
+        """Send a notification of a remote app to the sessions it concerns."""
+        params = notification.params
+        if isinstance(notification, types.ResourceUpdatedNotification):
+            sessions = self.subscriptions.subscribers(str(notification.params.uri))
+        elif isinstance(notification, types.ProgressNotification):
+            found = self._progress.get(str(notification.params.progressToken))
+            if found is None:
+                return
+            session, token = found
+            sessions = [session]
+            params = notification.params.model_copy(update={"progressToken": token})
+        elif isinstance(notification, BROADCAST_NOTIFICATIONS):
+            sessions = self.sessions
+        else:
+            return
+        # Received notifications keep the JSON-RPC fields, which sending them would duplicate
+        relayed = type(notification)(method=notification.method, params=params)
+        for session in sessions:
+            await self._send(session, types.ServerNotification(relayed))
+
+    def _latest(self) -> ServerSession | None:
+        return next(reversed(self._sessions), None)
+
+    async def create_message(
+        self,
+        _: RequestContext[ClientSession, t.Any],
+        params: types.CreateMessageRequestParams,
+    ) -> types.CreateMessageResult | types.ErrorData:
+        """Relay a sampling request of a remote app to the most recently active session."""
+        session = self._latest()
+        if session is None:
+            return types.ErrorData(code=types.INVALID_REQUEST, message="No client connected")
+        request = types.CreateMessageRequest(method="sampling/createMessage", params=params)
+        return await session.send_request(types.ServerRequest(request), types.CreateMessageResult)
+
+    async def list_roots(
+        self,
+        _: RequestContext[ClientSession, t.Any],
+    ) -> types.ListRootsResult | types.ErrorData:
+        """Relay a roots request of a remote app to the most recently active session."""
+        session = self._latest()
+        if session is None:
+            return types.ErrorData(code=types.INVALID_REQUEST, message="No client connected")
+        return await session.list_roots()
+
+
+class _ListCursors(ObjectReceiveStream[types.JSONRPCMessage | Exception]):
+    """Copies the cursor of list requests next to their params, for older SDKs to keep it."""
+
+    def __init__(self, stream: MemoryObjectReceiveStream[types.JSONRPCMessage | Exception]) -> None:
+        self._stream = stream
+
+    async def receive(self) -> types.JSONRPCMessage | Exception:
+        message = await self._stream.receive()
+        if not isinstance(message, Exception) and isinstance(message.root, types.JSONRPCRequest):
+            cursor = (message.root.params or {}).get("cursor")
+            if cursor is not None:
+                # Requests keep the fields they do not declare
+                setattr(message.root, "cursor", cursor)  # noqa: B010
+        return message
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+class RelayServer(Server[object]):
+    """A server that keeps track of the sessions of its clients.
+
+    Subscriptions of its sessions are counted, so that a resource is only subscribed to once
+    upstream and unsubscribed from when its last subscriber unsubscribes or disconnects.
+    """
+
+    def __init__(self, name: str, client_sessions: ClientSessions | None = None) -> None:
+        """Create a server recording its sessions in the given set, or in a new one."""
+        super().__init__(name=name)
+        self.client_sessions = client_sessions or ClientSessions()
+        self._counting_subscriptions = False
+        # Subscriptions of the remote app in progress, set once done, by resource
+        self._subscribing: dict[str, anyio.Event] = {}
+
+    def _count_subscriptions(self) -> None:
+        if self._counting_subscriptions or types.SubscribeRequest not in self.request_handlers:
+            return
+        self._counting_subscriptions = True
+        subscribe = self.request_handlers[types.SubscribeRequest]
+        unsubscribe = self.request_handlers[types.UnsubscribeRequest]
+        subscriptions = self.client_sessions.subscriptions
+
+        async def _subscribe(req: types.SubscribeRequest) -> types.ServerResult:
+            session, uri = current_session(), str(req.params.uri)
+            if session is None:
+                return await subscribe(req)
+            # Other subscribers only succeed once the remote app is subscribed, and subscribe
+            # it themselves if that failed
+            while (subscribing := self._subscribing.get(uri)) is not None:
+                await subscribing.wait()
+            if not subscriptions.add(session, uri):
+                return types.ServerResult(types.EmptyResult())
+            self._subscribing[uri] = subscribing = anyio.Event()
+            try:
+                return await subscribe(req)
+            except BaseException:
+                subscriptions.remove(session, uri)
+                raise
+            finally:
+                del self._subscribing[uri]
+                subscribing.set()
+
+        async def _unsubscribe(req: types.UnsubscribeRequest) -> types.ServerResult:
+            session = current_session()
+            if session is None or subscriptions.remove(session, str(req.params.uri)):
+                return await unsubscribe(req)
+            return types.ServerResult(types.EmptyResult())
+
+        self.request_handlers[types.SubscribeRequest] = _subscribe
+        self.request_handlers[types.UnsubscribeRequest] = _unsubscribe
+
+    async def _disconnect(self, session: ServerSession) -> None:
+        uris = self.client_sessions.disconnect(session)
+        if not uris:
+            return
+        # The session is usually closed by cancellation, which must not stop the cleanup
+        with anyio.move_on_after(RELAY_TIMEOUT, shield=True):
+            for uri in uris:
+                request = types.UnsubscribeRequest(
+                    method="resources/unsubscribe",
+                    params=types.UnsubscribeRequestParams(uri=AnyUrl(uri)),
+                )
+                try:
+                    # Outside of a request, the handler unsubscribes upstream unconditionally
+                    await self.request_handlers[types.UnsubscribeRequest](request)
+                except Exception:
+                    logger.exception("Failed to unsubscribe from %s", uri)
+
+    async def run(
+        self,
+        read_stream: MemoryObjectReceiveStream[types.JSONRPCMessage | Exception],
+        write_stream: MemoryObjectSendStream[types.JSONRPCMessage],
+        initialization_options: InitializationOptions,
+        raise_exceptions: bool = False,  # noqa: FBT001, FBT002
+    ) -> None:
+        """Serve a session, as `Server.run` does, while recording it in the client sessions."""
+        # Handlers are registered after the server is created, so they are wrapped here
+        self._count_subscriptions()
+        if CURSOR_BESIDE_PARAMS:
+            read_stream = t.cast("MemoryObjectReceiveStream[t.Any]", _ListCursors(read_stream))
+        async with AsyncExitStack() as stack:
+            lifespan_context = await stack.enter_async_context(self.lifespan(self))
+            session = await stack.enter_async_context(
+                ServerSession(read_stream, write_stream, initialization_options),
+            )
+            self.client_sessions.connect(session)
+            stack.push_async_callback(self._disconnect, session)
+
+            async with anyio.create_task_group() as tg:
+                async for message in session.incoming_messages:
+                    self.client_sessions.touch(session)
+                    tg.start_soon(
+                        self._handle_message,
+                        message,
+                        session,
+                        lifespan_context,
+                        raise_exceptions,
+                    )
@@ -0,0 +1,338 @@
+"""Replay requests recorded with `--record` against a server, and report their latencies.
+
+Requests are sent at the pace they were recorded, a number of times faster, or as fast as
+possible, over a single session with a stdio command or an SSE URL, with at most a number of
+them in flight at once. Run with:
+
+    mcp-proxy replay requests.jsonl --speed 2 --concurrency 16 -- your-command --arg1 value1
+"""
+
+import argparse
+import json
+import sys
+import time
+import typing as t
+from collections.abc import AsyncIterator, Iterable, Sequence
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import anyio
+from mcp import types
+from mcp.client.session import ClientSession
+from mcp.client.sse import sse_client
+from mcp.client.stdio import StdioServerParameters, stdio_client
+from mcp.shared.exceptions import McpError
+from pydantic import BaseModel
+
+PERCENTILES = (50, 90, 99)
+
+
+@dataclass(frozen=True)
+class RecordedRequest:
+    """A request read from a record file."""
+
+    # Seconds since the epoch when the proxy received the request
+    time: float
+    method: str
+    params: dict[str, t.Any]
+    # Seconds the proxy took to answer the request when it was recorded
+    duration: float | None = None
+
+    @property
+    def label(self) -> str:
+        """Return the method of the request, with the name of its tool or prompt."""
+        name = self.params.get("name")
+        return f"{self.method} {name}" if isinstance(name, str) else self.method
+
+
+@dataclass
+class MethodReport:
+    """Latencies of the replayed requests of a method."""
+
+    method: str
+    requests: int = 0
+    # Requests answered with an error or not answered in time
+    errors: int = 0
+    # Requests not answered in time, also counted as errors
+    timeouts: int = 0
+    # Seconds taken by every request, in the order they were answered
+    latencies: list[float] = field(default_factory=list)
+    # Seconds the requests took when they were recorded
+    recorded: list[float] = field(default_factory=list)
+
+    def summary(self) -> dict[str, t.Any]:
+        """Return the counts and percentiles of the latencies."""
+        summary: dict[str, t.Any] = {
+            "method": self.method,
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+        }
+        for percentile in PERCENTILES:
+            summary[f"p{percentile}"] = _percentile(self.latencies, percentile)
+            summary[f"recorded_p{percentile}"] = _percentile(self.recorded, percentile)
+        summary["max"] = max(self.latencies, default=None)
+        return summary
+
+
+@dataclass
+class Report:
+    """Results of a replay."""
+
+    # Seconds from the first request sent to the last answer received
+    duration: float = 0.0
+    methods: dict[str, MethodReport] = field(default_factory=dict)
+
+    def summary(self) -> dict[str, t.Any]:
+        """Return the totals of the replay and the summary of every method."""
+        requests = sum(report.requests for report in self.methods.values())
+        return {
+            "duration": self.duration,
+            "requests": requests,
+            "errors": sum(report.errors for report in self.methods.values()),
+            "timeouts": sum(report.timeouts for report in self.methods.values()),
+            "throughput": requests / self.duration if self.duration else None,
+            "methods": [self.methods[method].summary() for method in sorted(self.methods)],
+        }
+
+
+class _Request(BaseModel):
+    method: str
+    params: dict[str, t.Any]
+
+
+def _percentile(values: Sequence[float], percentile: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+def load_records(path: Path) -> list[RecordedRequest]:
+    """Read the requests of a record file, in the order they were received."""
+    requests = []
+    with path.open(encoding="utf-8") as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            requests.append(
+                RecordedRequest(
+                    time=record["t"],
+                    method=record["method"],
+                    params=record.get("params", {}),
+                    duration=record.get("duration"),
+                ),
+            )
+    # Worker processes append their records concurrently
+    return sorted(requests, key=lambda request: request.time)
+
+
+async def _send(
+    session: ClientSession,
+    request: RecordedRequest,
+    report: MethodReport,
+    request_timeout: float | None,
+) -> None:
+    # Cursors are only valid in the session they were handed out to
+    params = {key: value for key, value in request.params.items() if key != "cursor"}
+    # The session only needs requests to serialize to JSON-RPC, and results are not validated
+    message = t.cast("types.ClientRequest", _Request(method=request.method, params=params))
+    start = time.perf_counter()
+    try:
+        with anyio.fail_after(request_timeout):
+            result = await session.send_request(message, types.EmptyResult)
+    except McpError:
+        report.errors += 1
+    except TimeoutError:
+        report.errors += 1
+        report.timeouts += 1
+    else:
+        if getattr(result, "isError", False):
+            report.errors += 1
+    report.latencies.append(time.perf_counter() - start)
+
+
+async def replay(
+    session: ClientSession,
+    requests: Iterable[RecordedRequest],
+    *,
+    speed: float | None = 1.0,
+    concurrency: int = 16,
+    request_timeout: float | None = 60.0,
+) -> Report:
+    """Send recorded requests over a session, measuring how long each takes.
+
+    Args:
+        session: Initialized session with the server to replay the requests against.
+        requests: Requests to send, in the order they were received.
+        speed: How many times faster than recorded to send the requests, or None to send them
+            as fast as possible.
+        concurrency: Maximum number of requests waiting for their answer at once.
+        request_timeout: Seconds a request waits for its answer before it is counted as an
+            error, or None to wait as long as it takes.
+
+    """
+    report = Report()
+    slots = anyio.Semaphore(concurrency)
+
+    async def _replay(request: RecordedRequest, method: MethodReport) -> None:
+        try:
+            await _send(session, request, method, request_timeout)
+        finally:
+            slots.release()
+
+    start = time.perf_counter()
+    first: float | None = None
+    async with anyio.create_task_group() as tg:
+        for request in requests:
+            first = request.time if first is None else first
+            delay = (request.time - first) / speed - (time.perf_counter() - start) if speed else 0
+            if delay > 0:
+                await anyio.sleep(delay)
+            method = report.methods.setdefault(request.label, MethodReport(request.label))
+            method.requests += 1
+            if request.duration is not None:
+                method.recorded.append(request.duration)
+            # Requests are not started before a slot is free, so that at most that many wait
+            await slots.acquire()
+            tg.start_soon(_replay, request, method)
+    report.duration = time.perf_counter() - start
+    return report
+
+
+@asynccontextmanager
+async def _connect(
+    command_or_url: str,
+    args: list[str],
+    headers: dict[str, str],
+) -> AsyncIterator[ClientSession]:
+    if command_or_url.startswith(("http://", "https://")):
+        transport = sse_client(url=command_or_url, headers=headers)
+    else:
+        transport = stdio_client(StdioServerParameters(command=command_or_url, args=args))
+    async with transport as streams, ClientSession(*streams) as session:
+        await session.initialize()
+        yield session
+
+
+def _format_seconds(value: float | None) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}ms"
+
+
+def format_report(summary: dict[str, t.Any]) -> str:
+    """Return the summary of a replay as a table."""
+    columns = ("requests", "errors", *(f"p{p}" for p in PERCENTILES), "max", "recorded_p50")
+    rows = [("method", *columns)]
+    rows.extend(
+        (
+            method["method"],
+            str(method["requests"]),
+            str(method["errors"]),
+            *(_format_seconds(method[column]) for column in columns[2:]),
+        )
+        for method in summary["methods"]
+    )
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns) + 1)]
+    lines = [
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths, strict=True))
+        for row in rows
+    ]
+    throughput = summary["throughput"]
+    timeouts = f" ({summary['timeouts']} timed out)" if summary["timeouts"] else ""
+    lines.append(
+        f"{summary['requests']} requests, {summary['errors']} errors{timeouts} in "
+        f"{summary['duration']:.2f}s"
+        + (f", {throughput:.1f} requests/s" if throughput is not None else ""),
+    )
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def _speed(value: str) -> float | None:
+    if value == "max":
+        return None
+    speed = float(value)
+    if speed <= 0:
+        msg = f"speed must be positive or max, not {value}"
+        raise argparse.ArgumentTypeError(msg)
+    return speed
+
+
+async def _main(args: argparse.Namespace) -> None:
+    requests = load_records(args.file)
+    async with _connect(args.command_or_url, args.args, dict(args.headers)) as session:
+        report = await replay(
+            session,
+            requests,
+            speed=args.speed,
+            concurrency=args.concurrency,
+            request_timeout=args.request_timeout or None,
+        )
+    summary = report.summary()
+    if args.output is not None:
+        args.output.write_text(json.dumps(summary, indent=2) + "\n")
+    print(format_report(summary))  # noqa: T201
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Replay a record file from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="mcp-proxy replay",
+        description="Replay requests recorded with --record against a server.",
+    )
+    parser.add_argument("file", type=Path, help="Record file written with --record")
+    parser.add_argument(
+        "command_or_url",
+        help="Command to spawn the server with, or SSE URL of the server",
+    )
+    parser.add_argument("args", nargs="*", help="Any extra arguments to the command")
+    parser.add_argument(
+        "--speed",
+        type=_speed,
+        default=1.0,
+        help=(
+            "How many times faster than recorded to send the requests, or max to send them "
+            "as fast as possible. Default is 1"
+        ),
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=16,
+        help="Maximum number of requests waiting for their answer at once. Default is 16",
+    )
+    parser.add_argument(
+        "--request-timeout",
+        type=float,
+        default=60.0,
+        help=(
+            "Seconds a request waits for its answer before it is counted as an error, or 0 to "
+            "wait as long as it takes. Default is 60"
+        ),
+    )
+    parser.add_argument(
+        "-H",
+        "--headers",
+        nargs=2,
+        action="append",
+        metavar=("KEY", "VALUE"),
+        default=[],
+        help="Headers to pass to the SSE server. Can be used multiple times.",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="JSON file to write the report to, in addition to printing it",
+    )
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.request_timeout < 0:
+        parser.error("--request-timeout must not be negative")
+    anyio.run(_main, args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,316 @@
+"""Give every client session a dedicated MCP backend.
+
+Backends are spawned lazily when a session connects and stopped when it disconnects, so
+no state is shared between clients and a slow client only stalls its own backend. A few
+backends are kept initialized in advance to keep the latency of new sessions low.
+
+Every backend has its own caches, in memory only, and the counters of the caches of all
+backends are exported together.
+"""
+
+import logging
+import time
+import typing as t
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from functools import partial
+
+import anyio
+from anyio.abc import TaskGroup, TaskStatus
+from mcp import types
+from mcp.server import Server
+
+from .backend_pool import SessionFactory
+from .deferred import Deferred
+from .metrics import sum_stats
+from .proxy_server import (
+    PER_BACKEND_COMPONENTS,
+    ProxyOptions,
+    ProxyServer,
+    create_proxy_server,
+)
+
+logger = logging.getLogger(__name__)
+
+SessionRunner = Callable[[Server[object]], Awaitable[None]]
+
+# Counters kept once the backend counting them is stopped, unlike the sizes of its components
+KEPT_COUNTERS = frozenset(
+    {
+        "hits",
+        "misses",
+        "evictions",
+        "invalidations",
+        "disk_hits",
+        "bytes_saved",
+        "refreshes",
+        "calls",
+        "coalesced",
+    },
+)
+
+
+class BackendLimitError(RuntimeError):
+    """Raised when a session connects while the maximum number of backends is running."""
+
+
+@dataclass
+class SessionBackendSettings:
+    """Settings for the backends dedicated to sessions."""
+
+    # Maximum number of backends, including the warm ones
+    max_backends: int = 16
+    # Seconds without requests after which a session is closed and its backend stopped
+    idle_timeout: float = 600.0
+    # Number of initialized backends kept ready for new sessions
+    warm_size: int = 1
+
+
+@dataclass(eq=False)
+class _Backend:
+    app: ProxyServer
+    options: ProxyOptions | None
+    outstanding: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+    stopped: anyio.Event = field(default_factory=anyio.Event)
+    # Scope of the session served by the backend, cancelled to close it
+    scope: anyio.CancelScope | None = None
+
+
+class SessionBackends:
+    """Backends spawned on demand, each serving a single session."""
+
+    def __init__(
+        self,
+        session_factory: SessionFactory,
+        settings: SessionBackendSettings,
+        proxy_options: ProxyOptions | None = None,
+    ) -> None:
+        """Create an empty set of backends that opens sessions with the given factory.
+
+        Args:
+            session_factory: Returns a context manager yielding a connected session.
+            settings: Limits and warm pool size of the backends.
+            proxy_options: Options of the proxy servers wrapping every backend, each of them
+                with its own caches.
+
+        """
+        if settings.max_backends < 1 or not 0 <= settings.warm_size <= settings.max_backends:
+            raise ValueError("Backend limits must satisfy 0 <= warm_size <= max_backends")
+        self._session_factory = session_factory
+        self._settings = settings
+        self._proxy_options = proxy_options
+        self._warm: list[_Backend] = []
+        self._active: list[_Backend] = []
+        # Every running backend, including the ones starting or stopping
+        self._backends: set[_Backend] = set()
+        # Counters of the components of the stopped backends, by component
+        self._stopped_counters: dict[str, dict[str, float]] = {}
+        self._starting = 0
+        self._warm_starting = 0
+        self._warm_added = anyio.Event()
+        self._task_group: TaskGroup | None = None
+        self.spawned = 0
+        self.reaped = 0
+        if proxy_options is not None and proxy_options.metrics is not None:
+            proxy_options.metrics.register_collector("session_backends", self.stats)
+
+    @property
+    def active(self) -> int:
+        """Return the number of backends serving a session."""
+        return len(self._active)
+
+    @property
+    def warm(self) -> int:
+        """Return the number of initialized backends waiting for a session."""
+        return len(self._warm)
+
+    @property
+    def _total(self) -> int:
+        return len(self._warm) + len(self._active) + self._starting
+
+    async def run(self, *, task_status: TaskStatus[None] = anyio.TASK_STATUS_IGNORED) -> None:
+        """Keep the warm backends ready and reap idle sessions until cancelled."""
+        async with anyio.create_task_group() as tg:
+            self._task_group = tg
+            self._refill()
+            task_status.started()
+
+            while True:
+                await anyio.sleep(self._settings.idle_timeout / 4)
+                self._reap_idle()
+
+    async def _run_backend(self, *, task_status: TaskStatus[_Backend]) -> None:
+        options = self._proxy_options.with_own_caches() if self._proxy_options else None
+        async with self._session_factory() as session, anyio.create_task_group() as tg:
+            app = await create_proxy_server(session, options)
+            backend = _Backend(app=app, options=options)
+            for request_type, handler in app.request_handlers.items():
+                app.request_handlers[request_type] = self._track(backend, handler)
+            self._register_backend(backend)
+            tg.start_soon(self._watch_backend, backend)
+            self.spawned += 1
+            task_status.started(backend)
+            try:
+                await backend.stopped.wait()
+            finally:
+                tg.cancel_scope.cancel()
+                self._unregister_backend(backend)
+
+    def _register_backend(self, backend: _Backend) -> None:
+        self._backends.add(backend)
+        metrics = self._proxy_options.metrics if self._proxy_options else None
+        if metrics is None:
+            return
+        # The proxy server of the backend registered the stats of its own components
+        for name in PER_BACKEND_COMPONENTS:
+            if getattr(backend.options, name) is not None:
+                metrics.register_collector(name, partial(self.component_stats, name))
+
+    def _unregister_backend(self, backend: _Backend) -> None:
+        self._backends.discard(backend)
+        for name in PER_BACKEND_COMPONENTS:
+            component = getattr(backend.options, name, None)
+            if component is None:
+                continue
+            counters = self._stopped_counters.setdefault(name, {})
+            for key, value in component.stats().items():
+                if key in KEPT_COUNTERS:
+                    counters[key] = counters.get(key, 0) + value
+
+    def component_stats(self, name: str) -> dict[str, float]:
+        """Return the sum of the counters of a component of the proxy servers of the backends.
+
+        Args:
+            name: Name of the component in the proxy options, such as `resource_cache`.
+
+        """
+        components = (getattr(backend.options, name, None) for backend in self._backends)
+        return sum_stats(
+            [
+                self._stopped_counters.get(name, {}),
+                *(component.stats() for component in components if component is not None),
+            ],
+        )
+
+    @staticmethod
+    def _track(
+        backend: _Backend,
+        handler: Callable[[t.Any], Awaitable[types.ServerResult]],
+    ) -> Callable[[t.Any], Awaitable[types.ServerResult]]:
+        async def _tracked(req: t.Any) -> types.ServerResult:  # noqa: ANN401
+            backend.outstanding += 1
+            try:
+                return await handler(req)
+            finally:
+                backend.outstanding -= 1
+                backend.last_used = time.monotonic()
+
+        return _tracked
+
+    async def _watch_backend(self, backend: _Backend) -> None:
+        await backend.app.handle_remote_messages()
+        # The stream of the remote app only ends when its connection is closed
+        logger.warning("Backend connection lost")
+        if backend in self._warm:
+            self._warm.remove(backend)
+            self._refill()
+        if backend.scope is not None:
+            backend.scope.cancel()
+        backend.stopped.set()
+
+    async def _spawn_warm_backend(self) -> None:
+        if self._task_group is None:
+            raise RuntimeError("Session backends are not running")
+        try:
+            backend = await self._task_group.start(self._run_backend)
+        except Exception:
+            logger.exception("Failed to start a warm backend")
+        else:
+            self._warm.append(backend)
+        finally:
+            self._starting -= 1
+            self._warm_starting -= 1
+            self._warm_added.set()
+            self._warm_added = anyio.Event()
+
+    def _refill(self) -> None:
+        if self._task_group is None:
+            return
+        while (
+            len(self._warm) + self._starting < self._settings.warm_size
+            and self._total < self._settings.max_backends
+        ):
+            self._starting += 1
+            self._warm_starting += 1
+            self._task_group.start_soon(self._spawn_warm_backend)
+
+    def _reap_idle(self) -> None:
+        deadline = time.monotonic() - self._settings.idle_timeout
+        for backend in self._active:
+            if backend.outstanding == 0 and backend.last_used <= deadline and backend.scope:
+                logger.info("Closing idle session")
+                self.reaped += 1
+                backend.scope.cancel()
+
+    async def _acquire(self) -> _Backend:
+        if self._task_group is None:
+            raise RuntimeError("Session backends are not running")
+        while not self._warm and self._total >= self._settings.max_backends:
+            if not self._warm_starting:
+                msg = f"All {self._settings.max_backends} backends are serving sessions"
+                raise BackendLimitError(msg)
+            # Wait for the backend being warmed up rather than rejecting the session
+            await self._warm_added.wait()
+        if self._warm:
+            return self._warm.pop(0)
+        self._starting += 1
+        try:
+            return t.cast("_Backend", await self._task_group.start(self._run_backend))
+        finally:
+            self._starting -= 1
+
+    async def serve(self, run: SessionRunner) -> None:
+        """Run a session with a dedicated backend, stopping the backend when it ends.
+
+        Raises:
+            BackendLimitError: The maximum number of backends is already running.
+
+        """
+        backend = await self._acquire()
+        self._active.append(backend)
+        self._refill()
+        backend.last_used = time.monotonic()
+        try:
+            with anyio.CancelScope() as backend.scope:
+                await run(backend.app)
+        finally:
+            self._active.remove(backend)
+            backend.stopped.set()
+            self._refill()
+
+    def stats(self) -> dict[str, int]:
+        """Return the counters of the backends."""
+        return {
+            "active": self.active,
+            "warm": self.warm,
+            "spawned": self.spawned,
+            "reaped": self.reaped,
+        }
+
+
+# What serves sessions: a shared server, dedicated backends, or either once it is started
+SessionTarget = Server[object] | SessionBackends | Deferred[Server[object] | SessionBackends]
+
+
+async def serve_session(mcp_server: SessionTarget, run: SessionRunner) -> None:
+    """Run a session with a shared server or with a dedicated backend.
+
+    Sessions opened while the server is starting wait for it to be ready.
+    """
+    if isinstance(mcp_server, Deferred):
+        mcp_server = await mcp_server.get()
+    if isinstance(mcp_server, SessionBackends):
+        await mcp_server.serve(run)
+    else:
+        await run(mcp_server)
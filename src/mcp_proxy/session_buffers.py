@@ -0,0 +1,247 @@
+"""Bound the messages waiting to be sent to the client of an SSE session.
+
+Messages sent to a session are serialized once, then held in a buffer until its event stream
+takes them. A buffer holds up to a number of bytes, so that a slow or stalled client cannot
+make the proxy hold every result it is sent. A message that does not fit waits for room,
+is dropped when it is a notification, or closes the session, as configured.
+
+Sessions may also be pinged, so that clients answer even while they have nothing to send,
+and closed once their client stops sending messages, such as when its connection is dead.
+"""
+
+import itertools
+import logging
+import math
+import time
+import typing as t
+import uuid
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+import anyio
+from anyio.abc import ObjectReceiveStream, ObjectSendStream
+from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
+from mcp import types
+
+from .metrics import Labels
+
+logger = logging.getLogger(__name__)
+
+OverflowPolicy = t.Literal["block", "drop", "disconnect"]
+OVERFLOW_POLICIES: tuple[OverflowPolicy, ...] = t.get_args(OverflowPolicy)
+
+# Prefix of the IDs of heartbeat pings, which are strings unlike the IDs of server requests
+HEARTBEAT_ID_PREFIX = "mcp-proxy-heartbeat-"
+
+
+@dataclass
+class SessionBufferSettings:
+    """Settings for the buffers of the messages sent to sessions."""
+
+    # Bytes of messages held for a session before the next one overflows
+    max_bytes: int = 4 * 1024 * 1024
+    # Whether an overflowing message waits for room, is dropped if it is a notification,
+    # or closes the session
+    overflow: OverflowPolicy = "block"
+    # Seconds between pings of a session, None for none
+    heartbeat_interval: float | None = None
+    # Seconds without messages from the client after which its session is closed, None for never
+    idle_timeout: float | None = None
+
+
+class _Encoded:
+    """A message serialized once, for the SSE transport to send it as is."""
+
+    def __init__(self, message: types.JSONRPCMessage) -> None:
+        self.data = message.model_dump_json(by_alias=True, exclude_none=True)
+
+    def model_dump_json(self, **_: t.Any) -> str:  # noqa: ANN401
+        return self.data
+
+
+class _SessionBuffer(ObjectSendStream[types.JSONRPCMessage]):
+    """Messages waiting to be sent to the client of a session."""
+
+    def __init__(self, settings: SessionBufferSettings, buffers: "SessionBuffers") -> None:
+        self._settings = settings
+        self._buffers = buffers
+        self.key = uuid.uuid4().hex[:12]
+        self.buffered_bytes = 0
+        self.last_received = time.monotonic()
+        # Requests of the client not answered yet, during which the session is not idle
+        self.pending: set[types.RequestId] = set()
+        self.scope = anyio.CancelScope()
+        self._queue, self._queued = anyio.create_memory_object_stream[tuple[_Encoded, int]](
+            math.inf,
+        )
+        self._room = anyio.Event()
+
+    def _close_session(self, reason: str) -> None:
+        logger.warning("Closing session %s: %s", self.key, reason)
+        self.scope.cancel()
+
+    def _enqueue(self, encoded: _Encoded) -> None:
+        size = len(encoded.data)
+        self.buffered_bytes += size
+        self._queue.send_nowait((encoded, size))
+
+    async def send(self, item: types.JSONRPCMessage) -> None:
+        if self.scope.cancel_called:
+            raise anyio.BrokenResourceError
+        encoded = _Encoded(item)
+        size = len(encoded.data)
+        # A message larger than the buffer is sent alone rather than never
+        while self.buffered_bytes and self.buffered_bytes + size > self._settings.max_bytes:
+            if self._settings.overflow == "disconnect":
+                self._buffers.overflow_disconnects += 1
+                self._close_session(f"{self.buffered_bytes} bytes are waiting for the client")
+                # Tasks of the session are cancelled, while others, such as relays, get an error
+                await anyio.lowlevel.checkpoint()
+                raise anyio.BrokenResourceError
+            if self._settings.overflow == "drop" and isinstance(
+                item.root,
+                types.JSONRPCNotification,
+            ):
+                self._buffers.dropped_notifications += 1
+                logger.debug("Dropped a %s notification for a slow session", item.root.method)
+                return
+            # Responses cannot be dropped, so they wait even when notifications are dropped
+            await self._room.wait()
+        if isinstance(item.root, types.JSONRPCResponse | types.JSONRPCError):
+            self.pending.discard(item.root.id)
+        self._enqueue(encoded)
+
+    async def aclose(self) -> None:
+        await self._queue.aclose()
+
+    def received(self, message: types.JSONRPCMessage | Exception) -> bool:
+        """Record a message of the client, returning whether it is for the session."""
+        self.last_received = time.monotonic()
+        if isinstance(message, Exception):
+            return True
+        if isinstance(message.root, types.JSONRPCRequest):
+            self.pending.add(message.root.id)
+        elif isinstance(message.root, types.JSONRPCResponse | types.JSONRPCError):
+            request_id = message.root.id
+            return not (isinstance(request_id, str) and request_id.startswith(HEARTBEAT_ID_PREFIX))
+        return True
+
+    async def pump(self, write_stream: MemoryObjectSendStream[types.JSONRPCMessage]) -> None:
+        async with write_stream, self._queued:
+            async for encoded, size in self._queued:
+                await write_stream.send(t.cast("types.JSONRPCMessage", encoded))
+                self.buffered_bytes -= size
+                self._room.set()
+                self._room = anyio.Event()
+
+    async def ping(self, interval: float) -> None:
+        for count in itertools.count():
+            await anyio.sleep(interval)
+            # A client still being sent messages would only get the ping after them
+            if self.buffered_bytes:
+                continue
+            request = types.JSONRPCRequest(
+                jsonrpc="2.0",
+                id=f"{HEARTBEAT_ID_PREFIX}{count}",
+                method="ping",
+            )
+            self._enqueue(_Encoded(types.JSONRPCMessage(request)))
+            self._buffers.heartbeats += 1
+
+    async def reap(self, idle_timeout: float) -> None:
+        while True:
+            idle = time.monotonic() - self.last_received
+            if idle >= idle_timeout and not self.pending:
+                self._buffers.reaped_sessions += 1
+                self._close_session(f"no message from the client for {idle:.0f}s")
+                return
+            await anyio.sleep(max(idle_timeout - idle, idle_timeout / 4))
+
+
+class _ReceivedMessages(ObjectReceiveStream[types.JSONRPCMessage | Exception]):
+    """The messages of a client, without the answers to the heartbeats of its session."""
+
+    def __init__(
+        self,
+        stream: MemoryObjectReceiveStream[types.JSONRPCMessage | Exception],
+        buffer: _SessionBuffer,
+    ) -> None:
+        self._stream = stream
+        self._buffer = buffer
+
+    async def receive(self) -> types.JSONRPCMessage | Exception:
+        while True:
+            message = await self._stream.receive()
+            if self._buffer.received(message):
+                return message
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+class SessionBuffers:
+    """The buffers of the sessions of a server, and their counters."""
+
+    def __init__(self, settings: SessionBufferSettings | None = None) -> None:
+        """Create buffers with the given settings, or the default ones."""
+        self.settings = settings or SessionBufferSettings()
+        self.dropped_notifications = 0
+        self.overflow_disconnects = 0
+        self.reaped_sessions = 0
+        self.heartbeats = 0
+        self._buffers: dict[str, _SessionBuffer] = {}
+
+    @asynccontextmanager
+    async def open(
+        self,
+        read_stream: MemoryObjectReceiveStream[types.JSONRPCMessage | Exception],
+        write_stream: MemoryObjectSendStream[types.JSONRPCMessage],
+    ) -> AsyncIterator[
+        tuple[
+            MemoryObjectReceiveStream[types.JSONRPCMessage | Exception],
+            MemoryObjectSendStream[types.JSONRPCMessage],
+        ]
+    ]:
+        """Buffer the messages sent to a session, yielding the streams to serve it with.
+
+        The session is cancelled when it overflows with the disconnect policy or is idle.
+        """
+        buffer = _SessionBuffer(self.settings, self)
+        self._buffers[buffer.key] = buffer
+        try:
+            with buffer.scope:
+                async with anyio.create_task_group() as tg:
+                    tg.start_soon(buffer.pump, write_stream)
+                    if self.settings.heartbeat_interval is not None:
+                        tg.start_soon(buffer.ping, self.settings.heartbeat_interval)
+                    if self.settings.idle_timeout is not None:
+                        tg.start_soon(buffer.reap, self.settings.idle_timeout)
+                    # Servers only use the methods the wrappers have
+                    yield (
+                        t.cast(
+                            "MemoryObjectReceiveStream[t.Any]",
+                            _ReceivedMessages(read_stream, buffer),
+                        ),
+                        t.cast("MemoryObjectSendStream[t.Any]", buffer),
+                    )
+                    tg.cancel_scope.cancel()
+        finally:
+            del self._buffers[buffer.key]
+
+    def buffered_bytes(self) -> dict[Labels, float]:
+        """Return the bytes waiting to be sent, by session."""
+        return {(("session", key),): buffer.buffered_bytes for key, buffer in self._buffers.items()}
+
+    def stats(self) -> dict[str, int]:
+        """Return the counters of the buffers."""
+        buffered = [buffer.buffered_bytes for buffer in self._buffers.values()]
+        return {
+            "sessions": len(buffered),
+            "buffered_bytes": sum(buffered),
+            "max_buffered_bytes": max(buffered, default=0),
+            "dropped_notifications": self.dropped_notifications,
+            "overflow_disconnects": self.overflow_disconnects,
+            "reaped_sessions": self.reaped_sessions,
+            "heartbeats": self.heartbeats,
+        }
@@ -0,0 +1,68 @@
+"""Share a single upstream call among concurrent callers asking for the same thing."""
+
+import typing as t
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass, field
+
+import anyio
+
+T = t.TypeVar("T")
+
+
+@dataclass(eq=False)
+class _Call:
+    done: anyio.Event = field(default_factory=anyio.Event)
+    result: t.Any = None
+    error: Exception | None = None
+    completed: bool = False
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls with the same key.
+
+    The first caller of a key runs the call, and callers arriving while it is in flight wait
+    for its outcome: they all get the same result or the same exception. If the first caller
+    is cancelled, one of the waiting callers runs the call again.
+    """
+
+    def __init__(self) -> None:
+        """Create an instance with no calls in flight."""
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: dict[Hashable, _Call] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """Return the number of calls currently in flight."""
+        return len(self._in_flight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run the call for the key, or wait for the one already in flight."""
+        while (call := self._in_flight.get(key)) is not None:
+            self.coalesced += 1
+            await call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if call.completed:
+                return t.cast("T", call.result)
+            # The caller running it was cancelled, so retry
+            self.coalesced -= 1
+
+        call = _Call()
+        self._in_flight[key] = call
+        self.calls += 1
+        try:
+            result = await fn()
+        except Exception as e:
+            call.error = e
+            raise
+        else:
+            call.result, call.completed = result, True
+            return result
+        finally:
+            del self._in_flight[key]
+            call.done.set()
+
+    def stats(self) -> dict[str, int]:
+        """Return the counters of coalesced calls."""
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": self.in_flight}
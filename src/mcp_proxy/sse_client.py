@@ -1,27 +1,76 @@
 """Create a local server that proxies requests to a remote server over SSE."""
 
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from typing import Any
 
+import anyio
 from mcp.client.session import ClientSession
 from mcp.client.sse import sse_client
 from mcp.server.stdio import stdio_server
 
-from .proxy_server import create_proxy_server
+from .backend_pool import BackendPool, BackendPoolSettings
+from .proxy_server import ProxyOptions
+from .raw_proxy import ReadStream, WriteStream, create_raw_proxy_server
 
 
-async def run_sse_client(url: str, headers: dict[str, Any] | None = None) -> None:
+async def _relay_raw(
+    read_stream: ReadStream,
+    write_stream: WriteStream,
+    proxy_options: ProxyOptions,
+) -> None:
+    async with anyio.create_task_group() as tg:
+        app = await create_raw_proxy_server(read_stream, write_stream, proxy_options)
+        tg.start_soon(app.handle_remote_messages)
+        async with stdio_server() as (stdio_read_stream, stdio_write_stream):
+            await app.run(
+                stdio_read_stream,
+                stdio_write_stream,
+                app.create_initialization_options(),
+            )
+        tg.cancel_scope.cancel()
+
+
+async def run_sse_client(
+    url: str,
+    headers: dict[str, Any] | None = None,
+    proxy_options: ProxyOptions | None = None,
+    pool_settings: BackendPoolSettings | None = None,
+) -> None:
     """Run the SSE client.
 
+    The connection to the remote server is re-established with backoff when it is lost,
+    unless messages are relayed raw, over a single connection.
+
     Args:
         url: The URL to connect to.
         headers: Headers for connecting to MCP server.
+        proxy_options: Optional features of the proxy server.
+        pool_settings: Number of parallel sessions to the remote server and reconnection
+            settings. Default is a single session.
 
     """
-    async with sse_client(url=url, headers=headers) as streams, ClientSession(*streams) as session:
-        app = await create_proxy_server(session)
+    if proxy_options is not None and proxy_options.raw_relay:
+        async with sse_client(url=url, headers=headers) as (read_stream, write_stream):
+            await _relay_raw(read_stream, write_stream, proxy_options)
+        return
+
+    @asynccontextmanager
+    async def _sse_session() -> AsyncIterator[ClientSession]:
+        async with (
+            sse_client(url=url, headers=headers) as streams,
+            ClientSession(*streams) as session,
+        ):
+            yield session
+
+    pool = BackendPool(_sse_session, pool_settings or BackendPoolSettings(), proxy_options)
+    async with anyio.create_task_group() as tg:
+        await tg.start(pool.run)
+        app = pool.create_server()
         async with stdio_server() as (read_stream, write_stream):
             await app.run(
                 read_stream,
                 write_stream,
                 app.create_initialization_options(),
             )
+        tg.cancel_scope.cancel()
@@ -1,8 +1,13 @@
 """Create a local SSE server that proxies requests to a stdio MCP server."""
 
+import contextlib
+import functools
+from collections.abc import AsyncIterator, Awaitable, Callable, Mapping
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from typing import Literal
 
+import anyio
 import uvicorn
 from mcp.client.session import ClientSession
 from mcp.client.stdio import StdioServerParameters, stdio_client
@@ -12,9 +17,30 @@ from starlette.applications import Starlette
 from starlette.middleware import Middleware
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
-from starlette.routing import Mount, Route
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import BaseRoute, Mount, Route
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from .proxy_server import create_proxy_server
+from .aggregate import AggregateServer, BackendParameters, connect_backends
+from .backend_pool import BackendPool, BackendPoolSettings
+from .compression import Compression, CompressionMiddleware
+from .deferred import Deferred
+from .filters import current_client
+from .metrics import ProxyMetrics
+from .proxy_server import ProxyOptions, create_proxy_server
+from .raw_proxy import create_raw_proxy_server
+from .session_backends import (
+    BackendLimitError,
+    SessionBackends,
+    SessionBackendSettings,
+    SessionTarget,
+    serve_session,
+)
+from .session_buffers import SessionBuffers, SessionBufferSettings
+from .streamable_http import StreamableHttpTransport
+from .workers import Worker, WorkerRouter, run_workers
+
+StartBackend = Callable[[Deferred[Server[object] | SessionBackends]], Awaitable[None]]
 
 
 @dataclass
@@ -25,27 +51,180 @@ class SseServerSettings:
     port: int
     allow_origins: list[str] | None = None
     log_level: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] = "INFO"
+    # Number of processes serving on the port, each with its own backends
+    workers: int = 1
+    # Size of the smallest response body compressed for clients accepting it, None for none
+    compress_min_size: int | None = None
+    # Bounds of the messages held for every SSE session, and its heartbeats and idle timeout.
+    # Messages are handed to the transport as they are sent when None
+    session_buffers: SessionBufferSettings | None = None
+
+
+def _count_sent_bytes(send: Send, metrics: ProxyMetrics) -> Send:
+    async def _send(message: Message) -> None:
+        if message["type"] == "http.response.body":
+            metrics.bytes_sent += len(message.get("body", b""))
+        await send(message)
+
+    return _send
+
+
+def _count_received_bytes(receive: Receive, metrics: ProxyMetrics) -> Receive:
+    async def _receive() -> Message:
+        message = await receive()
+        if message["type"] == "http.request":
+            metrics.bytes_received += len(message.get("body", b""))
+        return message
+
+    return _receive
+
+
+class _CountBytes:
+    """ASGI middleware counting the bytes of request and response bodies."""
+
+    def __init__(self, app: ASGIApp, metrics: ProxyMetrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.app(
+            scope,
+            _count_received_bytes(receive, self.metrics),
+            _count_sent_bytes(send, self.metrics),
+        )
+
+
+class _IdentifyClient:
+    """ASGI middleware telling the proxy which client sent a request, from one of its headers.
+
+    Sessions keep the client of the request opening them.
+    """
+
+    def __init__(self, app: ASGIApp, header: str) -> None:
+        self.app = app
+        self.header = header.lower().encode("latin-1")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        client = next(
+            (value.decode("latin-1") for name, value in scope["headers"] if name == self.header),
+            None,
+        )
+        token = current_client.set(client)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_client.reset(token)
+
+
+def _create_sse_endpoint(
+    sse: SseServerTransport,
+    mcp_server: SessionTarget,
+    metrics: ProxyMetrics | None,
+    session_buffers: SessionBuffers | None,
+) -> Callable[[Request], Awaitable[Response | None]]:
+    async def handle_sse(request: Request) -> Response | None:
+        async def _run(server: Server[object]) -> None:
+            async with contextlib.AsyncExitStack() as stack:
+                read_stream, write_stream = await stack.enter_async_context(
+                    sse.connect_sse(
+                        request.scope,
+                        request.receive,
+                        request._send,  # noqa: SLF001
+                    ),
+                )
+                if session_buffers is not None:
+                    read_stream, write_stream = await stack.enter_async_context(
+                        session_buffers.open(read_stream, write_stream),
+                    )
+                await server.run(
+                    read_stream,
+                    write_stream,
+                    server.create_initialization_options(),
+                )
 
+        if metrics is not None:
+            metrics.sse_connections += 1
+            metrics.sse_connections_total += 1
+        try:
+            await serve_session(mcp_server, _run)
+        except BackendLimitError as e:
+            return PlainTextResponse(str(e), status_code=503)
+        finally:
+            if metrics is not None:
+                metrics.sse_connections -= 1
+        return None
 
-def create_starlette_app(
-    mcp_server: Server[object],
+    return handle_sse
+
+
+def _create_ready_endpoint(
+    mcp_server: SessionTarget,
+) -> Callable[[Request], Awaitable[PlainTextResponse]]:
+    async def handle_ready(_: Request) -> PlainTextResponse:
+        if isinstance(mcp_server, Deferred) and not mcp_server.ready:
+            return PlainTextResponse("starting", status_code=503)
+        return PlainTextResponse("ready")
+
+    return handle_ready
+
+
+def create_starlette_app(  # noqa: C901, PLR0913
+    mcp_server: SessionTarget,
     *,
     allow_origins: list[str] | None = None,
     debug: bool = False,
+    metrics: ProxyMetrics | None = None,
+    worker: Worker | None = None,
+    client_header: str | None = None,
+    compression: Compression | None = None,
+    session_buffers: SessionBuffers | None = None,
 ) -> Starlette:
-    """Create a Starlette application that can server the provied mcp server with SSE."""
-    sse = SseServerTransport("/messages/")
-
-    async def handle_sse(request: Request) -> None:
-        async with sse.connect_sse(
-            request.scope,
-            request.receive,
-            request._send,  # noqa: SLF001
-        ) as (read_stream, write_stream):
-            await mcp_server.run(
-                read_stream,
-                write_stream,
-                mcp_server.create_initialization_options(),
+    """Create a Starlette application that can server the provied mcp server with SSE.
+
+    The server is also available over the streamable HTTP transport at `/mcp`. When given
+    session backends instead of a server, every session is served by a dedicated backend.
+    When the server is deferred, sessions wait for it to be set and `/ready` answers with
+    status 503 until then. When served by a worker, requests of the sessions of other
+    workers are forwarded to them. When given a client header, sessions are served as the
+    client it names. When given compression settings, responses are compressed for the
+    clients accepting it and compressed request bodies are decompressed. When given session
+    buffers, the messages held for every SSE session are bounded by them.
+    """
+    sse = SseServerTransport(worker.message_endpoint if worker is not None else "/messages/")
+    streamable_http = StreamableHttpTransport(
+        mcp_server,
+        session_id_prefix=worker.session_id_prefix if worker is not None else "",
+    )
+
+    @asynccontextmanager
+    async def lifespan(_: Starlette) -> AsyncIterator[None]:
+        async with streamable_http.run():
+            yield
+
+    routes: list[BaseRoute] = [
+        Route("/sse", endpoint=_create_sse_endpoint(sse, mcp_server, metrics, session_buffers)),
+        Mount("/messages/", app=sse.handle_post_message),
+        Route("/mcp", endpoint=streamable_http, methods=["GET", "POST", "DELETE"]),
+        Route("/ready", endpoint=_create_ready_endpoint(mcp_server)),
+    ]
+    if metrics is not None:
+
+        async def handle_metrics(_: Request) -> PlainTextResponse:
+            return PlainTextResponse(
+                metrics.render(),
+                media_type="text/plain; version=0.0.4",
+            )
+
+        routes.append(Route("/metrics", endpoint=handle_metrics))
+        if session_buffers is not None:
+            metrics.register_collector("session_buffers", session_buffers.stats)
+            metrics.register_gauge(
+                "session_buffered_bytes",
+                "Bytes of messages waiting to be sent to an SSE session.",
+                session_buffers.buffered_bytes,
             )
 
     middleware: list[Middleware] = []
@@ -58,44 +237,214 @@ def create_starlette_app(
                 allow_headers=["*"],
             ),
         )
+    if worker is not None:
+        # Forwarded requests are counted by the worker serving them
+        middleware.append(Middleware(WorkerRouter, worker=worker))
+    if metrics is not None:
+        middleware.append(Middleware(_CountBytes, metrics=metrics))
+    if compression is not None:
+        # Inside the byte counts, so that they count the bytes sent and received
+        middleware.append(Middleware(CompressionMiddleware, compression=compression))
+        if metrics is not None:
+            metrics.register_collector("compression", compression.stats)
+    if client_header is not None:
+        middleware.append(Middleware(_IdentifyClient, header=client_header))
 
     return Starlette(
         debug=debug,
         middleware=middleware,
-        routes=[
-            Route("/sse", endpoint=handle_sse),
-            Mount("/messages/", app=sse.handle_post_message),
-        ],
+        routes=routes,
+        lifespan=lifespan,
+    )
+
+
+@asynccontextmanager
+async def _stdio_session(stdio_params: StdioServerParameters) -> AsyncIterator[ClientSession]:
+    async with stdio_client(stdio_params) as streams, ClientSession(*streams) as session:
+        yield session
+
+
+async def _serve_http(
+    mcp_server: SessionTarget,
+    sse_settings: SseServerSettings,
+    proxy_options: ProxyOptions | None,
+    worker: Worker | None,
+) -> None:
+    tool_filter = proxy_options.tool_filter if proxy_options is not None else None
+    # Bind SSE request handling to MCP server
+    starlette_app = create_starlette_app(
+        mcp_server,
+        allow_origins=sse_settings.allow_origins,
+        debug=(sse_settings.log_level == "DEBUG"),
+        metrics=proxy_options.metrics if proxy_options is not None else None,
+        worker=worker,
+        client_header=tool_filter.client_header if tool_filter is not None else None,
+        compression=(
+            Compression(sse_settings.compress_min_size)
+            if sse_settings.compress_min_size is not None
+            else None
+        ),
+        session_buffers=(
+            SessionBuffers(sse_settings.session_buffers)
+            if sse_settings.session_buffers is not None
+            else None
+        ),
+    )
+
+    # Configure HTTP server
+    config = uvicorn.Config(
+        starlette_app,
+        host=sse_settings.bind_host,
+        port=sse_settings.port,
+        log_level=sse_settings.log_level.lower(),
+    )
+    http_server = uvicorn.Server(config)
+    await http_server.serve(sockets=worker.listen() if worker is not None else None)
+
+
+async def _start_backend(
+    server: Deferred[Server[object] | SessionBackends],
+    stdio_params: StdioServerParameters,
+    pool_settings: BackendPoolSettings | None,
+    proxy_options: ProxyOptions | None,
+    session_settings: SessionBackendSettings | None,
+) -> None:
+    if session_settings is not None:
+        backends = SessionBackends(
+            lambda: _stdio_session(stdio_params),
+            session_settings,
+            proxy_options,
+        )
+        async with anyio.create_task_group() as tg:
+            await tg.start(backends.run)
+            server.set(backends)
+        return
+
+    if pool_settings is not None:
+        pool = BackendPool(lambda: _stdio_session(stdio_params), pool_settings, proxy_options)
+        async with anyio.create_task_group() as tg:
+            await tg.start(pool.run)
+            server.set(pool.create_server())
+        return
+
+    if proxy_options is not None and proxy_options.raw_relay:
+        async with (
+            stdio_client(stdio_params) as (read_stream, write_stream),
+            anyio.create_task_group() as tg,
+        ):
+            raw_server = await create_raw_proxy_server(read_stream, write_stream, proxy_options)
+            tg.start_soon(raw_server.handle_remote_messages)
+            server.set(raw_server)
+            await anyio.sleep_forever()
+
+    async with _stdio_session(stdio_params) as session, anyio.create_task_group() as tg:
+        mcp_server = await create_proxy_server(session, proxy_options)
+        tg.start_soon(mcp_server.handle_remote_messages)
+        server.set(mcp_server)
+        await anyio.sleep_forever()
+
+
+async def _start_aggregate(
+    server: Deferred[Server[object] | SessionBackends],
+    backends: Mapping[str, BackendParameters],
+    proxy_options: ProxyOptions | None,
+) -> None:
+    async with connect_backends(backends, proxy_options) as servers:
+        server.set(AggregateServer(servers))
+        await anyio.sleep_forever()
+
+
+async def _serve(
+    start_backend: StartBackend,
+    sse_settings: SseServerSettings,
+    proxy_options: ProxyOptions | None,
+    worker: Worker | None = None,
+) -> None:
+    server = Deferred[Server[object] | SessionBackends]()
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(start_backend, server)
+        await _serve_http(server, sse_settings, proxy_options, worker)
+        tg.cancel_scope.cancel()
+
+
+def _serve_worker(
+    start_backend: StartBackend,
+    sse_settings: SseServerSettings,
+    proxy_options: ProxyOptions | None,
+    worker: Worker,
+) -> None:
+    # Interrupting the supervisor interrupts its workers too, which stop quietly
+    with contextlib.suppress(KeyboardInterrupt):
+        anyio.run(_serve, start_backend, sse_settings, proxy_options, worker)
+
+
+async def _run(
+    start_backend: StartBackend,
+    sse_settings: SseServerSettings,
+    proxy_options: ProxyOptions | None,
+) -> None:
+    if sse_settings.workers <= 1:
+        await _serve(start_backend, sse_settings, proxy_options)
+        return
+    # Every worker starts its own backends, and has its own caches and metrics
+    await run_workers(
+        sse_settings.workers,
+        sse_settings.bind_host,
+        sse_settings.port,
+        functools.partial(_serve_worker, start_backend, sse_settings, proxy_options),
     )
 
 
 async def run_sse_server(
     stdio_params: StdioServerParameters,
     sse_settings: SseServerSettings,
+    pool_settings: BackendPoolSettings | None = None,
+    proxy_options: ProxyOptions | None = None,
+    session_settings: SessionBackendSettings | None = None,
 ) -> None:
     """Run the stdio client and expose an SSE server.
 
+    The HTTP server listens right away while the stdio server starts in the background.
+    Sessions opened in the meantime wait for it, and `/ready` tells when it is ready.
+
     Args:
         stdio_params: The parameters for the stdio client that spawns a stdio server.
         sse_settings: The settings for the SSE server that accepts incoming requests.
+        pool_settings: When given, spawn a pool of stdio servers instead of a single one.
+        proxy_options: Optional features of the proxy server.
+        session_settings: When given, spawn a dedicated stdio server for every session
+            instead of sharing one between sessions. Takes precedence over pool_settings.
 
     """
-    async with stdio_client(stdio_params) as streams, ClientSession(*streams) as session:
-        mcp_server = await create_proxy_server(session)
+    start_backend = functools.partial(
+        _start_backend,
+        stdio_params=stdio_params,
+        pool_settings=pool_settings,
+        proxy_options=proxy_options,
+        session_settings=session_settings,
+    )
+    await _run(start_backend, sse_settings, proxy_options)
 
-        # Bind SSE request handling to MCP server
-        starlette_app = create_starlette_app(
-            mcp_server,
-            allow_origins=sse_settings.allow_origins,
-            debug=(sse_settings.log_level == "DEBUG"),
-        )
 
-        # Configure HTTP server
-        config = uvicorn.Config(
-            starlette_app,
-            host=sse_settings.bind_host,
-            port=sse_settings.port,
-            log_level=sse_settings.log_level.lower(),
-        )
-        http_server = uvicorn.Server(config)
-        await http_server.serve()
+async def run_aggregate_sse_server(
+    backends: Mapping[str, BackendParameters],
+    sse_settings: SseServerSettings,
+    proxy_options: ProxyOptions | None = None,
+) -> None:
+    """Connect to many backends and expose them as a single SSE server.
+
+    The HTTP server listens right away while the backends start in the background.
+
+    Args:
+        backends: The parameters of the stdio or SSE backends, by name. Their tools and
+            prompts are exposed under names prefixed with the name of their backend.
+        sse_settings: The settings for the SSE server that accepts incoming requests.
+        proxy_options: Optional features of the proxy servers wrapping every backend.
+
+    """
+    start_backends = functools.partial(
+        _start_aggregate,
+        backends=dict(backends),
+        proxy_options=proxy_options,
+    )
+    await _run(start_backends, sse_settings, proxy_options)
@@ -0,0 +1,330 @@
+"""Serve an MCP server over the streamable HTTP transport.
+
+Clients POST JSON-RPC messages to a single endpoint and get the responses to their requests
+in the body of the same HTTP response, either as JSON or as an SSE stream. Unlike the SSE
+transport, no connection has to stay open between requests, so short-lived calls release
+their connection as soon as they are answered.
+"""
+
+import contextlib
+import json
+import logging
+import time
+import typing as t
+import uuid
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+import anyio
+from anyio.abc import TaskGroup, TaskStatus
+from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
+from mcp import types
+from mcp.server import Server
+from pydantic import ValidationError
+from sse_starlette import EventSourceResponse
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from .session_backends import BackendLimitError, SessionTarget, serve_session
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID_HEADER = "mcp-session-id"
+
+RequestId = str | int
+
+
+@dataclass(eq=False)
+class _PendingRequest:
+    stream: MemoryObjectSendStream[types.JSONRPCMessage]
+    # Whether messages sent by the server while the request is pending can be relayed
+    streaming: bool
+
+
+@dataclass(eq=False)
+class _Session:
+    session_id: str
+    read_stream_writer: MemoryObjectSendStream[types.JSONRPCMessage | Exception]
+    cancel_scope: anyio.CancelScope = field(default_factory=anyio.CancelScope)
+    pending: dict[RequestId, _PendingRequest] = field(default_factory=dict)
+    last_seen: float = field(default_factory=time.monotonic)
+
+
+def _jsonrpc_error(code: int, message: str, status_code: int) -> JSONResponse:
+    return JSONResponse(
+        {"jsonrpc": "2.0", "id": None, "error": {"code": code, "message": message}},
+        status_code=status_code,
+    )
+
+
+def _dump(message: types.JSONRPCMessage) -> dict[str, t.Any]:
+    return t.cast(
+        "dict[str, t.Any]",
+        message.model_dump(by_alias=True, mode="json", exclude_none=True),
+    )
+
+
+class StreamableHttpTransport:
+    """Streamable HTTP transport for an MCP server.
+
+    Instances are ASGI applications. `run()` owns the sessions and has to be running while
+    they serve HTTP requests, typically for the lifespan of the web application.
+    """
+
+    def __init__(
+        self,
+        mcp_server: SessionTarget,
+        *,
+        stream_responses: bool = False,
+        session_idle_timeout: float = 30 * 60,
+        session_id_prefix: str = "",
+    ) -> None:
+        """Create a transport for the given server.
+
+        Args:
+            mcp_server: The MCP server to serve, or backends dedicated to each session. When
+                deferred, sessions opened before it is set wait for it.
+            stream_responses: Answer requests with an SSE stream, so that notifications sent
+                while they are handled reach the client. Otherwise, requests are answered with
+                JSON unless the client only accepts an SSE stream.
+            session_idle_timeout: Seconds after which a session without requests is closed.
+            session_id_prefix: Prefix of the session IDs, telling which worker holds them.
+
+        """
+        self._mcp_server = mcp_server
+        self._stream_responses = stream_responses
+        self._session_idle_timeout = session_idle_timeout
+        self._session_id_prefix = session_id_prefix
+        self._sessions: dict[str, _Session] = {}
+        self._task_group: TaskGroup | None = None
+
+    @property
+    def session_count(self) -> int:
+        """Return the number of open sessions."""
+        return len(self._sessions)
+
+    @asynccontextmanager
+    async def run(self) -> AsyncIterator[None]:
+        """Run the transport, closing every session on exit."""
+        async with anyio.create_task_group() as tg:
+            self._task_group = tg
+            tg.start_soon(self._reap_idle_sessions)
+            try:
+                yield
+            finally:
+                self._task_group = None
+                tg.cancel_scope.cancel()
+
+    async def _reap_idle_sessions(self) -> None:
+        while True:
+            await anyio.sleep(self._session_idle_timeout / 4)
+            deadline = time.monotonic() - self._session_idle_timeout
+            for session in list(self._sessions.values()):
+                if not session.pending and session.last_seen <= deadline:
+                    logger.debug("Closing idle session %s", session.session_id)
+                    session.cancel_scope.cancel()
+
+    async def _run_session(self, *, task_status: TaskStatus[_Session]) -> None:
+        read_stream_writer, read_stream = anyio.create_memory_object_stream[
+            types.JSONRPCMessage | Exception
+        ](0)
+        write_stream, write_stream_reader = anyio.create_memory_object_stream[types.JSONRPCMessage](
+            0,
+        )
+        session = _Session(
+            session_id=self._session_id_prefix + uuid.uuid4().hex,
+            read_stream_writer=read_stream_writer,
+        )
+
+        async def _run(mcp_server: Server[object]) -> None:
+            self._sessions[session.session_id] = session
+            try:
+                with session.cancel_scope:
+                    async with anyio.create_task_group() as tg:
+                        tg.start_soon(self._route_server_messages, session, write_stream_reader)
+                        task_status.started(session)
+                        await mcp_server.run(
+                            read_stream,
+                            write_stream,
+                            mcp_server.create_initialization_options(),
+                        )
+            finally:
+                del self._sessions[session.session_id]
+                for pending in session.pending.values():
+                    pending.stream.close()
+
+        await serve_session(self._mcp_server, _run)
+
+    async def _route_server_messages(
+        self,
+        session: _Session,
+        write_stream_reader: MemoryObjectReceiveStream[types.JSONRPCMessage],
+    ) -> None:
+        async with write_stream_reader:
+            async for message in write_stream_reader:
+                if isinstance(message.root, types.JSONRPCResponse | types.JSONRPCError):
+                    pending = session.pending.pop(message.root.id, None)
+                    if pending is None:
+                        logger.warning("Dropping response to unknown request %s", message.root.id)
+                        continue
+                    await self._deliver(session, message.root.id, pending, message)
+                    pending.stream.close()
+                    continue
+
+                receivers = [
+                    (request_id, pending)
+                    for request_id, pending in session.pending.items()
+                    if pending.streaming
+                ]
+                if not receivers and isinstance(message.root, types.JSONRPCRequest):
+                    # The server would otherwise wait for an answer that never comes
+                    await self._reject_server_request(session, message.root)
+                elif not receivers:
+                    logger.debug("Dropping server message without a stream: %s", message)
+                for request_id, pending in receivers:
+                    await self._deliver(session, request_id, pending, message)
+
+    @staticmethod
+    async def _reject_server_request(session: _Session, request: types.JSONRPCRequest) -> None:
+        logger.debug("Rejecting %s request of the server without a stream", request.method)
+        error = types.JSONRPCError(
+            jsonrpc="2.0",
+            id=request.id,
+            error=types.ErrorData(
+                code=types.INTERNAL_ERROR,
+                message=(
+                    f"Cannot send a {request.method} request to a client answered with JSON, "
+                    "the client has to accept an event stream"
+                ),
+            ),
+        )
+        with contextlib.suppress(anyio.BrokenResourceError, anyio.ClosedResourceError):
+            await session.read_stream_writer.send(types.JSONRPCMessage(error))
+
+    @staticmethod
+    async def _deliver(
+        session: _Session,
+        request_id: RequestId,
+        pending: _PendingRequest,
+        message: types.JSONRPCMessage,
+    ) -> None:
+        try:
+            await pending.stream.send(message)
+        except (anyio.BrokenResourceError, anyio.ClosedResourceError):
+            # The client disconnected before its request was answered, which must not stop
+            # the messages of the session, nor the transport running it
+            logger.debug("Dropping message for request %s, whose client is gone", request_id)
+            session.pending.pop(request_id, None)
+            pending.stream.close()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle an HTTP request to the MCP endpoint as an ASGI application."""
+        request = Request(scope, receive)
+        if request.method == "POST":
+            response = await self._handle_post(request)
+        elif request.method == "DELETE":
+            response = self._handle_delete(request)
+        else:
+            # There is no standalone stream for messages that are not related to a request
+            response = Response(status_code=405, headers={"Allow": "POST, DELETE"})
+        await response(scope, receive, send)
+
+    def _get_session(self, request: Request) -> _Session | Response:
+        session_id = request.headers.get(SESSION_ID_HEADER)
+        if session_id is None:
+            return _jsonrpc_error(types.INVALID_REQUEST, "Missing session ID", 400)
+        session = self._sessions.get(session_id)
+        if session is None:
+            return _jsonrpc_error(types.INVALID_REQUEST, "Session not found", 404)
+        return session
+
+    def _handle_delete(self, request: Request) -> Response:
+        session = self._get_session(request)
+        if isinstance(session, Response):
+            return session
+        session.cancel_scope.cancel()
+        return Response(status_code=200)
+
+    async def _open_session(
+        self,
+        request: Request,
+        requests: list[types.JSONRPCRequest],
+    ) -> _Session | Response:
+        if not any(jsonrpc_request.method == "initialize" for jsonrpc_request in requests):
+            return self._get_session(request)
+        if self._task_group is None:
+            return _jsonrpc_error(types.INTERNAL_ERROR, "Transport is not running", 503)
+        try:
+            return t.cast("_Session", await self._task_group.start(self._run_session))
+        except BackendLimitError as e:
+            return _jsonrpc_error(types.INTERNAL_ERROR, str(e), 503)
+
+    async def _handle_post(self, request: Request) -> Response:
+        if self._task_group is None:
+            return _jsonrpc_error(types.INTERNAL_ERROR, "Transport is not running", 503)
+        try:
+            body = json.loads(await request.body())
+            batch = isinstance(body, list)
+            messages = [
+                types.JSONRPCMessage.model_validate(item) for item in (body if batch else [body])
+            ]
+        except (json.JSONDecodeError, ValidationError) as e:
+            logger.warning("Failed to parse message: %s", e)
+            return _jsonrpc_error(types.PARSE_ERROR, "Could not parse message", 400)
+
+        requests = [
+            message.root for message in messages if isinstance(message.root, types.JSONRPCRequest)
+        ]
+        found = await self._open_session(request, requests)
+        if isinstance(found, Response):
+            return found
+        session = found
+        session.last_seen = time.monotonic()
+
+        if not requests:
+            for message in messages:
+                await session.read_stream_writer.send(message)
+            return Response(status_code=202, headers={SESSION_ID_HEADER: session.session_id})
+
+        accept = request.headers.get("accept", "")
+        streaming = self._stream_responses or (
+            "text/event-stream" in accept and "application/json" not in accept
+        )
+        writer, reader = anyio.create_memory_object_stream[types.JSONRPCMessage](
+            float("inf") if streaming else len(requests),
+        )
+        with writer:
+            for jsonrpc_request in requests:
+                session.pending[jsonrpc_request.id] = _PendingRequest(writer.clone(), streaming)
+        for message in messages:
+            await session.read_stream_writer.send(message)
+        return await self._respond(session, reader, batch=batch, streaming=streaming)
+
+    @staticmethod
+    async def _respond(
+        session: _Session,
+        reader: MemoryObjectReceiveStream[types.JSONRPCMessage],
+        *,
+        batch: bool,
+        streaming: bool,
+    ) -> Response:
+        headers = {SESSION_ID_HEADER: session.session_id}
+        if streaming:
+
+            async def _events() -> AsyncIterator[dict[str, str]]:
+                async with reader:
+                    async for message in reader:
+                        yield {
+                            "event": "message",
+                            "data": message.model_dump_json(by_alias=True, exclude_none=True),
+                        }
+
+            return EventSourceResponse(_events(), headers=headers)
+
+        async with reader:
+            responses = [_dump(message) async for message in reader]
+        if not responses:
+            return _jsonrpc_error(types.INTERNAL_ERROR, "Session closed", 500)
+        return JSONResponse(responses if batch else responses[0], headers=headers)
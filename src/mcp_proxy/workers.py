@@ -0,0 +1,249 @@
+"""Serve the HTTP server from many worker processes sharing its port.
+
+Every worker is a process with its own event loop, backends and caches. Workers listen on
+the port of the server with SO_REUSEPORT, so that the kernel spreads connections over them,
+but the requests of a session may arrive on any connection: the POST requests of an SSE
+session are sent apart from its stream, and streamable HTTP requests each open their own.
+The message endpoint of SSE sessions and the IDs of streamable HTTP sessions carry the index
+of the worker holding them, and a worker receiving a request of a session of another worker
+forwards it to that worker over its Unix socket.
+"""
+
+import logging
+import multiprocessing
+import re
+import socket
+import tempfile
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from multiprocessing.context import SpawnContext
+from pathlib import Path
+
+import anyio
+import httpx
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a worker that exited is started again
+RESTART_DELAY = 1.0
+# Seconds a stopped worker is given to close its connections before it is killed
+STOP_TIMEOUT = 5.0
+# Seconds to connect to a worker and send it a forwarded request
+FORWARD_TIMEOUT = 10.0
+
+MESSAGE_PATH = re.compile(r"^/messages/(\d+)/")
+SESSION_ID_HEADER = b"mcp-session-id"
+# Headers of a connection, not of the request or response forwarded over it
+HOP_BY_HOP_HEADERS = frozenset({b"connection", b"keep-alive", b"transfer-encoding", b"host"})
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    family, kind, _, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+    sock = socket.socket(family, kind)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(address)
+    return sock
+
+
+@dataclass(frozen=True)
+class Worker:
+    """A worker process of the HTTP server."""
+
+    index: int
+    # Number of workers of the server
+    count: int
+    host: str
+    port: int
+    # Directory of the Unix sockets the workers forward requests to each other over
+    socket_dir: str
+
+    @property
+    def message_endpoint(self) -> str:
+        """Return the endpoint SSE sessions of the worker post their messages to."""
+        return f"/messages/{self.index}/"
+
+    @property
+    def session_id_prefix(self) -> str:
+        """Return the prefix of the IDs of streamable HTTP sessions of the worker."""
+        return f"{self.index}-"
+
+    def socket_path(self, index: int) -> Path:
+        """Return the path of the Unix socket of a worker."""
+        return Path(self.socket_dir) / f"worker-{index}.sock"
+
+    def listen(self) -> list[socket.socket]:
+        """Return the sockets of the server port and of the worker, listening."""
+        public = _bind(self.host, self.port)
+        private = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket_path(self.index).unlink(missing_ok=True)
+        private.bind(str(self.socket_path(self.index)))
+        for sock in (public, private):
+            sock.listen(socket.SOMAXCONN)
+        return [public, private]
+
+    def owner(self, scope: Scope) -> int | None:
+        """Return the index of the worker holding the session of a request.
+
+        None is returned for requests opening a session or without one.
+        """
+        index: int | None = None
+        if match := MESSAGE_PATH.match(scope["path"]):
+            index = int(match.group(1))
+        elif scope["path"] == "/mcp":
+            for name, value in scope["headers"]:
+                if name == SESSION_ID_HEADER:
+                    prefix, separator, _ = value.decode("latin-1").partition("-")
+                    index = int(prefix) if separator and prefix.isdigit() else None
+        return index if index is not None and index < self.count else None
+
+
+class WorkerRouter:
+    """ASGI middleware forwarding the requests of sessions held by other workers."""
+
+    def __init__(self, app: ASGIApp, worker: Worker) -> None:
+        """Wrap the application of a worker."""
+        self.app = app
+        self.worker = worker
+        self._clients: dict[int, httpx.AsyncClient] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Serve a request, or forward it to the worker holding its session."""
+        if scope["type"] == "lifespan":
+            await self.app(scope, receive, self._closing_clients(send))
+            return
+        owner = self.worker.owner(scope) if scope["type"] == "http" else None
+        if owner is None or owner == self.worker.index:
+            await self.app(scope, receive, send)
+            return
+        await self._forward(owner, scope, receive, send)
+
+    def _closing_clients(self, send: Send) -> Send:
+        async def _send(message: Message) -> None:
+            if message["type"] == "lifespan.shutdown.complete":
+                for client in self._clients.values():
+                    await client.aclose()
+            await send(message)
+
+        return _send
+
+    def _client(self, index: int) -> httpx.AsyncClient:
+        if index not in self._clients:
+            self._clients[index] = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=str(self.worker.socket_path(index))),
+                base_url="http://worker",
+                # Responses streaming the messages of a session are read for as long as it lasts
+                timeout=httpx.Timeout(FORWARD_TIMEOUT, read=None),
+            )
+        return self._clients[index]
+
+    async def _forward(self, index: int, scope: Scope, receive: Receive, send: Send) -> None:
+        client = self._client(index)
+        request = client.build_request(
+            scope["method"],
+            httpx.URL(scope["path"], query=scope["query_string"]),
+            headers=[
+                (name, value) for name, value in scope["headers"] if name not in HOP_BY_HOP_HEADERS
+            ],
+            content=await Request(scope, receive).body(),
+        )
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.TransportError:
+            logger.warning("Worker %d is not available to serve its session", index)
+            await PlainTextResponse("Worker of the session is not available", status_code=502)(
+                scope,
+                receive,
+                send,
+            )
+            return
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": response.status_code,
+                    "headers": [
+                        (name, value)
+                        for name, value in response.headers.raw
+                        if name.lower() not in HOP_BY_HOP_HEADERS
+                    ],
+                },
+            )
+            # Streamed responses are relayed as they are received
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+
+@contextmanager
+def _reserved_port(host: str, port: int) -> Iterator[int]:
+    # The port is bound without listening, so that the workers bind the same one even when
+    # it is chosen by the system, and no connection waits on the socket of the supervisor
+    sock = _bind(host, port)
+    try:
+        yield sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+async def _supervise(
+    context: SpawnContext,
+    target: Callable[[Worker], None],
+    worker: Worker,
+) -> None:
+    while True:
+        process = context.Process(
+            target=target,
+            args=(worker,),
+            name=f"mcp-proxy-worker-{worker.index}",
+        )
+        process.start()
+        try:
+            await anyio.to_thread.run_sync(process.join, abandon_on_cancel=True)
+        finally:
+            with anyio.CancelScope(shield=True):
+                if process.is_alive():
+                    process.terminate()
+                    await anyio.to_thread.run_sync(process.join, STOP_TIMEOUT)
+                if process.is_alive():
+                    process.kill()
+                    await anyio.to_thread.run_sync(process.join)
+        logger.warning(
+            "Worker %d exited with code %s, restarting it",
+            worker.index,
+            process.exitcode,
+        )
+        await anyio.sleep(RESTART_DELAY)
+
+
+async def run_workers(count: int, host: str, port: int, target: Callable[[Worker], None]) -> None:
+    """Run worker processes serving on the same port until cancelled.
+
+    Workers that exit are started again.
+
+    Args:
+        count: Number of worker processes.
+        host: Host the workers listen on.
+        port: Port the workers listen on, or 0 for a port chosen by the system.
+        target: Serves HTTP in a worker until it is stopped. It is run in a new process, so it
+            and its arguments have to be picklable.
+
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("Workers need SO_REUSEPORT, which is not supported on this platform")
+    context = multiprocessing.get_context("spawn")
+    with (
+        tempfile.TemporaryDirectory(prefix="mcp-proxy-") as socket_dir,
+        _reserved_port(host, port) as reserved,
+    ):
+        logger.info("Starting %d workers on %s:%d", count, host, reserved)
+        template = Worker(0, count, host, reserved, socket_dir)
+        async with anyio.create_task_group() as tg:
+            for index in range(count):
+                tg.start_soon(_supervise, context, target, replace(template, index=index))
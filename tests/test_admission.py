@@ -0,0 +1,58 @@
+"""Tests for the admission controller."""
+
+import anyio
+import pytest
+
+from mcp_proxy.admission import AdmissionController, AdmissionRejectedError
+
+
+async def test_released_slots_go_to_higher_priority_calls_first() -> None:
+    """A queued read goes ahead of a tool call queued before it."""
+    admission = AdmissionController(max_concurrent=1)
+    release = anyio.Event()
+    order: list[str] = []
+
+    async def _call(method: str, tool: str = "") -> None:
+        async with admission.admit(method, tool):
+            order.append(method)
+            await release.wait()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(_call, "tools/list")
+        while not order:  # noqa: ASYNC110
+            await anyio.sleep(1e-3)
+        tg.start_soon(_call, "tools/call", "heavy")
+        while admission.waiting < 1:  # noqa: ASYNC110
+            await anyio.sleep(1e-3)
+        tg.start_soon(_call, "resources/read")
+        while admission.waiting < 2:  # noqa: ASYNC110, PLR2004
+            await anyio.sleep(1e-3)
+        release.set()
+
+    assert order == ["tools/list", "resources/read", "tools/call"]
+    assert admission.stats()["admitted"] == 3  # noqa: PLR2004
+
+
+async def test_calls_are_rejected_when_queue_is_full() -> None:
+    """Calls beyond the per tool limit and the queue size are rejected immediately."""
+    admission = AdmissionController(tool_limits={"slow_*": 1}, max_queued=0)
+    async with admission.admit("tools/call", "slow_search"):
+        with pytest.raises(AdmissionRejectedError, match="Too many"):
+            async with admission.admit("tools/call", "slow_search"):
+                pass
+        async with admission.admit("tools/call", "fast"):
+            pass
+    assert admission.rejected == 1
+
+
+async def test_calls_are_rejected_after_queue_timeout() -> None:
+    """A call waiting longer than the queue timeout is rejected."""
+    admission = AdmissionController(max_concurrent=1, queue_timeout=0.01)
+    async with admission.admit("tools/call", "tool"):
+        with pytest.raises(AdmissionRejectedError, match="Timed out"):
+            async with admission.admit("tools/call", "tool"):
+                pass
+    assert admission.timed_out == 1
+    assert admission.waiting == 0
+    async with admission.admit("tools/call", "tool"):
+        pass
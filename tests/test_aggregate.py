@@ -0,0 +1,206 @@
+"""Tests for serving many backends as a single server."""
+
+import json
+import typing as t
+from collections.abc import AsyncGenerator
+from contextlib import AsyncExitStack, asynccontextmanager
+from pathlib import Path
+
+import anyio
+import pytest
+from mcp import types
+from mcp.client.session import ClientSession
+from mcp.client.stdio import StdioServerParameters
+from mcp.server import Server
+from mcp.shared.memory import create_connected_server_and_client_session
+from pydantic import AnyUrl
+
+from mcp_proxy.aggregate import (
+    AggregateServer,
+    BackendParameters,
+    SseServerParameters,
+    connect_backends,
+    load_backends_config,
+)
+from mcp_proxy.cache import TTLCache
+from mcp_proxy.catalog import request_cursor
+from mcp_proxy.metrics import ProxyMetrics
+from mcp_proxy.proxy_server import ProxyOptions, create_proxy_server
+from mcp_proxy.relay import RelayServer
+
+
+def _create_backend(name: str) -> Server[object]:
+    server: Server[object] = Server(name)
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        return [types.Tool(name="echo", inputSchema={"type": "object"})]
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(tool: str, arguments: dict[str, t.Any]) -> list[types.TextContent]:
+        return [types.TextContent(type="text", text=f"{name} {tool} {arguments['text']}")]
+
+    @server.list_prompts()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Prompt]:
+        return [types.Prompt(name="greet")]
+
+    @server.get_prompt()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(prompt: str, _: dict[str, str] | None) -> types.GetPromptResult:
+        return types.GetPromptResult(
+            messages=[
+                types.PromptMessage(
+                    role="user",
+                    content=types.TextContent(type="text", text=f"{name} {prompt}"),
+                ),
+            ],
+        )
+
+    @server.list_resources()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Resource]:
+        return [types.Resource(uri=AnyUrl(f"{name}://data"), name="data")]
+
+    @server.read_resource()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(uri: AnyUrl) -> str:
+        return f"{name} {uri}"
+
+    return server
+
+
+def _paginated_backend(names: list[str], page_size: int) -> Server[object]:
+    # Relay servers keep the cursor of list requests whichever SDK parses them
+    server = RelayServer("paged")
+
+    async def _list_tools(req: types.ListToolsRequest) -> types.ServerResult:
+        start = int(request_cursor(req) or 0)
+        end = start + page_size
+        tools = [types.Tool(name=name, inputSchema={"type": "object"}) for name in names[start:end]]
+        next_cursor = str(end) if end < len(names) else None
+        return types.ServerResult(types.ListToolsResult(tools=tools, nextCursor=next_cursor))
+
+    server.request_handlers[types.ListToolsRequest] = _list_tools
+    return server
+
+
+@asynccontextmanager
+async def _aggregate_session(
+    servers: dict[str, Server[object]] | None = None,
+) -> AsyncGenerator[ClientSession, None]:
+    """Open a session to a server aggregating the given backends, one and two by default."""
+    if servers is None:
+        servers = {name: _create_backend(name) for name in ("one", "two")}
+    async with anyio.create_task_group() as tg, AsyncExitStack() as stack:
+        backends = {}
+        for name, server in servers.items():
+            remote = await stack.enter_async_context(
+                create_connected_server_and_client_session(server),
+            )
+            backends[name] = await create_proxy_server(remote)
+            tg.start_soon(backends[name].handle_remote_messages)
+        async with create_connected_server_and_client_session(
+            AggregateServer(backends),
+        ) as session:
+            yield session
+        await stack.aclose()
+        tg.cancel_scope.cancel()
+
+
+async def test_list_tools() -> None:
+    """The tools of all backends are listed under namespaced names."""
+    async with _aggregate_session() as session:
+        result = await session.list_tools()
+        assert [tool.name for tool in result.tools] == ["one__echo", "two__echo"]
+
+
+async def test_list_tools_of_every_page() -> None:
+    """The tools of every page of a backend are listed."""
+    servers = {"one": _create_backend("one"), "paged": _paginated_backend(list("abcde"), 2)}
+    async with _aggregate_session(servers) as session:
+        result = await session.list_tools()
+        assert [tool.name for tool in result.tools] == [
+            "one__echo",
+            *(f"paged__{name}" for name in "abcde"),
+        ]
+        assert result.nextCursor is None
+
+
+async def test_call_tool() -> None:
+    """Tool calls are routed to the backend owning the tool."""
+    async with _aggregate_session() as session:
+        result = await session.call_tool("two__echo", {"text": "hello"})
+        assert result.content == [types.TextContent(type="text", text="two echo hello")]
+
+        result = await session.call_tool("three__echo", {"text": "hello"})
+        assert result.isError
+
+
+async def test_prompts() -> None:
+    """Prompts are listed under namespaced names and routed to their backend."""
+    async with _aggregate_session() as session:
+        result = await session.list_prompts()
+        assert [prompt.name for prompt in result.prompts] == ["one__greet", "two__greet"]
+
+        prompt = await session.get_prompt("one__greet")
+        assert prompt.messages[0].content == types.TextContent(type="text", text="one greet")
+
+
+async def test_resources() -> None:
+    """Resources keep their URIs and are read from the backend listing them."""
+    async with _aggregate_session() as session:
+        result = await session.list_resources()
+        assert [(str(r.uri), r.name) for r in result.resources] == [
+            ("one://data", "one__data"),
+            ("two://data", "two__data"),
+        ]
+
+        contents = await session.read_resource(AnyUrl("two://data"))
+        assert contents.contents[0] == types.TextResourceContents(
+            uri=AnyUrl("two://data"),
+            mimeType="text/plain",
+            text="two two://data",
+        )
+
+
+async def test_caches_of_every_backend_are_exported_summed(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Every backend caches its own lists, and the metrics report the counters of all of them."""
+
+    def _open_session(params: BackendParameters) -> t.Any:  # noqa: ANN401
+        assert isinstance(params, StdioServerParameters)
+        return create_connected_server_and_client_session(_create_backend(params.command))
+
+    monkeypatch.setattr("mcp_proxy.aggregate._open_session", _open_session)
+    metrics = ProxyMetrics()
+    backends: dict[str, BackendParameters] = {
+        name: StdioServerParameters(command=name) for name in ("one", "two")
+    }
+    options = ProxyOptions(list_cache=TTLCache(60), metrics=metrics)
+    async with (
+        connect_backends(backends, options) as servers,
+        create_connected_server_and_client_session(AggregateServer(servers)) as session,
+    ):
+        for _ in range(2):
+            assert len((await session.list_tools()).tools) == 2  # noqa: PLR2004
+
+    rendered = metrics.render()
+    assert "mcp_proxy_list_cache_hits 2" in rendered
+    assert "mcp_proxy_list_cache_misses 2" in rendered
+
+
+def test_load_backends_config(tmp_path: Path) -> None:
+    """Backends are read from the mcpServers of a configuration file."""
+    path = tmp_path / "servers.json"
+    path.write_text(
+        json.dumps(
+            {
+                "mcpServers": {
+                    "fetch": {"command": "uvx", "args": ["mcp-server-fetch"]},
+                    "remote": {"url": "http://localhost:8080/sse"},
+                },
+            },
+        ),
+    )
+    assert load_backends_config(path) == {
+        "fetch": StdioServerParameters(command="uvx", args=["mcp-server-fetch"]),
+        "remote": SseServerParameters("http://localhost:8080/sse"),
+    }
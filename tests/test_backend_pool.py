@@ -0,0 +1,256 @@
+"""Tests for the backend pool."""
+
+import typing as t
+from collections.abc import AsyncGenerator
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+
+import anyio
+import pytest
+from mcp import types
+from mcp.client.session import ClientSession
+from mcp.server import Server
+from mcp.shared.exceptions import McpError
+from mcp.shared.memory import create_client_server_memory_streams
+from pydantic import AnyUrl
+
+from mcp_proxy.backend_pool import BackendPool, BackendPoolSettings
+
+
+class Backends:
+    """Factory for in-memory backends that records which backend served each call."""
+
+    def __init__(self) -> None:
+        """Create an empty factory."""
+        self.calls: list[int] = []
+        self.subscriptions: list[tuple[int, str]] = []
+        self.unsubscriptions: list[tuple[int, str]] = []
+        self.release = anyio.Event()
+        self.count = 0
+        self._scopes: list[anyio.CancelScope] = []
+
+    def _create_server(self, index: int) -> Server[object]:
+        server: Server[object] = Server("pool-server")
+
+        @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+        async def _() -> list[types.Tool]:
+            return []
+
+        @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+        async def _(name: str, _: dict[str, t.Any]) -> list[types.TextContent]:
+            self.calls.append(index)
+            if name == "block":
+                await self.release.wait()
+            return [types.TextContent(type="text", text=str(index))]
+
+        @server.list_resources()  # type: ignore[no-untyped-call,untyped-decorator]
+        async def _() -> list[types.Resource]:
+            return []
+
+        @server.subscribe_resource()  # type: ignore[no-untyped-call,untyped-decorator]
+        async def _(uri: AnyUrl) -> None:
+            self.subscriptions.append((index, str(uri)))
+
+        @server.unsubscribe_resource()  # type: ignore[no-untyped-call,untyped-decorator]
+        async def _(uri: AnyUrl) -> None:
+            self.unsubscriptions.append((index, str(uri)))
+
+        return server
+
+    async def _serve(
+        self,
+        server: Server[object],
+        read_stream: t.Any,  # noqa: ANN401
+        write_stream: t.Any,  # noqa: ANN401
+    ) -> None:
+        with anyio.CancelScope() as scope:
+            self._scopes.append(scope)
+            await server.run(read_stream, write_stream, server.create_initialization_options())
+
+    @asynccontextmanager
+    async def _session(self) -> AsyncGenerator[ClientSession, None]:
+        self.count += 1
+        server = self._create_server(self.count)
+        async with (
+            create_client_server_memory_streams() as (client_streams, server_streams),
+            anyio.create_task_group() as tg,
+        ):
+            tg.start_soon(self._serve, server, *server_streams)
+            async with ClientSession(*client_streams) as session:
+                yield session
+            tg.cancel_scope.cancel()
+
+    def drop(self, index: int = -1) -> None:
+        """Stop a backend as if its connection was lost, the most recent one by default."""
+        self._scopes[index].cancel()
+
+    def __call__(self) -> AbstractAsyncContextManager[ClientSession]:
+        """Open a session to a new backend."""
+        return self._session()
+
+
+async def test_pool_dispatches_to_least_busy_backend() -> None:
+    """A blocked backend is skipped while others are idle."""
+    backends = Backends()
+    pool = BackendPool(backends, BackendPoolSettings(min_size=2, max_size=2))
+    async with anyio.create_task_group() as tg:
+        await tg.start(pool.run)
+        app = pool.create_server()
+        assert types.ListToolsRequest in app.request_handlers
+        assert pool.size == 2  # noqa: PLR2004
+
+        def _request(name: str) -> types.CallToolRequest:
+            return types.CallToolRequest(
+                method="tools/call",
+                params=types.CallToolRequestParams(name=name, arguments={}),
+            )
+
+        tg.start_soon(pool.dispatch, _request("block"))
+        while pool.queue_depth == 0:  # noqa: ASYNC110
+            await anyio.sleep(1e-3)
+
+        result = await pool.dispatch(_request("fast"))
+        assert isinstance(result.root, types.CallToolResult)
+        blocked_index = backends.calls[0]
+        assert result.root.content[0].text != str(blocked_index)  # type: ignore[union-attr]
+
+        backends.release.set()
+        tg.cancel_scope.cancel()
+
+
+async def test_pool_scales_between_min_and_max() -> None:
+    """The pool grows under queue depth and shrinks back when idle."""
+    backends = Backends()
+    settings = BackendPoolSettings(
+        min_size=1,
+        max_size=2,
+        scale_up_queue_depth=1,
+        idle_timeout=0.05,
+    )
+    pool = BackendPool(backends, settings)
+    async with anyio.create_task_group() as tg:
+        await tg.start(pool.run)
+        assert pool.size == 1
+
+        request = types.CallToolRequest(
+            method="tools/call",
+            params=types.CallToolRequestParams(name="block", arguments={}),
+        )
+        tg.start_soon(pool.dispatch, request)
+        with anyio.fail_after(5):
+            while pool.size < settings.max_size:  # noqa: ASYNC110
+                await anyio.sleep(0.01)
+
+        backends.release.set()
+        with anyio.fail_after(5):
+            while pool.size > settings.min_size:  # noqa: ASYNC110
+                await anyio.sleep(0.01)
+        tg.cancel_scope.cancel()
+
+
+async def test_pool_reconnects_lost_backend() -> None:
+    """A lost backend fails its in-flight requests, reconnects and gets its subscriptions back."""
+    backends = Backends()
+    pool = BackendPool(backends, BackendPoolSettings(reconnect_delay=0.01))
+    async with anyio.create_task_group() as tg:
+        await tg.start(pool.run)
+        subscribe = types.SubscribeRequest(
+            method="resources/subscribe",
+            params=types.SubscribeRequestParams(uri=AnyUrl("file:///watched")),
+        )
+        await pool.dispatch(subscribe)
+        assert backends.subscriptions == [(1, "file:///watched")]
+
+        async def _call_blocked() -> None:
+            with pytest.raises(McpError, match="lost"):
+                await pool.dispatch(
+                    types.CallToolRequest(
+                        method="tools/call",
+                        params=types.CallToolRequestParams(name="block", arguments={}),
+                    ),
+                )
+
+        async with anyio.create_task_group() as calls:
+            calls.start_soon(_call_blocked)
+            while pool.queue_depth == 0:  # noqa: ASYNC110
+                await anyio.sleep(1e-3)
+            backends.drop()
+
+        result = await pool.dispatch(
+            types.CallToolRequest(
+                method="tools/call",
+                params=types.CallToolRequestParams(name="fast", arguments={}),
+            ),
+        )
+        assert result.root.content[0].text == "2"  # type: ignore[union-attr]
+        assert backends.subscriptions[-1] == (2, "file:///watched")
+        tg.cancel_scope.cancel()
+
+
+async def test_pool_subscribes_on_one_backend() -> None:
+    """Resources are subscribed to on one backend, and moved to another when it is lost."""
+    backends = Backends()
+    pool = BackendPool(backends, BackendPoolSettings(min_size=2, max_size=2, reconnect_delay=None))
+    uri = AnyUrl("file:///watched")
+    async with anyio.create_task_group() as tg:
+        await tg.start(pool.run)
+        await pool.dispatch(
+            types.SubscribeRequest(
+                method="resources/subscribe",
+                params=types.SubscribeRequestParams(uri=uri),
+            ),
+        )
+        assert len(backends.subscriptions) == 1
+        subscribed, _ = backends.subscriptions[0]
+
+        backends.drop(subscribed - 1)
+        with anyio.fail_after(5):
+            while len(backends.subscriptions) == 1:  # noqa: ASYNC110
+                await anyio.sleep(1e-3)
+        other, _ = backends.subscriptions[1]
+        assert other != subscribed
+
+        await pool.dispatch(
+            types.UnsubscribeRequest(
+                method="resources/unsubscribe",
+                params=types.UnsubscribeRequestParams(uri=uri),
+            ),
+        )
+        assert backends.unsubscriptions == [(other, str(uri))]
+        tg.cancel_scope.cancel()
+
+
+async def test_pool_fails_over_to_standby_backend() -> None:
+    """A lost backend is replaced by the standby one, and a new standby backend is started."""
+    backends = Backends()
+    pool = BackendPool(backends, BackendPoolSettings(standby_size=1, reconnect_delay=None))
+    request = types.CallToolRequest(
+        method="tools/call",
+        params=types.CallToolRequestParams(name="fast", arguments={}),
+    )
+    async with anyio.create_task_group() as tg:
+        await tg.start(pool.run)
+        with anyio.fail_after(5):
+            while pool.standby == 0:  # noqa: ASYNC110
+                await anyio.sleep(1e-3)
+        result = await pool.dispatch(request)
+        assert result.root.content[0].text == "1"  # type: ignore[union-attr]
+
+        backends.drop(0)
+        with anyio.fail_after(5):
+            while pool.failovers == 0:  # noqa: ASYNC110
+                await anyio.sleep(1e-3)
+        result = await pool.dispatch(request)
+        assert result.root.content[0].text == "2"  # type: ignore[union-attr]
+
+        with anyio.fail_after(5):
+            while pool.standby == 0:  # noqa: ASYNC110
+                await anyio.sleep(1e-3)
+        assert backends.count == 3  # noqa: PLR2004
+        assert pool.size == 1
+        tg.cancel_scope.cancel()
+
+
+def test_pool_rejects_invalid_settings() -> None:
+    """The minimum size can not exceed the maximum size."""
+    with pytest.raises(ValueError, match="Pool size"):
+        BackendPool(Backends(), BackendPoolSettings(min_size=3, max_size=2))
@@ -0,0 +1,194 @@
+"""Tests for the proxy caches."""
+
+import time
+from pathlib import Path
+
+import anyio
+import pytest
+from mcp import types
+from pydantic import AnyUrl
+
+from mcp_proxy.cache import ResourceCache, ToolResultCache, TTLCache
+
+
+def test_ttl_cache_counts_hits_and_misses() -> None:
+    """Hits and misses are counted on lookup."""
+    cache: TTLCache[str, int] = TTLCache()
+    assert cache.get("key") is None
+    cache.set("key", 1)
+    assert cache.get("key") == 1
+    assert cache.stats() == {
+        "entries": 1,
+        "bytes": 0,
+        "hits": 1,
+        "misses": 1,
+        "evictions": 0,
+        "invalidations": 0,
+    }
+
+
+def test_ttl_cache_expires_entries(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Entries older than the TTL are misses."""
+    cache: TTLCache[str, int] = TTLCache(ttl=10)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.set("key", 1)
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_evicts_least_recently_used() -> None:
+    """The least recently used entry is evicted when the cache is full."""
+    cache: TTLCache[str, int] = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.evictions == 1
+
+
+def test_ttl_cache_invalidates_matching_entries() -> None:
+    """Only entries matching the predicate are dropped."""
+    cache: TTLCache[str, int] = TTLCache()
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate(lambda key: key == "a")
+    assert cache.get("a") is None
+    assert cache.get("b") == 2  # noqa: PLR2004
+    cache.invalidate()
+    assert len(cache) == 0
+
+    generation = cache.generation
+    cache.invalidate()
+    cache.set("a", 1, generation=generation)
+    assert cache.get("a") is None
+
+
+def test_ttl_cache_evicts_over_byte_budget() -> None:
+    """Entries are evicted once their total size exceeds the budget."""
+    cache: TTLCache[str, str] = TTLCache(max_entries=None, max_bytes=4, size_of=len)
+    cache.set("a", "aa")
+    cache.set("b", "bb")
+    cache.set("c", "cc")
+    assert cache.get("a") is None
+    assert cache.size == 4  # noqa: PLR2004
+    cache.set("d", "ddddd")
+    assert cache.get("d") is None
+
+
+def _result(text: str, *, is_error: bool = False) -> types.CallToolResult:
+    return types.CallToolResult(
+        content=[types.TextContent(type="text", text=text)],
+        isError=is_error,
+    )
+
+
+def test_tool_result_cache_key_is_canonical() -> None:
+    """The order of arguments does not change the key."""
+    assert ToolResultCache.key("tool", {"a": 1, "b": 2}) == ToolResultCache.key(
+        "tool",
+        {"b": 2, "a": 1},
+    )
+    assert ToolResultCache.key("tool", {"a": 1}) != ToolResultCache.key("other", {"a": 1})
+
+
+async def test_tool_result_cache_only_caches_allowed_tools() -> None:
+    """Only tools matching the allow-list are cacheable, and errors are not cached."""
+    cache = ToolResultCache(["read_*"])
+    assert cache.cacheable("read_file")
+    assert not cache.cacheable("write_file")
+
+    await cache.set("read_file", {"path": "a"}, _result("error", is_error=True))
+    assert await cache.get("read_file", {"path": "a"}) is None
+    await cache.set("read_file", {"path": "a"}, _result("content"))
+    assert await cache.get("read_file", {"path": "a"}) == _result("content")
+
+
+async def test_tool_result_cache_reads_from_disk(tmp_path: Path) -> None:
+    """Results evicted from memory are served from the on-disk tier."""
+    cache = ToolResultCache(["*"], directory=tmp_path)
+    await cache.set("tool", {}, _result("content"))
+    cache.memory.invalidate()
+
+    assert await cache.get("tool", {}) == _result("content")
+    assert cache.disk_hits == 1
+    assert await ToolResultCache(["*"], directory=tmp_path).get("tool", {}) == _result("content")
+
+
+async def test_tool_result_cache_evicts_from_disk_over_byte_budget(tmp_path: Path) -> None:
+    """The least recently used files of the on-disk tier are removed beyond its budget."""
+    size = len(_result("content").model_dump_json(by_alias=True, exclude_none=True))
+    cache = ToolResultCache(["*"], directory=tmp_path, max_disk_bytes=2 * size)
+    await cache.set("tool", {"n": 1}, _result("content"))
+    await cache.set("tool", {"n": 2}, _result("content"))
+    cache.memory.invalidate()
+    assert await cache.get("tool", {"n": 1}) == _result("content")
+    await cache.set("tool", {"n": 3}, _result("content"))
+    cache.memory.invalidate()
+
+    assert await cache.get("tool", {"n": 2}) is None
+    assert await cache.get("tool", {"n": 1}) == _result("content")
+    assert len([path async for path in anyio.Path(tmp_path).glob("*.json")]) == 2  # noqa: PLR2004
+    assert cache.stats()["disk_bytes"] == 2 * size
+    assert cache.stats()["disk_evictions"] == 1
+
+    restarted = ToolResultCache(["*"], directory=tmp_path, max_disk_bytes=2 * size)
+    await restarted.set("tool", {"n": 4}, _result("content"))
+    assert len([path async for path in anyio.Path(tmp_path).glob("*.json")]) == 2  # noqa: PLR2004
+    assert restarted.stats()["disk_bytes"] == 2 * size
+
+
+def _resource(uri: str, text: str) -> types.ReadResourceResult:
+    return types.ReadResourceResult(
+        contents=[types.TextResourceContents(uri=AnyUrl(uri), text=text)],
+    )
+
+
+def test_resource_cache_expires_by_scheme(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Contents expire after the TTL of their URI scheme, or of `*` for other schemes."""
+    cache = ResourceCache(ttls={"file": 10, "*": 60})
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.set("file:///a", _resource("file:///a", "a"), cache.generation)
+    cache.set("http://b", _resource("http://b", "b"), cache.generation)
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+    assert cache.get("file:///a") is None
+    assert cache.get("http://b") is not None
+
+
+def test_resource_cache_is_invalidated_by_updates() -> None:
+    """Updated resources are dropped, and reads started before an update are not stored."""
+    cache = ResourceCache()
+    cache.set("file:///a", _resource("file:///a", "abc"), cache.generation)
+    assert cache.get("file:///a") == {
+        "contents": [{"uri": "file:///a", "text": "abc"}],
+    }
+
+    generation = cache.generation
+    cache.invalidate("file:///a")
+    cache.set("file:///a", _resource("file:///a", "stale"), generation)
+    assert cache.get("file:///a") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bytes_saved"]) == (1, 1, 3)
+    assert stats["hit_ratio"] == 0.5  # noqa: PLR2004
+
+
+def test_resource_cache_expires_unsubscribed_resources(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Resources the remote app does not report updates of expire after the default TTL."""
+    cache = ResourceCache(default_ttl=60)
+    cache.subscribe("file:///a")
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.set("file:///a", _resource("file:///a", "a"), cache.generation)
+    cache.set("file:///b", _resource("file:///b", "b"), cache.generation)
+    monkeypatch.setattr(time, "monotonic", lambda: now + 60)
+    assert cache.get("file:///a") is not None
+    assert cache.get("file:///b") is None
+
+    cache.unsubscribe("file:///a")
+    assert cache.get("file:///a") is None
+    assert cache.ttl("file:///a") == 60  # noqa: PLR2004
@@ -0,0 +1,52 @@
+"""Tests for the proxy metrics."""
+
+from mcp import types
+
+from mcp_proxy.metrics import Histogram, ProxyMetrics
+
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    """Bucket counts are cumulative and end with +Inf."""
+    histogram = Histogram(buckets=(0.1, 1.0))
+    labels = ProxyMetrics.labels("tools/list")
+    histogram.observe(labels, 0.05)
+    histogram.observe(labels, 0.5)
+    histogram.observe(labels, 5)
+
+    lines = list(histogram.render("latency"))
+    assert lines == [
+        'latency_bucket{method="tools/list",tool="",le="0.1"} 1',
+        'latency_bucket{method="tools/list",tool="",le="1.0"} 2',
+        'latency_bucket{method="tools/list",tool="",le="+Inf"} 3',
+        'latency_sum{method="tools/list",tool=""} 5.55',
+        'latency_count{method="tools/list",tool=""} 3',
+    ]
+
+
+async def test_instrument_counts_requests_and_tool_errors() -> None:
+    """Requests are counted per method and tool, and tool errors count as errors."""
+    metrics = ProxyMetrics()
+
+    async def _handler(_: types.CallToolRequest) -> types.ServerResult:
+        return types.ServerResult(types.CallToolResult(content=[], isError=True))
+
+    request = types.CallToolRequest(
+        method="tools/call",
+        params=types.CallToolRequestParams(name="tool", arguments={}),
+    )
+    await metrics.instrument(_handler)(request)
+
+    labels = ProxyMetrics.labels("tools/call", "tool")
+    assert metrics.requests[labels] == 1
+    assert metrics.errors[labels] == 1
+    assert metrics.in_flight[labels] == 0
+    rendered = metrics.render()
+    assert 'mcp_proxy_requests_total{method="tools/call",tool="tool"} 1' in rendered
+    assert "# TYPE mcp_proxy_request_duration_seconds histogram" in rendered
+
+
+def test_render_includes_registered_collectors() -> None:
+    """Stats of registered components are exported."""
+    metrics = ProxyMetrics()
+    metrics.register_collector("list_cache", lambda: {"hits": 3})
+    assert "mcp_proxy_list_cache_hits 3\n" in metrics.render()
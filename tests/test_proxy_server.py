@@ -9,20 +9,37 @@ Tests are running in two modes:
 The same test code is run on both to ensure parity.
 """
 
+import json
 import typing as t
 from collections.abc import AsyncGenerator, Awaitable, Callable
 from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from pathlib import Path
 from unittest.mock import AsyncMock
 
+import anyio
 import pytest
 from mcp import types
 from mcp.client.session import ClientSession
 from mcp.server import Server
 from mcp.shared.exceptions import McpError
-from mcp.shared.memory import create_connected_server_and_client_session
+from mcp.shared.memory import (
+    create_client_server_memory_streams,
+    create_connected_server_and_client_session,
+)
 from pydantic import AnyUrl
 
-from mcp_proxy.proxy_server import create_proxy_server
+from mcp_proxy.admission import AdmissionController
+from mcp_proxy.cache import ResourceCache, ToolResultCache, TTLCache
+from mcp_proxy.catalog import ListCatalog, list_request, request_cursor
+from mcp_proxy.deadlines import Deadlines
+from mcp_proxy.filters import ToolFilter, ToolRules, current_client
+from mcp_proxy.metrics import ProxyMetrics
+from mcp_proxy.proxy_server import ProxyOptions, create_proxy_server
+from mcp_proxy.raw_proxy import create_raw_proxy_server
+from mcp_proxy.recording import Recorder
+from mcp_proxy.relay import RelayServer
+from mcp_proxy.replay import RecordedRequest, load_records, replay
+from mcp_proxy.single_flight import SingleFlight
 
 TOOL_INPUT_SCHEMA = {"type": "object", "properties": {"input1": {"type": "string"}}}
 
@@ -41,11 +58,41 @@ async def proxy(server: Server[object]) -> AsyncGenerator[ClientSession, None]:
             yield wrapped_session
 
 
-@pytest.fixture(params=["server", "proxy"])
+@asynccontextmanager
+async def passthrough_proxy(server: Server[object]) -> AsyncGenerator[ClientSession, None]:
+    """Create a connection to the server through a proxy relaying results as received."""
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(session, ProxyOptions(passthrough=True))
+        async with in_memory(wrapped_server) as wrapped_session:
+            yield wrapped_session
+
+
+@asynccontextmanager
+async def raw_proxy(server: Server[object]) -> AsyncGenerator[ClientSession, None]:
+    """Create a connection to the server through a proxy relaying JSON-RPC messages."""
+    async with (
+        create_client_server_memory_streams() as (client_streams, server_streams),
+        anyio.create_task_group() as tg,
+    ):
+        tg.start_soon(
+            lambda: server.run(*server_streams, server.create_initialization_options()),
+        )
+        wrapped_server = await create_raw_proxy_server(*client_streams)
+        tg.start_soon(wrapped_server.handle_remote_messages)
+        async with in_memory(wrapped_server) as wrapped_session:
+            yield wrapped_session
+        tg.cancel_scope.cancel()
+
+
+@pytest.fixture(params=["server", "proxy", "passthrough", "raw"])
 def session_generator(request: pytest.FixtureRequest) -> SessionContextManager:
     """Fixture that returns a client creation strategy either direct or using the proxy."""
     if request.param == "server":
         return in_memory
+    if request.param == "passthrough":
+        return passthrough_proxy
+    if request.param == "raw":
+        return raw_proxy
     return proxy
 
 
@@ -59,7 +106,7 @@ def server() -> Server[object]:
 def server_can_list_prompts(server: Server[object], prompt: types.Prompt) -> Server[object]:
     """Return a server instance with prompts."""
 
-    @server.list_prompts()  # type: ignore[no-untyped-call,misc]
+    @server.list_prompts()  # type: ignore[no-untyped-call,untyped-decorator]
     async def _() -> list[types.Prompt]:
         return [prompt]
 
@@ -81,7 +128,7 @@ def server_can_get_prompt(
 def server_can_list_tools(server: Server[object], tool: types.Tool) -> Server[object]:
     """Return a server instance with tools."""
 
-    @server.list_tools()  # type: ignore[no-untyped-call,misc]
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
     async def _() -> list[types.Tool]:
         return [tool]
 
@@ -103,7 +150,7 @@ def server_can_call_tool(
 def server_can_list_resources(server: Server[object], resource: types.Resource) -> Server[object]:
     """Return a server instance with resources."""
 
-    @server.list_resources()  # type: ignore[no-untyped-call,misc]
+    @server.list_resources()  # type: ignore[no-untyped-call,untyped-decorator]
     async def _() -> list[types.Resource]:
         return [resource]
 
@@ -466,3 +513,664 @@ async def test_call_tool_with_error(
 
         call_tool_result = await session.call_tool("tool", {})
         assert call_tool_result.isError
+
+
+async def _drain(session: ClientSession) -> None:
+    async for _ in session.incoming_messages:
+        pass
+
+
+async def test_options_with_own_caches_serve_hits_from_them(server: Server[object]) -> None:
+    """Test that copied options get their own empty caches, which serve list hits."""
+    calls: list[str] = []
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        calls.append("tools/list")
+        return [types.Tool(name="tool1", inputSchema=TOOL_INPUT_SCHEMA)]
+
+    options = ProxyOptions(
+        list_cache=TTLCache(60),
+        tool_cache=ToolResultCache(["tool1"]),
+        resource_cache=ResourceCache(),
+        single_flight=SingleFlight(),
+    )
+    copied = options.with_own_caches()
+    for name in ("list_cache", "tool_cache", "resource_cache", "single_flight"):
+        assert getattr(copied, name) is not None
+        assert getattr(copied, name) is not getattr(options, name)
+
+    list_cache = t.cast("TTLCache[type, types.ServerResult]", copied.list_cache)
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(session, copied)
+        async with in_memory(wrapped_server) as wrapped_session:
+            await wrapped_session.list_tools()
+            await wrapped_session.list_tools()
+    assert calls == ["tools/list"]
+    assert (list_cache.hits, list_cache.misses) == (1, 1)
+    assert options.list_cache is not None
+    assert len(options.list_cache) == 0
+
+
+async def test_list_tools_cache_is_invalidated_by_notification(
+    server: Server[object],
+) -> None:
+    """Test that list_tools is cached until the remote app reports a change."""
+    tools = [types.Tool(name="tool1", inputSchema=TOOL_INPUT_SCHEMA)]
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        return list(tools)
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(name: str, _: dict[str, t.Any]) -> list[types.TextContent]:
+        tools.append(types.Tool(name=name, inputSchema=TOOL_INPUT_SCHEMA))
+        await server.request_context.session.send_tool_list_changed()
+        return []
+
+    list_cache: TTLCache[type, types.ServerResult] = TTLCache()
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(session, ProxyOptions(list_cache=list_cache))
+        async with anyio.create_task_group() as tg, in_memory(wrapped_server) as wrapped_session:
+            tg.start_soon(wrapped_server.handle_remote_messages)
+            # The notification is also relayed to the client, which has to receive it
+            tg.start_soon(_drain, wrapped_session)
+
+            assert len((await wrapped_session.list_tools()).tools) == 1
+            assert len((await wrapped_session.list_tools()).tools) == 1
+            assert (list_cache.hits, list_cache.misses) == (1, 1)
+
+            await wrapped_session.call_tool("tool2", {})
+            with anyio.fail_after(5):
+                while list_cache.invalidations == 0:  # noqa: ASYNC110
+                    await anyio.sleep(1e-3)
+
+            assert len((await wrapped_session.list_tools()).tools) == 2  # noqa: PLR2004
+            assert (list_cache.hits, list_cache.misses) == (1, 2)
+            tg.cancel_scope.cancel()
+
+
+async def test_list_invalidated_while_fetched_is_not_cached(server: Server[object]) -> None:
+    """Test that a list fetched before the remote app reports a change is not kept."""
+    tools = [types.Tool(name="tool1", inputSchema=TOOL_INPUT_SCHEMA)]
+    listing, release = anyio.Event(), anyio.Event()
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        snapshot = list(tools)
+        listing.set()
+        await release.wait()
+        return snapshot
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(name: str, _: dict[str, t.Any]) -> list[types.TextContent]:
+        tools.append(types.Tool(name=name, inputSchema=TOOL_INPUT_SCHEMA))
+        await server.request_context.session.send_tool_list_changed()
+        return []
+
+    list_cache: TTLCache[type, types.ServerResult] = TTLCache()
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(session, ProxyOptions(list_cache=list_cache))
+        async with anyio.create_task_group() as tg, in_memory(wrapped_server) as wrapped_session:
+            tg.start_soon(wrapped_server.handle_remote_messages)
+            tg.start_soon(_drain, wrapped_session)
+            results: list[types.ListToolsResult] = []
+
+            async def _list_tools() -> None:
+                results.append(await wrapped_session.list_tools())
+
+            tg.start_soon(_list_tools)
+            await listing.wait()
+            await wrapped_session.call_tool("tool2", {})
+            with anyio.fail_after(5):
+                while list_cache.generation == 0:  # noqa: ASYNC110
+                    await anyio.sleep(1e-3)
+            release.set()
+            with anyio.fail_after(5):
+                while not results:  # noqa: ASYNC110
+                    await anyio.sleep(1e-3)
+
+            assert len(results[0].tools) == 1
+            assert len((await wrapped_session.list_tools()).tools) == 2  # noqa: PLR2004
+            tg.cancel_scope.cancel()
+
+
+def _paginated_server(names: list[str], page_size: int, pages: list[str | None]) -> Server[object]:
+    """Return a server listing tools in pages, recording the cursor of every request."""
+    # Relay servers keep the cursor of list requests whichever SDK parses them
+    server = RelayServer("paginated")
+
+    async def _list_tools(req: types.ListToolsRequest) -> types.ServerResult:
+        cursor = request_cursor(req)
+        pages.append(cursor)
+        start = int(cursor or 0)
+        end = start + page_size
+        tools = [types.Tool(name=name, inputSchema=TOOL_INPUT_SCHEMA) for name in names[start:end]]
+        next_cursor = str(end) if end < len(names) else None
+        return types.ServerResult(types.ListToolsResult(tools=tools, nextCursor=next_cursor))
+
+    server.request_handlers[types.ListToolsRequest] = _list_tools
+    return server
+
+
+async def _list_all_tools(session: ClientSession) -> list[list[str]]:
+    pages: list[list[str]] = []
+    cursor = None
+    while True:
+        result = await session.send_request(
+            list_request(types.ListToolsRequest, cursor),
+            types.ListToolsResult,
+        )
+        pages.append([tool.name for tool in result.tools])
+        if result.nextCursor is None:
+            return pages
+        cursor = result.nextCursor
+
+
+async def test_list_tools_forwards_cursors() -> None:
+    """Test that the cursors of list requests reach the remote app."""
+    pages: list[str | None] = []
+    server = _paginated_server(["a", "b", "c", "d", "e"], 2, pages)
+    list_cache: TTLCache[type, types.ServerResult] = TTLCache()
+
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(session, ProxyOptions(list_cache=list_cache))
+        async with in_memory(wrapped_server) as wrapped_session:
+            assert await _list_all_tools(wrapped_session) == [["a", "b"], ["c", "d"], ["e"]]
+            assert await _list_all_tools(wrapped_session) == [["a", "b"], ["c", "d"], ["e"]]
+
+    # Only the first page is cached
+    assert pages == [None, "2", "4", "2", "4"]
+
+
+async def test_list_tools_is_served_from_prefetched_catalog() -> None:
+    """Test that every page of a list is prefetched and served from the catalog."""
+    pages: list[str | None] = []
+    server = _paginated_server(["a", "b", "c", "d", "e"], 2, pages)
+    list_catalog = ListCatalog(page_size=3)
+
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(session, ProxyOptions(list_catalog=list_catalog))
+        async with anyio.create_task_group() as tg, in_memory(wrapped_server) as wrapped_session:
+            tg.start_soon(wrapped_server.handle_remote_messages)
+            with anyio.fail_after(5):
+                while list_catalog.stats()["lists"] == 0:  # noqa: ASYNC110
+                    await anyio.sleep(1e-3)
+
+            assert await _list_all_tools(wrapped_session) == [["a", "b", "c"], ["d", "e"]]
+            assert pages == [None, "2", "4"]
+
+            first_page = await wrapped_session.list_tools()
+            list_catalog.invalidate(types.ListToolsRequest)
+            with pytest.raises(McpError, match="changed"):
+                await wrapped_session.send_request(
+                    list_request(types.ListToolsRequest, first_page.nextCursor),
+                    types.ListToolsResult,
+                )
+            with anyio.fail_after(5):
+                while list_catalog.refreshes < 2:  # noqa: PLR2004, ASYNC110
+                    await anyio.sleep(1e-3)
+            assert await _list_all_tools(wrapped_session) == [["a", "b", "c"], ["d", "e"]]
+            tg.cancel_scope.cancel()
+
+
+async def test_hidden_tools_are_filtered_and_rejected(server: Server[object]) -> None:
+    """Test that tools hidden from a client are left out of lists and not called."""
+    calls: list[str] = []
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        return [
+            types.Tool(name=name, inputSchema=TOOL_INPUT_SCHEMA)
+            for name in ("read", "write", "admin_reset")
+        ]
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(name: str, _: dict[str, t.Any]) -> list[types.TextContent]:
+        calls.append(name)
+        return []
+
+    tool_filter = ToolFilter(
+        ToolRules(allow=("tag:safe",), deny=("admin_*",)),
+        clients={"ops": ToolRules()},
+        tags={"safe": ["read", "admin_*"]},
+    )
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(session, ProxyOptions(tool_filter=tool_filter))
+        async with in_memory(wrapped_server) as wrapped_session:
+            assert [tool.name for tool in (await wrapped_session.list_tools()).tools] == ["read"]
+            result = await wrapped_session.call_tool("admin_reset", {})
+            assert result.isError
+            assert result.content == [
+                types.TextContent(type="text", text="Unknown tool: admin_reset"),
+            ]
+
+        # Sessions are served as the client current when they are opened
+        token = current_client.set("ops")
+        try:
+            async with in_memory(wrapped_server) as wrapped_session:
+                assert len((await wrapped_session.list_tools()).tools) == 3  # noqa: PLR2004
+                assert not (await wrapped_session.call_tool("admin_reset", {})).isError
+        finally:
+            current_client.reset(token)
+
+    assert calls == ["admin_reset"]
+    assert tool_filter.stats()["hidden_calls"] == 1
+
+
+async def test_read_resource_cache_is_invalidated_by_update(server: Server[object]) -> None:
+    """Test that resource contents are cached until the remote app reports an update."""
+    reads: list[str] = []
+
+    @server.list_resources()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Resource]:
+        return []
+
+    @server.read_resource()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(uri: AnyUrl) -> str:
+        reads.append(str(uri))
+        return f"contents {len(reads)}"
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        return []
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(_: str, arguments: dict[str, t.Any]) -> list[types.TextContent]:
+        await server.request_context.session.send_resource_updated(AnyUrl(arguments["uri"]))
+        return []
+
+    @server.subscribe_resource()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(_: AnyUrl) -> None:
+        pass
+
+    @server.unsubscribe_resource()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(_: AnyUrl) -> None:
+        pass
+
+    resource_cache = ResourceCache()
+    uri = AnyUrl("file:///a")
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(
+            session,
+            ProxyOptions(resource_cache=resource_cache),
+        )
+        async with anyio.create_task_group() as tg, in_memory(wrapped_server) as wrapped_session:
+            tg.start_soon(wrapped_server.handle_remote_messages)
+            tg.start_soon(_drain, wrapped_session)
+
+            # Contents of resources the remote app does not report updates of expire
+            await wrapped_session.subscribe_resource(uri)
+            assert resource_cache.ttl(str(uri)) is None
+            for _ in range(2):
+                result = await wrapped_session.read_resource(uri)
+                assert t.cast("types.TextResourceContents", result.contents[0]).text == (
+                    "contents 1"
+                )
+            assert reads == ["file:///a"]
+
+            await wrapped_session.call_tool("update", {"uri": str(uri)})
+            with anyio.fail_after(5):
+                while resource_cache.memory.invalidations == 0:  # noqa: ASYNC110
+                    await anyio.sleep(1e-3)
+
+            result = await wrapped_session.read_resource(uri)
+            assert t.cast("types.TextResourceContents", result.contents[0]).text == "contents 2"
+
+            await wrapped_session.unsubscribe_resource(uri)
+            assert resource_cache.ttl(str(uri)) == resource_cache.default_ttl
+            assert resource_cache.get(str(uri)) is None
+            tg.cancel_scope.cancel()
+
+
+async def test_call_tool_with_large_image(
+    session_generator: SessionContextManager,
+    server: Server[object],
+) -> None:
+    """Test that large binary contents are relayed unchanged."""
+    image = types.ImageContent(type="image", data="A" * 4 * 1024 * 1024, mimeType="image/png")
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        return []
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(_: str, __: dict[str, t.Any]) -> list[types.ImageContent]:
+        return [image]
+
+    async with session_generator(server) as session:
+        await session.initialize()
+
+        result = await session.call_tool("render", {})
+        assert result.content == [image]
+
+
+@pytest.mark.parametrize("tool", [AsyncMock()])
+async def test_call_tool_result_is_cached(
+    server_can_call_tool: Server[object],
+    tool: AsyncMock,
+) -> None:
+    """Test that repeated calls of a cacheable tool are answered by the proxy."""
+    tool_cache = ToolResultCache(["cached"])
+    async with in_memory(server_can_call_tool) as session:
+        wrapped_server = await create_proxy_server(session, ProxyOptions(tool_cache=tool_cache))
+        async with in_memory(wrapped_server) as wrapped_session:
+            tool.return_value = [types.TextContent(type="text", text="result")]
+
+            for _ in range(2):
+                await wrapped_session.call_tool("cached", {"a": 1, "b": 2})
+                await wrapped_session.call_tool("uncached", {})
+            result = await wrapped_session.call_tool("cached", {"b": 2, "a": 1})
+
+            assert result.content == tool.return_value
+            assert tool.call_count == 3  # noqa: PLR2004
+            assert tool_cache.memory.hits == 2  # noqa: PLR2004
+
+
+async def test_concurrent_read_resource_is_coalesced(server: Server[object]) -> None:
+    """Test that identical concurrent reads share one call to the remote app."""
+    release = anyio.Event()
+    reads = 0
+
+    @server.list_resources()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Resource]:
+        return []
+
+    @server.read_resource()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(_: AnyUrl) -> str:
+        nonlocal reads
+        reads += 1
+        await release.wait()
+        return "content"
+
+    single_flight = SingleFlight()
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(
+            session,
+            ProxyOptions(single_flight=single_flight),
+        )
+        async with in_memory(wrapped_server) as wrapped_session, anyio.create_task_group() as tg:
+            uri = AnyUrl("scheme://resource-uri")
+            for _ in range(3):
+                tg.start_soon(wrapped_session.read_resource, uri)
+            with anyio.fail_after(5):
+                while single_flight.coalesced < 2:  # noqa: PLR2004, ASYNC110
+                    await anyio.sleep(1e-3)
+            release.set()
+
+    assert reads == 1
+
+
+async def test_call_tool_is_rejected_beyond_concurrency_limit(server: Server[object]) -> None:
+    """Test that a tool call that can not be queued gets an error result."""
+    release = anyio.Event()
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        return []
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(_: str, __: dict[str, t.Any]) -> list[types.TextContent]:
+        await release.wait()
+        return []
+
+    admission = AdmissionController(max_concurrent=1, max_queued=0)
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(session, ProxyOptions(admission=admission))
+        async with in_memory(wrapped_server) as wrapped_session, anyio.create_task_group() as tg:
+            tg.start_soon(wrapped_session.call_tool, "slow", {})
+            with anyio.fail_after(5):
+                while admission.admitted == 0:  # noqa: ASYNC110
+                    await anyio.sleep(1e-3)
+
+            result = await wrapped_session.call_tool("slow", {})
+            assert result.isError
+            assert "Too many queued requests" in result.content[0].text  # type: ignore[union-attr]
+            release.set()
+
+
+@pytest.fixture
+def server_with_slow_tool(server: Server[object]) -> tuple[Server[object], list[str]]:
+    """Return a server whose tool runs until cancelled, recording its starts and cancellations."""
+    events: list[str] = []
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        return []
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(_: str, __: dict[str, t.Any]) -> list[types.TextContent]:
+        events.append("started")
+        try:
+            await anyio.sleep_forever()
+        except anyio.get_cancelled_exc_class():
+            events.append("cancelled")
+            raise
+        return []
+
+    return server, events
+
+
+async def _wait_for(events: list[str], event: str) -> None:
+    with anyio.fail_after(5):
+        while event not in events:  # noqa: ASYNC110
+            await anyio.sleep(1e-3)
+
+
+async def test_call_tool_past_its_deadline_is_cancelled(
+    server_with_slow_tool: tuple[Server[object], list[str]],
+) -> None:
+    """Test that a tool call timing out gets an error result and is cancelled upstream."""
+    server, events = server_with_slow_tool
+    metrics = ProxyMetrics()
+    options = ProxyOptions(metrics=metrics, deadlines=Deadlines(60, tools={"slow*": 0.05}))
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(session, options)
+        async with in_memory(wrapped_server) as wrapped_session:
+            result = await wrapped_session.call_tool("slow", {})
+
+            assert result.isError
+            assert "Timed out after 0.05s" in result.content[0].text  # type: ignore[union-attr]
+            await _wait_for(events, "cancelled")
+            assert metrics.timed_out[metrics.labels("tools/call", "slow")] == 1
+
+
+async def test_call_tool_cancelled_by_client_is_cancelled_upstream(
+    server_with_slow_tool: tuple[Server[object], list[str]],
+) -> None:
+    """Test that the cancellation of a tool call by the client is relayed to the remote app."""
+    server, events = server_with_slow_tool
+    metrics = ProxyMetrics()
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(
+            session,
+            ProxyOptions(metrics=metrics, cancel_upstream=True),
+        )
+        async with in_memory(wrapped_server) as wrapped_session, anyio.create_task_group() as tg:
+
+            async def _call() -> None:
+                with pytest.raises(McpError, match="Request cancelled"):
+                    await wrapped_session.call_tool("slow", {})
+
+            request_id = wrapped_session._request_id  # noqa: SLF001
+            tg.start_soon(_call)
+            await _wait_for(events, "started")
+
+            await wrapped_session.send_notification(
+                types.ClientNotification(
+                    types.CancelledNotification(
+                        method="notifications/cancelled",
+                        params=types.CancelledNotificationParams(requestId=request_id),
+                    ),
+                ),
+            )
+            await _wait_for(events, "cancelled")
+            assert metrics.cancelled[metrics.labels("tools/call", "slow")] == 1
+
+
+async def test_client_disconnecting_mid_call_leaves_the_remote_app_serving(
+    server: Server[object],
+) -> None:
+    """Test that a client leaving during a tool call does not end the shared remote session."""
+    events: list[str] = []
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        return [types.Tool(name="echo", inputSchema=TOOL_INPUT_SCHEMA)]
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(name: str, _: dict[str, t.Any]) -> list[types.TextContent]:
+        if name == "slow":
+            events.append("started")
+            await anyio.sleep(0.2)
+        return [types.TextContent(type="text", text=name)]
+
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(session)
+        async with in_memory(wrapped_server) as first, anyio.create_task_group() as tg:
+            tg.start_soon(first.call_tool, "slow", {})
+            await _wait_for(events, "started")
+            tg.cancel_scope.cancel()
+
+        async with in_memory(wrapped_server) as second:
+            with anyio.fail_after(5):
+                result = await second.call_tool("echo", {})
+                tools = await second.list_tools()
+            assert not result.isError
+            assert t.cast("types.TextContent", result.content[0]).text == "echo"
+            assert [tool.name for tool in tools.tools] == ["echo"]
+
+
+@pytest.mark.parametrize("redact", [False, True])
+async def test_requests_are_recorded_and_replayed(
+    server: Server[object],
+    tmp_path: Path,
+    redact: bool,  # noqa: FBT001
+) -> None:
+    """Test that the requests served by the proxy are recorded, and replayed from the records."""
+    calls: list[str] = []
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        return [types.Tool(name="echo", inputSchema=TOOL_INPUT_SCHEMA)]
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(name: str, arguments: dict[str, t.Any]) -> list[types.TextContent]:
+        calls.append(arguments["input1"])
+        return [types.TextContent(type="text", text=f"{name}: {arguments['input1']}")]
+
+    @server.list_resources()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Resource]:
+        return []
+
+    @server.read_resource()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(uri: AnyUrl) -> str:
+        calls.append(str(uri))
+        return "contents"
+
+    recorder = Recorder(tmp_path / "requests.jsonl", redact=redact)
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(session, ProxyOptions(recorder=recorder))
+        async with in_memory(wrapped_server) as wrapped_session:
+            await wrapped_session.list_tools()
+            await wrapped_session.call_tool("echo", {"input1": "secret"})
+            await wrapped_session.read_resource(AnyUrl("file:///data.txt"))
+
+    recorder.flush()
+    records = [json.loads(line) for line in recorder.path.read_text().splitlines()]
+    assert [record["method"] for record in records] == [
+        "tools/list",
+        "tools/call",
+        "resources/read",
+    ]
+    assert records[1]["params"] == {
+        "name": "echo",
+        "arguments": {"input1": "******" if redact else "secret"},
+    }
+    text = records[1]["result"]["content"][0]["text"]
+    assert text == ("************" if redact else "echo: secret")
+    assert records[2]["params"] == {"uri": "file:///data.txt"}
+    assert records[2]["result"]["contents"][0]["text"] == ("********" if redact else "contents")
+    assert all(record["duration"] >= 0 for record in records)
+    assert recorder.stats()["records"] == 3  # noqa: PLR2004
+
+    requests = load_records(recorder.path)
+    async with in_memory(server) as session:
+        report = await replay(session, requests, speed=None, concurrency=1)
+
+    summary = report.summary()
+    assert summary["requests"] == 3  # noqa: PLR2004
+    assert summary["errors"] == 0
+    assert [method["method"] for method in summary["methods"]] == [
+        "resources/read",
+        "tools/call echo",
+        "tools/list",
+    ]
+    assert all(method["p50"] is not None for method in summary["methods"])
+    assert calls == [
+        "secret",
+        "file:///data.txt",
+        "******" if redact else "secret",
+        "file:///data.txt",
+    ]
+
+
+async def test_large_results_are_left_out_of_records(
+    server: Server[object],
+    tmp_path: Path,
+) -> None:
+    """Test that results larger than the limit of the recorder are recorded without them."""
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        return [types.Tool(name="echo", inputSchema=TOOL_INPUT_SCHEMA)]
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(name: str, _: dict[str, t.Any]) -> list[types.TextContent]:
+        return [types.TextContent(type="text", text=name * 100)]
+
+    recorder = Recorder(tmp_path / "requests.jsonl", max_result_bytes=200)
+    async with in_memory(server) as session:
+        wrapped_server = await create_proxy_server(session, ProxyOptions(recorder=recorder))
+        async with in_memory(wrapped_server) as wrapped_session:
+            await wrapped_session.call_tool("a", {})
+            result = await wrapped_session.call_tool("large", {})
+            assert t.cast("types.TextContent", result.content[0]).text == "large" * 100
+
+    recorder.flush()
+    small, large = [json.loads(line) for line in recorder.path.read_text().splitlines()]
+    assert small["result"]["content"][0]["text"] == "a" * 100
+    assert "result" not in large
+    assert large["result_omitted"] is True
+    assert large["bytes"] > 200  # noqa: PLR2004
+    assert recorder.stats() | {"bytes_written": 0} == {
+        "records": 2,
+        "bytes_written": 0,
+        "failed_writes": 0,
+        "dropped_records": 0,
+        "omitted_results": 1,
+        "queued_bytes": 0,
+    }
+
+
+async def test_replayed_requests_time_out(server: Server[object]) -> None:
+    """Test that replayed requests not answered in time are counted as errors."""
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(name: str, _: dict[str, t.Any]) -> list[types.TextContent]:
+        if name == "stuck":
+            await anyio.sleep_forever()
+        return [types.TextContent(type="text", text=name)]
+
+    requests = [
+        RecordedRequest(time=0, method="tools/call", params={"name": "stuck", "arguments": {}}),
+        RecordedRequest(time=0, method="tools/call", params={"name": "echo", "arguments": {}}),
+    ]
+    async with in_memory(server) as session:
+        with anyio.fail_after(5):
+            report = await replay(session, requests, speed=None, request_timeout=0.1)
+
+    assert report.methods["tools/call stuck"].errors == 1
+    assert report.methods["tools/call stuck"].timeouts == 1
+    assert report.methods["tools/call echo"].errors == 0
+    assert report.summary()["timeouts"] == 1
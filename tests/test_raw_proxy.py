@@ -0,0 +1,268 @@
+"""Tests for relaying JSON-RPC messages to the remote app without dispatching them."""
+
+import typing as t
+from collections.abc import AsyncGenerator
+from contextlib import AsyncExitStack, asynccontextmanager
+
+import anyio
+import pytest
+from mcp import types
+from mcp.client.session import ClientSession
+from mcp.server import Server
+from mcp.shared.exceptions import McpError
+from mcp.shared.memory import (
+    create_client_server_memory_streams,
+    create_connected_server_and_client_session,
+)
+from pydantic import AnyUrl
+
+from mcp_proxy.cache import TTLCache
+from mcp_proxy.deadlines import Deadlines
+from mcp_proxy.metrics import ProxyMetrics
+from mcp_proxy.proxy_server import ProxyOptions
+from mcp_proxy.raw_proxy import create_raw_proxy_server
+
+
+def _create_server(calls: list[str]) -> Server[object]:
+    server: Server[object] = Server("raw-server")
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        calls.append("tools/list")
+        return [types.Tool(name="echo", inputSchema={"type": "object"})]
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(name: str, arguments: dict[str, t.Any]) -> list[types.TextContent]:
+        calls.append(name)
+        session = server.request_context.session
+        if name == "progress":
+            meta = server.request_context.meta
+            assert meta is not None
+            assert meta.progressToken is not None
+            await session.send_progress_notification(meta.progressToken, 0.5, 1.0)
+        elif name == "change":
+            await session.send_tool_list_changed()
+        else:
+            try:
+                await anyio.sleep(arguments.get("delay", 0))
+            except anyio.get_cancelled_exc_class():
+                calls.append(f"{name} cancelled")
+                raise
+        return [types.TextContent(type="text", text=str(arguments.get("text")))]
+
+    @server.list_resources()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Resource]:
+        return []
+
+    @server.subscribe_resource()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(uri: AnyUrl) -> None:
+        calls.append(f"subscribe {uri}")
+
+    @server.unsubscribe_resource()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(uri: AnyUrl) -> None:
+        calls.append(f"unsubscribe {uri}")
+
+    return server
+
+
+async def _drain(session: ClientSession, notifications: list[t.Any]) -> None:
+    async for message in session.incoming_messages:
+        if isinstance(message, types.ServerNotification):
+            notifications.append(message.root)  # noqa: PERF401
+
+
+@asynccontextmanager
+async def _clients(
+    count: int,
+    calls: list[str],
+    options: ProxyOptions | None = None,
+) -> AsyncGenerator[list[tuple[ClientSession, list[t.Any]]], None]:
+    server = _create_server(calls)
+    async with (
+        create_client_server_memory_streams() as (client_streams, server_streams),
+        anyio.create_task_group() as tg,
+        AsyncExitStack() as stack,
+    ):
+        tg.start_soon(lambda: server.run(*server_streams, server.create_initialization_options()))
+        proxy = await create_raw_proxy_server(*client_streams, options)
+        tg.start_soon(proxy.handle_remote_messages)
+        clients: list[tuple[ClientSession, list[t.Any]]] = []
+        for _ in range(count):
+            session = await stack.enter_async_context(
+                create_connected_server_and_client_session(proxy),
+            )
+            clients.append((session, []))
+            tg.start_soon(_drain, *clients[-1])
+        yield clients
+        await stack.aclose()
+        tg.cancel_scope.cancel()
+
+
+async def test_requests_of_sessions_sharing_the_server() -> None:
+    """Requests of sessions using the same IDs are answered to the session that sent them."""
+    async with _clients(2, []) as [(first, _), (second, _)]:
+        results: dict[str, types.CallToolResult] = {}
+
+        async def _call(session: ClientSession, text: str, delay: float) -> None:
+            results[text] = await session.call_tool("echo", {"text": text, "delay": delay})
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(_call, first, "first", 0.05)
+            tg.start_soon(_call, second, "second", 0)
+
+        assert results["first"].content == [types.TextContent(type="text", text="first")]
+        assert results["second"].content == [types.TextContent(type="text", text="second")]
+
+
+async def test_progress_is_relayed_with_the_token_of_the_session() -> None:
+    """Progress of a request reaches the session that sent it, with its own token."""
+    async with _clients(2, []) as [(caller, notifications), (_, others)]:
+        await caller.send_request(
+            types.ClientRequest(
+                types.CallToolRequest(
+                    method="tools/call",
+                    params=types.CallToolRequestParams.model_validate(
+                        {"name": "progress", "_meta": {"progressToken": 7}},
+                    ),
+                ),
+            ),
+            types.CallToolResult,
+        )
+        with anyio.fail_after(5):
+            while not notifications:  # noqa: ASYNC110
+                await anyio.sleep(1e-3)
+
+        progress = notifications[0]
+        assert isinstance(progress, types.ProgressNotification)
+        assert (progress.params.progressToken, progress.params.progress) == (7, 0.5)
+        assert not others
+
+
+async def test_list_cache_is_invalidated_by_notification() -> None:
+    """Lists are answered from the cache until the remote app reports a change."""
+    calls: list[str] = []
+    list_cache = TTLCache[type, types.ServerResult]()
+    async with _clients(1, calls, ProxyOptions(list_cache=list_cache)) as [(session, _)]:
+        for _ in range(2):
+            result = await session.list_tools()
+            assert [tool.name for tool in result.tools] == ["echo"]
+        assert calls == ["tools/list"]
+
+        await session.call_tool("change", {})
+        with anyio.fail_after(5):
+            while list_cache.invalidations == 0:  # noqa: ASYNC110
+                await anyio.sleep(1e-3)
+
+        await session.list_tools()
+        assert calls == ["tools/list", "change", "tools/list"]
+
+
+async def test_subscriptions_are_counted() -> None:
+    """The remote app is subscribed to once, until the last subscriber unsubscribes."""
+    calls: list[str] = []
+    async with _clients(2, calls) as [(first, _), (second, _)]:
+        await first.subscribe_resource(AnyUrl("file:///a"))
+        await second.subscribe_resource(AnyUrl("file:///a"))
+        await first.unsubscribe_resource(AnyUrl("file:///a"))
+        assert calls == ["subscribe file:///a"]
+
+        await second.unsubscribe_resource(AnyUrl("file:///a"))
+        assert calls == ["subscribe file:///a", "unsubscribe file:///a"]
+
+
+async def test_request_past_its_deadline_fails() -> None:
+    """A request not answered before its deadline fails and is cancelled upstream."""
+    calls: list[str] = []
+    metrics = ProxyMetrics()
+    options = ProxyOptions(metrics=metrics, deadlines=Deadlines(tools={"echo": 0.05}))
+    async with _clients(1, calls, options) as [(session, _)]:
+        with pytest.raises(McpError, match=r"Timed out after 0\.05s waiting for tools/call echo"):
+            await session.call_tool("echo", {"delay": 10})
+
+        labels = metrics.labels("tools/call", "echo")
+        assert metrics.timed_out[labels] == 1
+        assert metrics.in_flight[labels] == 0
+        with anyio.fail_after(5):
+            while "echo cancelled" not in calls:  # noqa: ASYNC110
+                await anyio.sleep(1e-3)
+
+
+async def test_client_disconnecting_mid_call_leaves_the_remote_app_serving() -> None:
+    """A client leaving during a call does not cancel it, which could end the remote session."""
+    calls: list[str] = []
+    server = _create_server(calls)
+    async with (
+        create_client_server_memory_streams() as (client_streams, server_streams),
+        anyio.create_task_group() as tg,
+    ):
+        tg.start_soon(lambda: server.run(*server_streams, server.create_initialization_options()))
+        proxy = await create_raw_proxy_server(*client_streams)
+        tg.start_soon(proxy.handle_remote_messages)
+        async with (
+            create_connected_server_and_client_session(proxy) as first,
+            anyio.create_task_group() as first_tg,
+        ):
+            first_tg.start_soon(first.call_tool, "echo", {"delay": 0.2})
+            with anyio.fail_after(5):
+                while "echo" not in calls:  # noqa: ASYNC110
+                    await anyio.sleep(1e-3)
+            first_tg.cancel_scope.cancel()
+
+        async with create_connected_server_and_client_session(proxy) as second:
+            with anyio.fail_after(5):
+                result = await second.call_tool("echo", {"text": "still serving"})
+            assert t.cast("types.TextContent", result.content[0]).text == "still serving"
+        assert "echo cancelled" not in calls
+        tg.cancel_scope.cancel()
+
+
+async def test_session_stream_is_closed_when_client_leaves() -> None:
+    """The stream to a session is closed when the session ends, ending its transport."""
+    server = _create_server([])
+    async with (
+        create_client_server_memory_streams() as (client_streams, server_streams),
+        create_client_server_memory_streams() as (local_client, local_server),
+        anyio.create_task_group() as tg,
+    ):
+        tg.start_soon(lambda: server.run(*server_streams, server.create_initialization_options()))
+        proxy = await create_raw_proxy_server(*client_streams)
+        tg.start_soon(proxy.handle_remote_messages)
+        tg.start_soon(lambda: proxy.run(*local_server, proxy.create_initialization_options()))
+        client_read, client_write = local_client
+        await client_write.aclose()
+
+        with anyio.fail_after(5):
+            assert [message async for message in client_read] == []
+        tg.cancel_scope.cancel()
+
+
+async def test_slow_session_is_closed_rather_than_losing_a_response(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A response the client does not read in time closes its session instead of being dropped."""
+    monkeypatch.setattr("mcp_proxy.raw_proxy.RELAY_TIMEOUT", 0.05)
+    server = _create_server([])
+    async with (
+        create_client_server_memory_streams() as (client_streams, server_streams),
+        create_client_server_memory_streams() as (local_client, local_server),
+        anyio.create_task_group() as tg,
+    ):
+        tg.start_soon(lambda: server.run(*server_streams, server.create_initialization_options()))
+        proxy = await create_raw_proxy_server(*client_streams)
+        tg.start_soon(proxy.handle_remote_messages)
+        tg.start_soon(lambda: proxy.run(*local_server, proxy.create_initialization_options()))
+        client_read, client_write = local_client
+        for request_id in (1, 2):
+            await client_write.send(
+                types.JSONRPCMessage(
+                    types.JSONRPCRequest(jsonrpc="2.0", id=request_id, method="tools/list"),
+                ),
+            )
+        # The first response fills the stream, and the second one cannot be sent
+        await anyio.sleep(0.2)
+
+        with anyio.fail_after(5):
+            messages = [message async for message in client_read]
+        responses = [t.cast("types.JSONRPCMessage", message).root for message in messages]
+        assert [t.cast("types.JSONRPCResponse", response).id for response in responses] == [1]
+        tg.cancel_scope.cancel()
@@ -0,0 +1,217 @@
+"""Tests for relaying the messages of the remote app to the clients of the proxy."""
+
+import typing as t
+from collections.abc import AsyncGenerator
+from contextlib import AsyncExitStack, asynccontextmanager
+
+import anyio
+from mcp import types
+from mcp.client.session import ClientSession
+from mcp.server import Server
+from mcp.shared.context import RequestContext
+from mcp.shared.exceptions import McpError
+from mcp.shared.memory import create_connected_server_and_client_session
+from pydantic import AnyUrl
+
+from mcp_proxy.proxy_server import create_proxy_server
+
+FLAKY_URI = "file:///flaky"
+
+
+class Client:
+    """A session to the proxy recording the notifications it receives."""
+
+    def __init__(self, session: ClientSession) -> None:
+        """Wrap a connected session."""
+        self.session = session
+        self.notifications: list[t.Any] = []
+
+    async def receive(self) -> None:
+        """Record notifications until the session is closed."""
+        async for message in self.session.incoming_messages:
+            if isinstance(message, types.ServerNotification):
+                self.notifications.append(message.root)
+
+    async def wait_for(self, notification_type: type) -> t.Any:  # noqa: ANN401
+        """Return the first notification of a type, waiting for it."""
+        with anyio.fail_after(5):
+            while True:
+                for notification in self.notifications:
+                    if isinstance(notification, notification_type):
+                        return notification
+                await anyio.sleep(1e-3)
+
+
+async def _create_message(
+    context: RequestContext[ClientSession, t.Any],  # noqa: ARG001
+    params: types.CreateMessageRequestParams,
+) -> types.CreateMessageResult:
+    return types.CreateMessageResult(
+        role="assistant",
+        content=types.TextContent(type="text", text=f"sampled {params.maxTokens}"),
+        model="test",
+    )
+
+
+def _create_server(subscriptions: list[tuple[str, str]]) -> Server[object]:
+    server: Server[object] = Server("relay-server")
+
+    @server.list_resources()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Resource]:
+        return []
+
+    @server.subscribe_resource()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(uri: AnyUrl) -> None:
+        subscriptions.append(("subscribe", str(uri)))
+        # The first subscription to a flaky resource fails after a while
+        if str(uri) == FLAKY_URI and subscriptions.count(("subscribe", FLAKY_URI)) == 1:
+            await anyio.sleep(0.1)
+            raise ValueError(FLAKY_URI)
+
+    @server.unsubscribe_resource()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(uri: AnyUrl) -> None:
+        subscriptions.append(("unsubscribe", str(uri)))
+
+    @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _() -> list[types.Tool]:
+        return []
+
+    @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def _(name: str, arguments: dict[str, t.Any]) -> list[types.TextContent]:
+        session = server.request_context.session
+        if name == "update":
+            await session.send_resource_updated(AnyUrl(arguments["uri"]))
+            await session.send_tool_list_changed()
+        elif name == "progress":
+            meta = server.request_context.meta
+            assert meta is not None
+            assert meta.progressToken is not None
+            await session.send_progress_notification(meta.progressToken, 0.5, 1.0)
+        elif name == "sample":
+            result = await session.create_message([], max_tokens=10)
+            return [t.cast("types.TextContent", result.content)]
+        return []
+
+    return server
+
+
+@asynccontextmanager
+async def _clients(
+    count: int,
+    subscriptions: list[tuple[str, str]] | None = None,
+) -> AsyncGenerator[list[Client], None]:
+    server = _create_server([] if subscriptions is None else subscriptions)
+    async with (
+        create_connected_server_and_client_session(server) as remote,
+        anyio.create_task_group() as tg,
+        AsyncExitStack() as stack,
+    ):
+        proxy = await create_proxy_server(remote)
+        tg.start_soon(proxy.handle_remote_messages)
+        clients = []
+        for _ in range(count):
+            session = await stack.enter_async_context(
+                create_connected_server_and_client_session(
+                    proxy,
+                    sampling_callback=_create_message,
+                ),
+            )
+            clients.append(Client(session))
+            tg.start_soon(clients[-1].receive)
+        yield clients
+        await stack.aclose()
+        tg.cancel_scope.cancel()
+
+
+async def test_resource_updates_are_relayed_to_subscribers() -> None:
+    """Resource updates only reach the sessions subscribed to the resource."""
+    async with _clients(2) as (subscriber, other):
+        await subscriber.session.subscribe_resource(AnyUrl("file:///a"))
+        await other.session.call_tool("update", {"uri": "file:///a"})
+
+        updated = await subscriber.wait_for(types.ResourceUpdatedNotification)
+        assert str(updated.params.uri) == "file:///a"
+        # List changes are sent to every session
+        await other.wait_for(types.ToolListChangedNotification)
+        assert not any(
+            isinstance(notification, types.ResourceUpdatedNotification)
+            for notification in other.notifications
+        )
+
+
+async def test_subscriptions_are_counted() -> None:
+    """The remote app is subscribed to once, until the last subscriber unsubscribes."""
+    subscriptions: list[tuple[str, str]] = []
+    async with _clients(2, subscriptions) as (first, second):
+        await first.session.subscribe_resource(AnyUrl("file:///a"))
+        await second.session.subscribe_resource(AnyUrl("file:///a"))
+        await first.session.unsubscribe_resource(AnyUrl("file:///a"))
+        assert subscriptions == [("subscribe", "file:///a")]
+
+        await first.session.call_tool("update", {"uri": "file:///a"})
+        await second.wait_for(types.ResourceUpdatedNotification)
+
+        await second.session.unsubscribe_resource(AnyUrl("file:///a"))
+        assert subscriptions == [("subscribe", "file:///a"), ("unsubscribe", "file:///a")]
+
+
+async def test_subscribers_wait_for_the_subscription_in_progress() -> None:
+    """A subscriber waits for the subscription in progress, and retries it when it fails."""
+    subscriptions: list[tuple[str, str]] = []
+    errors: list[McpError] = []
+    async with _clients(2, subscriptions) as (first, second):
+
+        async def _subscribe_first() -> None:
+            try:
+                await first.session.subscribe_resource(AnyUrl(FLAKY_URI))
+            except McpError as e:
+                errors.append(e)
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(_subscribe_first)
+            await anyio.sleep(0.02)
+            await second.session.subscribe_resource(AnyUrl(FLAKY_URI))
+            # The second subscriber only succeeds once subscribed upstream itself
+            assert subscriptions == [("subscribe", FLAKY_URI), ("subscribe", FLAKY_URI)]
+
+        assert len(errors) == 1
+        await first.session.call_tool("update", {"uri": FLAKY_URI})
+        await second.wait_for(types.ResourceUpdatedNotification)
+
+        await second.session.unsubscribe_resource(AnyUrl(FLAKY_URI))
+        assert subscriptions[-1] == ("unsubscribe", FLAKY_URI)
+
+
+async def test_subscriptions_end_with_the_session() -> None:
+    """The remote app is unsubscribed from when the last subscriber disconnects."""
+    subscriptions: list[tuple[str, str]] = []
+    async with _clients(1, subscriptions) as (client,):
+        await client.session.subscribe_resource(AnyUrl("file:///a"))
+    assert subscriptions == [("subscribe", "file:///a"), ("unsubscribe", "file:///a")]
+
+
+async def test_progress_is_relayed_with_the_token_of_the_client() -> None:
+    """Progress of a tool call reaches the session that called it, with its own token."""
+    async with _clients(2) as (caller, other):
+        await caller.session.send_request(
+            types.ClientRequest(
+                types.CallToolRequest(
+                    method="tools/call",
+                    params=types.CallToolRequestParams.model_validate(
+                        {"name": "progress", "_meta": {"progressToken": 7}},
+                    ),
+                ),
+            ),
+            types.CallToolResult,
+        )
+
+        progress = await caller.wait_for(types.ProgressNotification)
+        assert (progress.params.progressToken, progress.params.progress) == (7, 0.5)
+        assert not other.notifications
+
+
+async def test_sampling_is_relayed_to_the_client() -> None:
+    """Sampling requests of the remote app are answered by the client."""
+    async with _clients(1) as (client,):
+        result = await client.session.call_tool("sample", {})
+        assert result.content == [types.TextContent(type="text", text="sampled 10")]
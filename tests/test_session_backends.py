@@ -0,0 +1,140 @@
+"""Tests for the backends dedicated to sessions."""
+
+import typing as t
+from collections.abc import AsyncGenerator
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+
+import anyio
+import pytest
+from mcp import types
+from mcp.client.session import ClientSession
+from mcp.server import Server
+from mcp.shared.memory import create_connected_server_and_client_session
+
+from mcp_proxy.cache import ToolResultCache
+from mcp_proxy.metrics import ProxyMetrics
+from mcp_proxy.proxy_server import ProxyOptions
+from mcp_proxy.session_backends import BackendLimitError, SessionBackends, SessionBackendSettings
+
+
+class Backends:
+    """Factory for in-memory backends whose tool returns the index of the backend."""
+
+    def __init__(self) -> None:
+        """Create an empty factory."""
+        self.count = 0
+
+    def _create_server(self, index: int) -> Server[object]:
+        server: Server[object] = Server("session-server")
+
+        @server.list_tools()  # type: ignore[no-untyped-call,untyped-decorator]
+        async def _() -> list[types.Tool]:
+            return []
+
+        @server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+        async def _(_: str, __: dict[str, t.Any]) -> list[types.TextContent]:
+            return [types.TextContent(type="text", text=str(index))]
+
+        return server
+
+    @asynccontextmanager
+    async def _session(self) -> AsyncGenerator[ClientSession, None]:
+        self.count += 1
+        async with create_connected_server_and_client_session(
+            self._create_server(self.count),
+        ) as session:
+            yield session
+
+    def __call__(self) -> AbstractAsyncContextManager[ClientSession]:
+        """Open a session to a new backend."""
+        return self._session()
+
+
+async def _call_tool(server: Server[object]) -> str:
+    result = await server.request_handlers[types.CallToolRequest](
+        types.CallToolRequest(
+            method="tools/call",
+            params=types.CallToolRequestParams(name="index", arguments={}),
+        ),
+    )
+    return result.root.content[0].text  # type: ignore[union-attr]
+
+
+async def test_sessions_get_dedicated_backends() -> None:
+    """Concurrent sessions are served by distinct backends, up to the limit."""
+    backends = Backends()
+    session_backends = SessionBackends(
+        backends,
+        SessionBackendSettings(max_backends=2, warm_size=1),
+    )
+    indexes: list[str] = []
+    release = anyio.Event()
+
+    async def _session(server: Server[object]) -> None:
+        indexes.append(await _call_tool(server))
+        await release.wait()
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(session_backends.run)
+        while session_backends.warm == 0:  # noqa: ASYNC110
+            await anyio.sleep(1e-3)
+
+        tg.start_soon(session_backends.serve, _session)
+        tg.start_soon(session_backends.serve, _session)
+        while len(indexes) < 2:  # noqa: ASYNC110, PLR2004
+            await anyio.sleep(1e-3)
+        assert sorted(indexes) == ["1", "2"]
+        assert session_backends.active == 2  # noqa: PLR2004
+
+        with pytest.raises(BackendLimitError):
+            await session_backends.serve(_session)
+
+        release.set()
+        while session_backends.active:  # noqa: ASYNC110
+            await anyio.sleep(1e-3)
+        tg.cancel_scope.cancel()
+
+
+async def test_idle_sessions_are_reaped() -> None:
+    """A session without requests for the idle timeout is closed."""
+    session_backends = SessionBackends(
+        Backends(),
+        SessionBackendSettings(idle_timeout=0.05, warm_size=0),
+    )
+
+    async def _session(server: Server[object]) -> None:
+        await _call_tool(server)
+        await anyio.sleep_forever()
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(session_backends.run)
+        with anyio.fail_after(5):
+            await session_backends.serve(_session)
+        assert session_backends.stats()["reaped"] == 1
+        tg.cancel_scope.cancel()
+
+
+async def test_sessions_do_not_share_caches() -> None:
+    """Every backend caches its own results, and the counters of the caches are summed."""
+    metrics = ProxyMetrics()
+    session_backends = SessionBackends(
+        Backends(),
+        SessionBackendSettings(warm_size=0),
+        ProxyOptions(tool_cache=ToolResultCache(["index"]), metrics=metrics),
+    )
+    indexes: list[str] = []
+
+    async def _session(server: Server[object]) -> None:
+        indexes.extend([await _call_tool(server), await _call_tool(server)])
+
+    async with anyio.create_task_group() as tg:
+        await tg.start(session_backends.run)
+        with anyio.fail_after(5):
+            await session_backends.serve(_session)
+            await session_backends.serve(_session)
+        tg.cancel_scope.cancel()
+
+    assert indexes == ["1", "1", "2", "2"]
+    stats = session_backends.component_stats("tool_cache")
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+    assert "mcp_proxy_tool_cache_hits 2" in metrics.render()
@@ -0,0 +1,88 @@
+"""Tests for request coalescing."""
+
+import anyio
+import pytest
+
+from mcp_proxy.single_flight import SingleFlight
+
+
+async def test_concurrent_calls_share_result() -> None:
+    """Callers of the same key share one call and its result."""
+    single_flight = SingleFlight()
+    release = anyio.Event()
+    calls = 0
+    results: list[int] = []
+
+    async def _call() -> int:
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return calls
+
+    async def _caller() -> None:
+        results.append(await single_flight.do("key", _call))
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(3):
+            tg.start_soon(_caller)
+        while single_flight.coalesced < 2:  # noqa: PLR2004, ASYNC110
+            await anyio.sleep(1e-3)
+        release.set()
+
+    assert results == [1, 1, 1]
+    assert single_flight.stats() == {"calls": 1, "coalesced": 2, "in_flight": 0}
+
+
+async def test_concurrent_calls_share_error() -> None:
+    """The error of the shared call is raised to every caller."""
+    single_flight = SingleFlight()
+    release = anyio.Event()
+    errors: list[Exception] = []
+
+    async def _call() -> None:
+        await release.wait()
+        raise ValueError("boom")
+
+    async def _caller() -> None:
+        with pytest.raises(ValueError, match="boom") as exc_info:
+            await single_flight.do("key", _call)
+        errors.append(exc_info.value)
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(_caller)
+        tg.start_soon(_caller)
+        while single_flight.coalesced < 1:  # noqa: ASYNC110
+            await anyio.sleep(1e-3)
+        release.set()
+
+    assert len(errors) == 2  # noqa: PLR2004
+    assert single_flight.in_flight == 0
+
+
+async def test_waiting_caller_retries_when_first_caller_is_cancelled() -> None:
+    """A cancelled call is not shared, a waiting caller runs it again."""
+    single_flight = SingleFlight()
+    first_scope = anyio.CancelScope()
+    results: list[str] = []
+
+    async def _first() -> None:
+        with first_scope:
+            await single_flight.do("key", anyio.sleep_forever)
+
+    async def _result() -> str:
+        return "result"
+
+    async def _second() -> None:
+        results.append(await single_flight.do("key", _result))
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(_first)
+        while single_flight.in_flight == 0:  # noqa: ASYNC110
+            await anyio.sleep(1e-3)
+        tg.start_soon(_second)
+        while single_flight.coalesced == 0:  # noqa: ASYNC110
+            await anyio.sleep(1e-3)
+        first_scope.cancel()
+
+    assert results == ["result"]
+    assert single_flight.stats() == {"calls": 2, "coalesced": 0, "in_flight": 0}
@@ -2,15 +2,42 @@
 
 import asyncio
 import contextlib
+import gzip
+import json
 import typing as t
+from pathlib import Path
 
+import anyio
+import httpx
+import pytest
 import uvicorn
 from mcp import types
 from mcp.client.session import ClientSession
 from mcp.client.sse import sse_client
 from mcp.server import Server
+from mcp.shared.exceptions import McpError
+from mcp.shared.memory import create_connected_server_and_client_session
+from sse_starlette.sse import AppStatus
 
+from mcp_proxy.compression import ENCODINGS, Compression, negotiate
+from mcp_proxy.deferred import Deferred
+from mcp_proxy.metrics import ProxyMetrics
+from mcp_proxy.proxy_server import ProxyOptions, create_proxy_server
+from mcp_proxy.session_backends import SessionBackends
+from mcp_proxy.session_buffers import (
+    OVERFLOW_POLICIES,
+    OverflowPolicy,
+    SessionBuffers,
+    SessionBufferSettings,
+)
 from mcp_proxy.sse_server import create_starlette_app
+from mcp_proxy.workers import Worker
+
+
+@pytest.fixture(autouse=True)
+def reset_sse_app_status() -> None:
+    """Reset the SSE shutdown event, which is bound to the event loop of a previous test."""
+    AppStatus.should_exit_event = None
 
 
 class BackgroundServer(uvicorn.Server):
@@ -44,7 +71,7 @@ async def test_create_starlette_app() -> None:
     """Test basic glue code for the SSE transport and a fake MCP server."""
     mcp_server: Server[object] = Server("prompt-server")
 
-    @mcp_server.list_prompts()  # type: ignore[no-untyped-call,misc]
+    @mcp_server.list_prompts()  # type: ignore[no-untyped-call,untyped-decorator]
     async def list_prompts() -> list[types.Prompt]:
         return [types.Prompt(name="prompt1")]
 
@@ -59,3 +86,484 @@ async def test_create_starlette_app() -> None:
             response = await session.list_prompts()
             assert len(response.prompts) == 1
             assert response.prompts[0].name == "prompt1"
+
+
+async def test_metrics_endpoint() -> None:
+    """Test that requests through the SSE transport are reported at /metrics."""
+    mcp_server: Server[object] = Server("prompt-server")
+
+    @mcp_server.list_prompts()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def list_prompts() -> list[types.Prompt]:
+        return [types.Prompt(name="prompt1")]
+
+    metrics = ProxyMetrics()
+    async with create_connected_server_and_client_session(mcp_server) as remote_session:
+        proxy_server = await create_proxy_server(remote_session, ProxyOptions(metrics=metrics))
+        app = create_starlette_app(proxy_server, metrics=metrics)
+
+        config = uvicorn.Config(app, port=0, log_level="info")
+        server = BackgroundServer(config)
+        async with server.run_in_background():
+            mcp_url = f"{server.url}/sse"
+            async with sse_client(url=mcp_url) as streams, ClientSession(*streams) as session:
+                await session.initialize()
+                await session.list_prompts()
+
+                async with httpx.AsyncClient() as client:
+                    response = await client.get(f"{server.url}/metrics")
+
+    assert response.status_code == 200  # noqa: PLR2004
+    assert 'mcp_proxy_requests_total{method="prompts/list",tool=""} 1' in response.text
+    assert "mcp_proxy_sse_connections 1" in response.text
+    assert metrics.bytes_received > 0
+    assert metrics.bytes_sent > 0
+
+
+async def test_streamable_http() -> None:
+    """Test a session over the streamable HTTP transport with JSON responses."""
+    mcp_server: Server[object] = Server("prompt-server")
+
+    @mcp_server.list_prompts()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def list_prompts() -> list[types.Prompt]:
+        return [types.Prompt(name="prompt1")]
+
+    app = create_starlette_app(mcp_server)
+    initialize = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "initialize",
+        "params": {
+            "protocolVersion": types.LATEST_PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": "test", "version": "1.0"},
+        },
+    }
+
+    config = uvicorn.Config(app, port=0, log_level="info")
+    server = BackgroundServer(config)
+    async with server.run_in_background(), httpx.AsyncClient(base_url=server.url) as client:
+        response = await client.post("/mcp", json={"jsonrpc": "2.0", "id": 1, "method": "ping"})
+        assert response.status_code == 400  # noqa: PLR2004
+
+        response = await client.post("/mcp", json=initialize)
+        assert response.status_code == 200  # noqa: PLR2004
+        assert response.json()["result"]["serverInfo"]["name"] == "prompt-server"
+        headers = {"Mcp-Session-Id": response.headers["Mcp-Session-Id"]}
+
+        response = await client.post(
+            "/mcp",
+            json={"jsonrpc": "2.0", "method": "notifications/initialized"},
+            headers=headers,
+        )
+        assert response.status_code == 202  # noqa: PLR2004
+
+        response = await client.post(
+            "/mcp",
+            json=[
+                {"jsonrpc": "2.0", "id": 2, "method": "prompts/list"},
+                {"jsonrpc": "2.0", "id": 3, "method": "ping"},
+            ],
+            headers=headers,
+        )
+        assert response.status_code == 200  # noqa: PLR2004
+        results = {message["id"]: message["result"] for message in response.json()}
+        assert results == {2: {"prompts": [{"name": "prompt1"}]}, 3: {}}
+
+        response = await client.delete("/mcp", headers=headers)
+        assert response.status_code == 200  # noqa: PLR2004
+        while (  # noqa: ASYNC110
+            response := await client.post(
+                "/mcp",
+                json={"jsonrpc": "2.0", "id": 4, "method": "ping"},
+                headers=headers,
+            )
+        ).status_code != 404:  # noqa: PLR2004
+            await asyncio.sleep(1e-3)
+
+
+async def test_streamable_http_event_stream() -> None:
+    """Test that a client accepting only an event stream gets its response as SSE."""
+    mcp_server: Server[object] = Server("prompt-server")
+    app = create_starlette_app(mcp_server)
+
+    config = uvicorn.Config(app, port=0, log_level="info")
+    server = BackgroundServer(config)
+    async with server.run_in_background(), httpx.AsyncClient(base_url=server.url) as client:
+        response = await client.post(
+            "/mcp",
+            json={
+                "jsonrpc": "2.0",
+                "id": "init",
+                "method": "initialize",
+                "params": {
+                    "protocolVersion": types.LATEST_PROTOCOL_VERSION,
+                    "capabilities": {},
+                    "clientInfo": {"name": "test", "version": "1.0"},
+                },
+            },
+            headers={"Accept": "text/event-stream"},
+        )
+        assert response.status_code == 200  # noqa: PLR2004
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert '"id":"init"' in response.text
+        assert "event: message" in response.text
+
+
+async def test_streamable_http_rejects_server_requests_without_a_stream() -> None:
+    """Test that the requests of the server to a client answered with JSON fail right away."""
+    mcp_server: Server[object] = Server("tool-server")
+
+    @mcp_server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def call_tool(_: str, __: dict[str, t.Any]) -> list[types.TextContent]:
+        try:
+            await mcp_server.request_context.session.list_roots()
+        except McpError as e:
+            return [types.TextContent(type="text", text=e.error.message)]
+        return [types.TextContent(type="text", text="answered")]
+
+    app = create_starlette_app(mcp_server)
+    initialize = {
+        "jsonrpc": "2.0",
+        "id": "init",
+        "method": "initialize",
+        "params": {
+            "protocolVersion": types.LATEST_PROTOCOL_VERSION,
+            "capabilities": {"roots": {}},
+            "clientInfo": {"name": "test", "version": "1.0"},
+        },
+    }
+
+    config = uvicorn.Config(app, port=0, log_level="info")
+    server = BackgroundServer(config)
+    async with server.run_in_background(), httpx.AsyncClient(base_url=server.url) as client:
+        response = await client.post("/mcp", json=initialize)
+        headers = {"Mcp-Session-Id": response.headers["Mcp-Session-Id"]}
+        initialized = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+        await client.post("/mcp", json=initialized, headers=headers)
+        call = {
+            "jsonrpc": "2.0",
+            "id": 2,
+            "method": "tools/call",
+            "params": {"name": "roots", "arguments": {}},
+        }
+        with anyio.fail_after(5):
+            response = await client.post("/mcp", json=call, headers=headers)
+
+    text = response.json()["result"]["content"][0]["text"]
+    assert "Cannot send a roots/list request to a client answered with JSON" in text
+
+
+async def test_streamable_http_client_drops_mid_stream() -> None:
+    """Test that a client disconnecting from its event stream leaves the transport running."""
+    mcp_server: Server[object] = Server("tool-server")
+    release = anyio.Event()
+
+    @mcp_server.call_tool()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def call_tool(name: str, _: dict[str, t.Any]) -> list[types.TextContent]:
+        session = mcp_server.request_context.session
+        await session.send_log_message("info", "started")
+        await release.wait()
+        await session.send_log_message("info", "finished")
+        return [types.TextContent(type="text", text=name)]
+
+    app = create_starlette_app(mcp_server)
+    initialize = {
+        "jsonrpc": "2.0",
+        "id": "init",
+        "method": "initialize",
+        "params": {
+            "protocolVersion": types.LATEST_PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": "test", "version": "1.0"},
+        },
+    }
+
+    config = uvicorn.Config(app, port=0, log_level="info")
+    server = BackgroundServer(config)
+    async with server.run_in_background(), httpx.AsyncClient(base_url=server.url) as client:
+        response = await client.post("/mcp", json=initialize)
+        headers = {
+            "Mcp-Session-Id": response.headers["Mcp-Session-Id"],
+            "Accept": "text/event-stream",
+        }
+        initialized = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+        await client.post("/mcp", json=initialized, headers=headers)
+        call = {
+            "jsonrpc": "2.0",
+            "id": 2,
+            "method": "tools/call",
+            "params": {"name": "slow", "arguments": {}},
+        }
+        async with client.stream("POST", "/mcp", json=call, headers=headers) as stream:
+            async for line in stream.aiter_lines():
+                if "started" in line:
+                    break
+
+        # The notification and the response are sent after the client is gone
+        await asyncio.sleep(0.2)
+        release.set()
+        await asyncio.sleep(0.2)
+
+        response = await client.post("/mcp", json=initialize)
+        assert response.status_code == 200  # noqa: PLR2004
+        assert '"id":"init"' in response.text
+
+
+async def test_deferred_server() -> None:
+    """Test that sessions opened while the server starts wait for it to be ready."""
+    mcp_server: Server[object] = Server("prompt-server")
+
+    @mcp_server.list_prompts()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def list_prompts() -> list[types.Prompt]:
+        return [types.Prompt(name="prompt1")]
+
+    deferred = Deferred[Server[object] | SessionBackends]()
+    app = create_starlette_app(deferred)
+
+    config = uvicorn.Config(app, port=0, log_level="info")
+    server = BackgroundServer(config)
+    async with server.run_in_background(), httpx.AsyncClient() as client:
+        response = await client.get(f"{server.url}/ready")
+        assert response.status_code == 503  # noqa: PLR2004
+
+        async def _list_prompts() -> list[types.Prompt]:
+            async with (
+                sse_client(url=f"{server.url}/sse") as streams,
+                ClientSession(*streams) as session,
+            ):
+                await session.initialize()
+                return (await session.list_prompts()).prompts
+
+        task = asyncio.create_task(_list_prompts())
+        await asyncio.sleep(0.1)
+        assert not task.done()
+
+        deferred.set(mcp_server)
+        assert [prompt.name for prompt in await task] == ["prompt1"]
+        response = await client.get(f"{server.url}/ready")
+        assert response.status_code == 200  # noqa: PLR2004
+
+
+async def test_sessions_are_served_by_their_worker(tmp_path: Path) -> None:
+    """Test that requests of a session arriving on another worker are forwarded to its own."""
+    mcp_server: Server[object] = Server("prompt-server")
+    workers = [Worker(index, 2, "127.0.0.1", 0, str(tmp_path)) for index in range(2)]
+    servers = [
+        BackgroundServer(
+            uvicorn.Config(
+                create_starlette_app(mcp_server, worker=worker),
+                uds=str(worker.socket_path(worker.index)),
+                log_level="info",
+            ),
+        )
+        for worker in workers
+    ]
+    clients = [
+        httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=str(worker.socket_path(worker.index))),
+            base_url="http://worker",
+        )
+        for worker in workers
+    ]
+    initialize = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "initialize",
+        "params": {
+            "protocolVersion": types.LATEST_PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": "test", "version": "1.0"},
+        },
+    }
+
+    async with (
+        servers[0].run_in_background(),
+        servers[1].run_in_background(),
+        clients[0],
+        clients[1],
+    ):
+        response = await clients[1].post("/mcp", json=initialize)
+        session_id = response.headers["Mcp-Session-Id"]
+        assert session_id.startswith("1-")
+
+        response = await clients[0].post(
+            "/mcp",
+            json={"jsonrpc": "2.0", "method": "notifications/initialized"},
+            headers={"Mcp-Session-Id": session_id},
+        )
+        assert response.status_code == 202  # noqa: PLR2004
+        response = await clients[0].post(
+            "/mcp",
+            json={"jsonrpc": "2.0", "id": 2, "method": "ping"},
+            headers={"Mcp-Session-Id": session_id},
+        )
+        assert response.status_code == 200  # noqa: PLR2004
+        assert response.json() == {"jsonrpc": "2.0", "id": 2, "result": {}}
+
+        async with clients[0].stream("GET", "/sse") as stream:
+            endpoint = await anext(
+                line async for line in stream.aiter_lines() if line.startswith("data:")
+            )
+        assert endpoint.startswith("data: /messages/0/")
+
+        response = await clients[0].post(
+            "/mcp",
+            json={"jsonrpc": "2.0", "id": 3, "method": "ping"},
+            headers={"Mcp-Session-Id": "5-unknown"},
+        )
+        assert response.status_code == 404  # noqa: PLR2004
+
+
+async def test_compressed_event_stream() -> None:
+    """Test that SSE events are compressed and flushed as they are sent."""
+    mcp_server: Server[object] = Server("prompt-server")
+
+    @mcp_server.list_prompts()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def list_prompts() -> list[types.Prompt]:
+        return [types.Prompt(name=f"prompt{i}", description="x" * 200) for i in range(50)]
+
+    compression = Compression()
+    app = create_starlette_app(mcp_server, compression=compression)
+
+    config = uvicorn.Config(app, port=0, log_level="info")
+    server = BackgroundServer(config)
+    # The client accepts gzip, and only gets its responses if every event is flushed
+    async with (
+        server.run_in_background(),
+        sse_client(url=f"{server.url}/sse") as streams,
+        ClientSession(*streams) as session,
+    ):
+        await session.initialize()
+        assert len((await session.list_prompts()).prompts) == 50  # noqa: PLR2004
+
+    assert compression.compressed_responses == 1
+    assert compression.stats()["ratio"] < 0.5  # noqa: PLR2004
+
+
+async def test_compressed_request_body() -> None:
+    """Test that compressed request bodies are decompressed and small responses are not."""
+    mcp_server: Server[object] = Server("prompt-server")
+    compression = Compression(minimum_size=4096)
+    app = create_starlette_app(mcp_server, compression=compression)
+    initialize = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "initialize",
+        "params": {
+            "protocolVersion": types.LATEST_PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": "test", "version": "1.0"},
+        },
+    }
+
+    config = uvicorn.Config(app, port=0, log_level="info")
+    server = BackgroundServer(config)
+    async with server.run_in_background(), httpx.AsyncClient(base_url=server.url) as client:
+        response = await client.post(
+            "/mcp",
+            content=gzip.compress(json.dumps(initialize).encode()),
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+        )
+        assert response.status_code == 200  # noqa: PLR2004
+        assert response.json()["result"]["serverInfo"]["name"] == "prompt-server"
+        assert "content-encoding" not in response.headers
+
+        response = await client.post(
+            "/mcp",
+            content=b"not gzip",
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+        )
+        assert response.status_code == 400  # noqa: PLR2004
+
+    assert compression.decompressed_requests == 1
+    assert compression.skipped_responses == 1
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "encoding"),
+    [
+        ("gzip, deflate", "gzip"),
+        ("deflate;q=0.5, gzip;q=0", "deflate"),
+        ("*", ENCODINGS[0]),
+        ("br", None),
+        ("", None),
+    ],
+)
+def test_negotiate(accept_encoding: str, encoding: str | None) -> None:
+    """Test the choice of the encoding of a response."""
+    assert negotiate(accept_encoding) == encoding
+
+
+async def test_session_heartbeats_and_reaping() -> None:
+    """Test that clients answering heartbeats are kept, and silent ones are closed."""
+    mcp_server: Server[object] = Server("prompt-server")
+
+    @mcp_server.list_prompts()  # type: ignore[no-untyped-call,untyped-decorator]
+    async def list_prompts() -> list[types.Prompt]:
+        return [types.Prompt(name="prompt1")]
+
+    metrics = ProxyMetrics()
+    session_buffers = SessionBuffers(
+        SessionBufferSettings(heartbeat_interval=0.05, idle_timeout=0.3),
+    )
+    app = create_starlette_app(mcp_server, metrics=metrics, session_buffers=session_buffers)
+
+    config = uvicorn.Config(app, port=0, log_level="info")
+    server = BackgroundServer(config)
+    async with server.run_in_background():
+        async with (
+            sse_client(url=f"{server.url}/sse") as streams,
+            ClientSession(*streams) as session,
+        ):
+            await session.initialize()
+            # The client answers the heartbeats, so that its session outlives the idle timeout
+            await asyncio.sleep(0.6)
+            assert len((await session.list_prompts()).prompts) == 1
+
+            async with httpx.AsyncClient() as client:
+                response = await client.get(f"{server.url}/metrics")
+            assert 'mcp_proxy_session_buffered_bytes{session="' in response.text
+            assert "mcp_proxy_session_buffers_sessions 1" in response.text
+
+        assert session_buffers.heartbeats > 0
+        assert session_buffers.reaped_sessions == 0
+
+        # A client that never answers is closed once idle
+        async with (
+            httpx.AsyncClient() as client,
+            client.stream("GET", f"{server.url}/sse") as response,
+        ):
+            with anyio.fail_after(5):
+                async for _ in response.aiter_lines():
+                    pass
+
+    assert session_buffers.reaped_sessions == 1
+
+
+@pytest.mark.parametrize("overflow", OVERFLOW_POLICIES)
+async def test_session_buffer_overflow(overflow: OverflowPolicy) -> None:
+    """Test what happens to messages for a client that stopped reading them."""
+    session_buffers = SessionBuffers(SessionBufferSettings(max_bytes=100, overflow=overflow))
+    read_stream_writer, read_stream = anyio.create_memory_object_stream[
+        types.JSONRPCMessage | Exception
+    ](0)
+    write_stream, write_stream_reader = anyio.create_memory_object_stream[types.JSONRPCMessage](0)
+    notification = types.JSONRPCMessage(
+        types.JSONRPCNotification(jsonrpc="2.0", method="notifications/message", params={}),
+    )
+
+    async with read_stream_writer, write_stream_reader:
+        async with session_buffers.open(read_stream, write_stream) as (_, buffered):
+            # The first message is held while the client does not read it
+            await buffered.send(notification)
+            assert session_buffers.stats()["buffered_bytes"] > 0
+            with anyio.move_on_after(0.1) as scope:
+                await buffered.send(notification)
+            if overflow == "block":
+                assert scope.cancelled_caught
+                await write_stream_reader.receive()
+                await buffered.send(notification)
+        assert session_buffers.stats()["sessions"] == 0
+
+    assert session_buffers.dropped_notifications == (overflow == "drop")
+    assert session_buffers.overflow_disconnects == (overflow == "disconnect")